@@ -92,7 +92,16 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'cache_table',
-    }
+    },
+    # The message store sees every message, so it gets its own bounded in-process cache rather than the database
+    # cache, which would cull other entries to make room for them
+    'slack-messages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'slack-messages',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SLACK_MESSAGE_STORE_SIZE', '10000')),
+        },
+    },
 }
 
 REDIS_URL = os.environ.get('REDIS_URL', None)
@@ -135,6 +144,23 @@ STATIC_URL = '/static/'
 
 SLACK_SIGNING_SECRET = os.environ.get('SLACK_SIGNING_SECRET', None)
 SLACK_ACCESS_TOKEN = os.environ.get('SLACK_ACCESS_TOKEN', None)
+SLACK_API_POOL_CONNECTIONS = int(os.environ.get('SLACK_API_POOL_CONNECTIONS', '4'))
+SLACK_API_POOL_SIZE = int(os.environ.get('SLACK_API_POOL_SIZE', '10'))
+SLACK_API_CONNECT_TIMEOUT = float(os.environ.get('SLACK_API_CONNECT_TIMEOUT', '3.05'))
+SLACK_API_READ_TIMEOUT = float(os.environ.get('SLACK_API_READ_TIMEOUT', '10'))
+
+# Where Events API event ids are recorded so retries and duplicate deliveries are only processed once:
+# one of 'cache', 'redis', 'database' or 'none'. The 'cache' backend uses SLACK_EVENT_DEDUP_CACHE, one of CACHES, which
+# must be able to hold every event seen within SLACK_EVENT_DEDUP_TTL: a cache that culls, like the default database
+# cache once it has 300 entries, lets duplicates through. The 'database' backend purges old events every minute.
+SLACK_EVENT_DEDUP_BACKEND = os.environ.get('SLACK_EVENT_DEDUP_BACKEND', 'cache')
+SLACK_EVENT_DEDUP_CACHE = os.environ.get('SLACK_EVENT_DEDUP_CACHE', 'default')
+SLACK_EVENT_DEDUP_TTL = int(os.environ.get('SLACK_EVENT_DEDUP_TTL', '3600'))
+
+# Text of recent messages, kept up to date from message events so reactions rarely need to call the Slack api. This
+# names one of CACHES, and should be a bounded cache that isn't shared with anything else.
+SLACK_MESSAGE_STORE_CACHE = os.environ.get('SLACK_MESSAGE_STORE_CACHE', 'slack-messages')
+SLACK_MESSAGE_STORE_TTL = int(os.environ.get('SLACK_MESSAGE_STORE_TTL', '86400'))
 
 FRISKY_NAME = os.environ.get('FRISKY_NAME', 'frisky')
 FRISKY_PREFIX = os.environ.get('FRISKY_PREFIX', '?')
@@ -144,10 +170,65 @@ FRISKY_IGNORED_CHANNELS = (
     FRISKY_LOGGING_CHANNEL,
 )
 
+# Size and time-to-live (in seconds) of the in-process Workspace, Channel and Member caches
+FRISKY_IDENTITY_CACHE_SIZE = int(os.environ.get('FRISKY_IDENTITY_CACHE_SIZE', '1024'))
+FRISKY_IDENTITY_CACHE_TTL = float(os.environ.get('FRISKY_IDENTITY_CACHE_TTL', '300'))
+
+# Size (in labels) and time-to-live (in seconds) of the in-process cache of Learn ids used to pick random learns. Learns
+# added by other processes are picked up within LEARN_ID_REFRESH_INTERVAL seconds, and deleted ones as soon as they are
+# picked. Learns relabelled by other processes can take until the ids expire to be picked under their new label.
+LEARN_ID_CACHE_SIZE = int(os.environ.get('LEARN_ID_CACHE_SIZE', '256'))
+LEARN_ID_CACHE_TTL = float(os.environ.get('LEARN_ID_CACHE_TTL', '300'))
+LEARN_ID_REFRESH_INTERVAL = float(os.environ.get('LEARN_ID_REFRESH_INTERVAL', '5'))
+
+# Size and time-to-live (in seconds) of the in-process cache of Markov models, and how many new learns a model takes
+# in before it is saved again
+MARKOV_CACHE_SIZE = int(os.environ.get('MARKOV_CACHE_SIZE', '64'))
+MARKOV_CACHE_TTL = float(os.environ.get('MARKOV_CACHE_TTL', '3600'))
+MARKOV_SAVE_INTERVAL = int(os.environ.get('MARKOV_SAVE_INTERVAL', '25'))
+
+# The most learns returned by a single ?learn_search, and whether a search that matches no whole words or word prefixes
+# falls back to matching substrings, which scans every learn
+LEARN_SEARCH_LIMIT = int(os.environ.get('LEARN_SEARCH_LIMIT', '20'))
+LEARN_SEARCH_SUBSTRING_FALLBACK = os.environ.get('LEARN_SEARCH_SUBSTRING_FALLBACK', '0') == '1'
+
+# How stale Workspace, Channel and Member rows are refreshed from the api: 'sync' blocks the event until the refresh
+# completes, while 'thread' and 'celery' serve the stale row and refresh it in the background
+FRISKY_STALE_REFRESH_MODE = os.environ.get('FRISKY_STALE_REFRESH_MODE', 'sync')
+FRISKY_STALE_REFRESH_WORKERS = int(os.environ.get('FRISKY_STALE_REFRESH_WORKERS', '2'))
+FRISKY_STALE_REFRESH_LOCK_TIMEOUT = int(os.environ.get('FRISKY_STALE_REFRESH_LOCK_TIMEOUT', '300'))
+
 JWT_SECRET = os.environ.get('JWT_SECRET', 'local_jwt_secret')
 
 ENABLE_CELERY_QUEUE = os.environ.get('ENABLE_CELERY_QUEUE', '0') == '1'
 
+# Process Slack events on an in-process thread pool instead of after the response in the web worker. When the pool is
+# full, events fall back to being processed after the response.
+ENABLE_WORKER_POOL = os.environ.get('ENABLE_WORKER_POOL', '0') == '1'
+WORKER_POOL_SIZE = int(os.environ.get('WORKER_POOL_SIZE', '4'))
+WORKER_POOL_QUEUE_DEPTH = int(os.environ.get('WORKER_POOL_QUEUE_DEPTH', '32'))
+
+# Buffer votes in memory and write them in batches, one UPDATE per label every VOTE_BUFFER_FLUSH_INTERVAL seconds, or
+# sooner once VOTE_BUFFER_MAX_PENDING labels are waiting. Buffered votes are lost if the process is killed.
+ENABLE_VOTE_BUFFER = os.environ.get('ENABLE_VOTE_BUFFER', '0') == '1'
+VOTE_BUFFER_FLUSH_INTERVAL = float(os.environ.get('VOTE_BUFFER_FLUSH_INTERVAL', '1'))
+VOTE_BUFFER_MAX_PENDING = int(os.environ.get('VOTE_BUFFER_MAX_PENDING', '100'))
+
+# How long (in seconds) cached vote leaderboards are trusted before being reloaded from the database
+VOTE_LEADERBOARD_TTL = int(os.environ.get('VOTE_LEADERBOARD_TTL', '300'))
+
+# Stock quotes are cached per symbol for STOCK_QUOTE_CACHE_TTL seconds, and up to STOCK_QUOTE_POOL_SIZE of them are
+# fetched at once
+STOCK_QUOTE_CACHE_SIZE = int(os.environ.get('STOCK_QUOTE_CACHE_SIZE', '256'))
+STOCK_QUOTE_CACHE_TTL = float(os.environ.get('STOCK_QUOTE_CACHE_TTL', '30'))
+STOCK_QUOTE_POOL_SIZE = int(os.environ.get('STOCK_QUOTE_POOL_SIZE', '8'))
+STOCK_QUOTE_CONNECT_TIMEOUT = float(os.environ.get('STOCK_QUOTE_CONNECT_TIMEOUT', '3.05'))
+STOCK_QUOTE_READ_TIMEOUT = float(os.environ.get('STOCK_QUOTE_READ_TIMEOUT', '5'))
+
+# How long (in seconds) a stonk game leaderboard is cached for. It is also dropped whenever a player trades, joins or
+# leaves the game.
+STONKGAME_LEADERBOARD_TTL = int(os.environ.get('STONKGAME_LEADERBOARD_TTL', '60'))
+
 if 'HEROKU' in os.environ:
     import django_on_heroku
 
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_identity_caches():
+    """
+    The identity caches live for the whole process, but each test's database is rolled back, so start every test
+    with empty caches. The same goes for the in-process message store.
+    """
+    from slack.messages import get_message_store
+    from frisky.models import workspace_cache, channel_cache, member_cache
+    from learns.models import learn_id_cache, markov_cache
+    from stonkgame.quotes import quote_cache
+    for identity_cache in (workspace_cache, channel_cache, member_cache, learn_id_cache, markov_cache, quote_cache):
+        identity_cache.clear()
+    get_message_store().store.clear()
+    yield
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import threading
+from functools import lru_cache
+from typing import Awaitable, Callable, Coroutine, Set, TypeVar
+
+from asgiref.sync import sync_to_async
+
+from frisky.db import closing_db_connections
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Keep a reference to in-flight background tasks so they aren't garbage collected before they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def run_in_thread_pool(fn: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Wrap a synchronous callable (an ORM lookup, a Slack api call, a plugin) so it can be awaited without blocking the
+    event loop. Calls run concurrently on the loop's thread pool rather than being serialized onto a single thread.
+    """
+    return sync_to_async(closing_db_connections(fn), thread_sensitive=False)
+
+
+@lru_cache(maxsize=None)
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='frisky-event-loop', daemon=True).start()
+    return loop
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Error in background task', exc_info=task.exception())
+
+
+def _start_background_task(coroutine: Coroutine) -> None:
+    task = asyncio.get_running_loop().create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+
+
+def run_in_background(coroutine: Coroutine) -> None:
+    """
+    Run coroutine on a long-lived event loop of its own. The loop an async view is called from only lives as long as
+    the request when Django is served over WSGI, and would drop anything still running on it.
+    """
+    loop = get_background_loop()
+    loop.call_soon_threadsafe(_start_background_task, coroutine)
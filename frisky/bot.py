@@ -2,8 +2,13 @@ import importlib
 import inspect
 import logging
 import pkgutil
-from typing import Dict, List, Tuple, Callable
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Tuple, Callable, Iterable, Mapping, Awaitable
 
+from django.conf import settings
+
+from frisky.aio import run_in_thread_pool
 from frisky.events import MessageEvent, ReactionEvent
 from frisky.plugin import FriskyPlugin, PluginRepositoryMixin
 from frisky.responses import FriskyResponse, FriskyError
@@ -12,25 +17,25 @@ from frisky.util import quotesplit
 logger = logging.getLogger(__name__)
 
 
-class Frisky(object):
-    name: str
-    prefix: str
+class PluginRegistry(object):
+    """
+    The set of plugins loaded from one or more plugin packages, along with frozen command and emoji dispatch tables.
+    Discovering and instantiating plugins is expensive, so registries should be obtained through
+    `get_plugin_registry`, which builds each one once per process.
+    """
     __loaded_plugins: Dict[str, FriskyPlugin]
-    __message_handlers: Dict[str, List[FriskyPlugin]]
-    __reaction_handlers: Dict[str, List[FriskyPlugin]]
+    message_handlers: Mapping[str, Tuple[FriskyPlugin, ...]]
+    reaction_handlers: Mapping[str, Tuple[FriskyPlugin, ...]]
 
-    def __init__(self, name, prefix='?', ignored_channels=(), plugin_modules=('plugins',)) -> None:
+    def __init__(self, modules: Iterable[str] = ()) -> None:
         super().__init__()
-        self.name = name
-        self.prefix = prefix
         self.__loaded_plugins = dict()
-        self.__message_handlers = dict()
-        self.__reaction_handlers = dict()
-        self.ignored_channels = ignored_channels
-        if plugin_modules is not None:
-            self.load_plugins(plugin_modules)
+        self.loaded_plugins = MappingProxyType(self.__loaded_plugins)
+        self.load_plugins(modules)
+        self.message_handlers = self.__build_dispatch_table(lambda cls: cls.register_commands())
+        self.reaction_handlers = self.__build_dispatch_table(lambda cls: cls.register_emoji())
 
-    def load_plugins(self, modules) -> None:
+    def load_plugins(self, modules: Iterable[str]) -> None:
         for module in modules:
             module_iterator = pkgutil.iter_modules(importlib.import_module(module).__path__)
             for _, name, _ in module_iterator:
@@ -40,7 +45,7 @@ class Frisky(object):
                         self.__load_plugin_from_class(name, item)
         for plugin in self.__loaded_plugins.values():
             if isinstance(plugin, PluginRepositoryMixin):
-                plugin.loaded_plugins = self.__loaded_plugins
+                plugin.loaded_plugins = self.loaded_plugins
 
     def __load_plugin_from_class(self, name, cls) -> None:
         try:
@@ -49,23 +54,51 @@ class Frisky(object):
             logger.warning(f'Error instantiating plugin {cls}', exc_info=err)
             return
         self.__loaded_plugins[name] = plugin
-        for command in cls.register_commands():
-            handlers = self.__message_handlers.get(command, list())
-            handlers.append(plugin)
-            self.__message_handlers[command] = handlers
-        for reaction in cls.register_emoji():
-            handlers = self.__reaction_handlers.get(reaction, list())
-            handlers.append(plugin)
-            self.__reaction_handlers[reaction] = handlers
 
-    def get_plugins_for_command(self, command: str) -> List[FriskyPlugin]:
-        return self.__message_handlers.get(command, list())
+    def __build_dispatch_table(self, keys: Callable[[type], Iterable[str]]) -> Mapping[str, Tuple[FriskyPlugin, ...]]:
+        table: Dict[str, List[FriskyPlugin]] = dict()
+        for plugin in self.__loaded_plugins.values():
+            for key in keys(type(plugin)):
+                table.setdefault(key, list()).append(plugin)
+        return MappingProxyType({key: tuple(plugins) for key, plugins in table.items()})
+
+
+@lru_cache(maxsize=None)
+def _build_plugin_registry(modules: Tuple[str, ...]) -> PluginRegistry:
+    return PluginRegistry(modules)
+
+
+def get_plugin_registry(modules: Iterable[str] = ('plugins',)) -> PluginRegistry:
+    """
+    :param modules: the plugin packages to load plugins from
+    :return: the registry for the given plugin packages, built the first time it is requested in this process
+    """
+    return _build_plugin_registry(tuple(modules))
+
+
+class Frisky(object):
+    name: str
+    prefix: str
+    registry: PluginRegistry
+
+    def __init__(self, name, prefix='?', ignored_channels=(), plugin_modules=('plugins',)) -> None:
+        super().__init__()
+        self.name = name
+        self.prefix = prefix
+        self.ignored_channels = ignored_channels
+        if plugin_modules is not None:
+            self.registry = get_plugin_registry(plugin_modules)
+        else:
+            self.registry = PluginRegistry()
 
-    def get_generic_handlers(self) -> List[FriskyPlugin]:
-        return self.__message_handlers.get('*', list())
+    def get_plugins_for_command(self, command: str) -> Tuple[FriskyPlugin, ...]:
+        return self.registry.message_handlers.get(command, ())
 
-    def get_plugins_for_reaction(self, reaction: str) -> List[FriskyPlugin]:
-        return self.__reaction_handlers.get(reaction, list())
+    def get_generic_handlers(self) -> Tuple[FriskyPlugin, ...]:
+        return self.registry.message_handlers.get('*', ())
+
+    def get_plugins_for_reaction(self, reaction: str) -> Tuple[FriskyPlugin, ...]:
+        return self.registry.reaction_handlers.get(reaction, ())
 
     @staticmethod
     def convert_message_to_generic(message: MessageEvent) -> MessageEvent:
@@ -88,42 +121,104 @@ class Frisky(object):
                     replies.append(reply)
         return replies
 
+    def is_ignored(self, message: MessageEvent) -> bool:
+        return message.channel_name in self.ignored_channels or message.username == self.name
+
+    @staticmethod
+    def select_replies(replies: List[FriskyResponse]) -> List[FriskyResponse]:
+        """
+        :return: the successful replies, or the error messages if no plugin succeeded
+        """
+        successes = [reply for reply in replies if reply is not None and not isinstance(reply, FriskyError)]
+        if len(successes) > 0:
+            return successes
+        return [reply.message for reply in replies if isinstance(reply, FriskyError)]
+
     def handle_message(self, message: MessageEvent, reply_channel: Callable[[FriskyResponse], bool]) -> None:
-        if message.channel_name in self.ignored_channels or message.username == self.name:
+        if self.is_ignored(message):
             return
-        errors = []
-        had_success = False
-        for reply in self.handle_message_synchronously(message):
-            if isinstance(reply, FriskyError):
-                errors.append(reply.message)
-            elif reply is not None:
-                reply_channel(reply)
-                had_success = True
-        if not had_success:
-            for error in errors:
-                reply_channel(error)
+        for reply in self.select_replies(self.handle_message_synchronously(message)):
+            reply_channel(reply)
 
-    def handle_reaction(self, reaction: ReactionEvent, reply_channel: Callable[[str], bool]) -> None:
-        if reaction.message.channel_name in self.ignored_channels:
+    async def ahandle_message(self, message: MessageEvent,
+                              reply_channel: Callable[[FriskyResponse], Awaitable[bool]]) -> None:
+        """
+        The async equivalent of handle_message. Plugins are synchronous, so they are run on a thread pool.
+        """
+        if self.is_ignored(message):
             return
+        replies = await run_in_thread_pool(self.handle_message_synchronously)(message)
+        for reply in self.select_replies(replies):
+            await reply_channel(reply)
+
+    def handle_reaction_synchronously(self, reaction: ReactionEvent) -> List[FriskyResponse]:
+        replies = []
         for plugin in self.get_plugins_for_reaction(reaction.emoji):
             reply = plugin.handle_reaction(reaction)
             if reply is not None:
-                reply_channel(reply)
+                replies.append(reply)
+        return replies
+
+    def handle_reaction(self, reaction: ReactionEvent, reply_channel: Callable[[str], bool]) -> None:
+        if reaction.message.channel_name in self.ignored_channels:
+            return
+        for reply in self.handle_reaction_synchronously(reaction):
+            reply_channel(reply)
+
+    async def ahandle_reaction(self, reaction: ReactionEvent,
+                               reply_channel: Callable[[FriskyResponse], Awaitable[bool]]) -> None:
+        """
+        The async equivalent of handle_reaction. Plugins are synchronous, so they are run on a thread pool.
+        """
+        if reaction.message.channel_name in self.ignored_channels:
+            return
+        for reply in await run_in_thread_pool(self.handle_reaction_synchronously)(reaction):
+            await reply_channel(reply)
 
     def parse_message_string(self, message: str) -> Tuple[str, List[str]]:
         if message is None or len(message) == 0:
             return '', []
-        if message.startswith(self.prefix):
-            message = message[len(self.prefix):]
-        elif message.startswith(f'@{self.name}'):
-            message = message[len(self.name) + 1:]
-        else:
-            return '', []
-        message = message.strip()
-        tokens = quotesplit(message)
-        if len(tokens) == 0:
-            return '', []
-        command = tokens[0]
-        args = tokens[1:]
-        return command, args
+        command, args = _parse_message_string(self.prefix, self.name, message)
+        return command, list(args)
+
+    def is_command(self, message: str) -> bool:
+        """
+        A cheap check of whether any plugin could answer a message, made from its raw text before mentions are
+        resolved or an event is built, so that chatter which only looks like a command costs no database or api work
+        """
+        command, args = self.parse_message_string(message)
+        if command == '':
+            return False
+        if command in self.registry.message_handlers:
+            return True
+        if '<@' in command:
+            # Mentions are only turned into usernames later, so leave it to the plugins
+            return True
+        return any(plugin.handles_generic(command, args) for plugin in self.get_generic_handlers())
+
+
+@lru_cache(maxsize=1024)
+def _parse_message_string(prefix: str, name: str, message: str) -> Tuple[str, Tuple[str, ...]]:
+    if message.startswith(prefix):
+        message = message[len(prefix):]
+    elif message.startswith(f'@{name}'):
+        message = message[len(name) + 1:]
+    else:
+        return '', ()
+    message = message.strip()
+    tokens = quotesplit(message)
+    if len(tokens) == 0:
+        return '', ()
+    return tokens[0], tuple(tokens[1:])
+
+
+@lru_cache(maxsize=None)
+def _get_frisky(name: str, prefix: str, ignored_channels: Tuple[str, ...]) -> Frisky:
+    return Frisky(name=name, prefix=prefix, ignored_channels=ignored_channels)
+
+
+def get_frisky() -> Frisky:
+    """
+    :return: the process-wide Frisky instance configured from settings, sharing a single plugin registry
+    """
+    return _get_frisky(settings.FRISKY_NAME, settings.FRISKY_PREFIX, tuple(settings.FRISKY_IGNORED_CHANNELS))
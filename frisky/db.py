@@ -0,0 +1,22 @@
+from functools import wraps
+from typing import Callable, TypeVar
+
+from django.db import connection
+
+T = TypeVar('T')
+
+
+def closing_db_connections(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Close the calling thread's database connection once fn returns. Threads we run work on ourselves, rather than
+    Django's request threads, get their own database connections, which Django won't clean up for us.
+    """
+
+    @wraps(fn)
+    def call_and_close(*args, **kwargs) -> T:
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            connection.close()
+
+    return call_and_close
@@ -0,0 +1,38 @@
+import timeit
+
+from django.core.management import BaseCommand
+
+from frisky.util import quotesplit
+
+PASTE = 'so I tried "the thing you said" and it printed \'Traceback (most recent call last)\' ' \
+        'followed by a "wall of text" that goes on and on\t'
+
+MESSAGES = {
+    'command': '?learn foo "some quoted text"',
+    'pasted_1kb': '?learn paste ' + PASTE * 8,
+    'pasted_10kb': '?learn paste ' + PASTE * 80,
+    'pasted_100kb': '?learn paste ' + PASTE * 800,
+    'unquoted_100kb': '?learn paste ' + 'word ' * 20000,
+}
+
+
+class Command(BaseCommand):
+    help = 'Times frisky.util.quotesplit over short commands and long pasted messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=100,
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+        )
+
+    def handle(self, *args, **options):
+        for name, message in MESSAGES.items():
+            timings = timeit.repeat(lambda: quotesplit(message), number=options['number'], repeat=options['repeat'])
+            best = min(timings) / options['number']
+            self.stdout.write(f'{name:<20} {len(message):>8} chars {best * 1e6:>12.1f} us/split')
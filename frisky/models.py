@@ -1,44 +1,46 @@
 import logging
 import uuid
 from datetime import timedelta
+from typing import Dict, Iterable, List
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
-from slack.api.client import SlackApiClient
+from frisky.cache import IdentityCache
+from frisky.refresh import refresh_stale
+from slack.api.client import get_slack_client
 
 logger = logging.getLogger(__name__)
 
+# In-process caches of hot rows, keyed by natural key, so ingesting an event does not need to hit the database
+workspace_cache = IdentityCache(settings.FRISKY_IDENTITY_CACHE_SIZE, settings.FRISKY_IDENTITY_CACHE_TTL)
+channel_cache = IdentityCache(settings.FRISKY_IDENTITY_CACHE_SIZE, settings.FRISKY_IDENTITY_CACHE_TTL)
+member_cache = IdentityCache(settings.FRISKY_IDENTITY_CACHE_SIZE, settings.FRISKY_IDENTITY_CACHE_TTL)
+
 
 class WorkspaceManager(models.Manager):
     def get_or_fetch_by_kind_and_id(self, kind: str, team_id: str) -> 'Workspace':
         try:
-            workspace = self.get_queryset().get(kind=kind, team_id=team_id)
+            workspace = workspace_cache.get_or_load(
+                (kind, team_id),
+                lambda: self.get_queryset().get(kind=kind, team_id=team_id)
+            )
             # Check to see how long it has been since this item was updated from the api
             delta: timedelta = timezone.now() - workspace.updated
             if delta < timedelta(days=7):
                 # If we've refreshed in the last week, simply return it
                 return workspace
             # Otherwise, we're going to be fetching from the api
-            if workspace.kind == Workspace.Kind.SLACK:
-                slack_client = SlackApiClient(workspace.access_token, enable_emergency_log=False)
-                refreshed_workspace = slack_client.get_workspace(workspace.team_id)
-                if refreshed_workspace is not None:
-                    workspace.domain = refreshed_workspace.domain
-                    workspace.name = refreshed_workspace.name
-                    workspace.save()
-                else:
-                    logger.warning(f'Failed to refresh Slack Workspace {workspace.team_id}')
-                return workspace
-            else:
-                raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
+            return refresh_stale(workspace, self.refresh_from_api)
         except Workspace.DoesNotExist:
             # Workspace does not exist, we need to look up via the api
             pass
         if kind == Workspace.Kind.SLACK:
             if settings.SLACK_ACCESS_TOKEN is not None and settings.SLACK_ACCESS_TOKEN != '':
-                slack_client = SlackApiClient(settings.SLACK_ACCESS_TOKEN, enable_emergency_log=False)
+                slack_client = get_slack_client(settings.SLACK_ACCESS_TOKEN, enable_emergency_log=False)
                 fetched_workspace = slack_client.get_workspace(team_id)
                 new_workspace = self.create(
                     kind=Workspace.Kind.SLACK,
@@ -53,6 +55,20 @@ class WorkspaceManager(models.Manager):
         else:
             raise NotImplementedError(f'Fetching is not implemented for Workspace Kind {kind}')
 
+    def refresh_from_api(self, workspace: 'Workspace') -> 'Workspace':
+        if workspace.kind == Workspace.Kind.SLACK:
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
+            refreshed_workspace = slack_client.get_workspace(workspace.team_id)
+            if refreshed_workspace is not None:
+                workspace.domain = refreshed_workspace.domain
+                workspace.name = refreshed_workspace.name
+                workspace.save()
+            else:
+                logger.warning(f'Failed to refresh Slack Workspace {workspace.team_id}')
+            return workspace
+        else:
+            raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
+
 
 class Workspace(models.Model):
     class Kind(models.TextChoices):
@@ -80,31 +96,23 @@ class Workspace(models.Model):
 class MemberManager(models.Manager):
     def get_or_fetch_by_workspace_and_id(self, workspace: Workspace, user_id: str) -> 'Member':
         try:
-            member = self.get_queryset().get(workspace=workspace, user_id=user_id)
+            member = member_cache.get_or_load(
+                (workspace.id, user_id),
+                lambda: self.get_queryset().get(workspace=workspace, user_id=user_id)
+            )
             # Check to see how long it has been since this item was updated from the api
             delta: timedelta = timezone.now() - member.updated
             if delta < timedelta(days=7):
                 # If we've refreshed in the last week, simply return it
                 return member
             # Otherwise, we're going to be fetching from the api
-            if workspace.kind == Workspace.Kind.SLACK:
-                slack_client = SlackApiClient(workspace.access_token, enable_emergency_log=False)
-                refreshed_user = slack_client.get_user(member.user_id)
-                if refreshed_user is not None:
-                    member.name = refreshed_user.get_short_name()
-                    member.real_name = refreshed_user.get_real_name()
-                    member.save()
-                else:
-                    logger.warning(f'Failed to refresh Slack User {member.user_id}')
-                return member
-            else:
-                raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
-
+            member.workspace = workspace
+            return refresh_stale(member, self.refresh_from_api)
         except Member.DoesNotExist:
             # Member does not exist, we need to look up via the api
             pass
         if workspace.kind == Workspace.Kind.SLACK:
-            slack_client = SlackApiClient(workspace.access_token, enable_emergency_log=False)
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
             fetched_user = slack_client.get_user(user_id)
             new_member = self.create(
                 workspace=workspace,
@@ -116,6 +124,72 @@ class MemberManager(models.Manager):
         else:
             raise NotImplementedError(f'Fetching is not implemented for Workspace Kind {workspace.kind}')
 
+    def get_or_fetch_many_by_workspace_and_ids(self, workspace: Workspace, user_ids: Iterable[str]) -> Dict[str, 'Member']:
+        """
+        Resolve several members at once: cached members are used directly, the rest are loaded with a single query,
+        and any that are still unknown are fetched from the api and inserted together.
+        :return: a dict of user_id to Member
+        """
+        members: Dict[str, Member] = {}
+        missing: List[str] = []
+        for user_id in dict.fromkeys(user_ids):
+            member = member_cache.get((workspace.id, user_id))
+            if member is None:
+                missing.append(user_id)
+            else:
+                members[user_id] = member
+        if len(missing) > 0:
+            for member in self.get_queryset().filter(workspace=workspace, user_id__in=missing):
+                member_cache.set((workspace.id, member.user_id), member)
+                members[member.user_id] = member
+        now = timezone.now()
+        for member in list(members.values()):
+            if now - member.updated >= timedelta(days=7):
+                member.workspace = workspace
+                members[member.user_id] = refresh_stale(member, self.refresh_from_api)
+        unknown = [user_id for user_id in missing if user_id not in members]
+        if len(unknown) > 0:
+            members.update(self.__fetch_many(workspace, unknown))
+        return members
+
+    def __fetch_many(self, workspace: Workspace, user_ids: List[str]) -> Dict[str, 'Member']:
+        if workspace.kind == Workspace.Kind.SLACK:
+            # Slack has no batch users.info, but the client reuses one pooled connection for these lookups
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
+            new_members = []
+            for user_id in user_ids:
+                fetched_user = slack_client.get_user(user_id)
+                new_members.append(Member(
+                    workspace=workspace,
+                    user_id=user_id,
+                    name=fetched_user.get_short_name(),
+                    real_name=fetched_user.get_real_name(),
+                ))
+            # Another worker may have inserted some of these since we looked, so keep whichever rows got there first
+            self.bulk_create(new_members, ignore_conflicts=True)
+            members = {}
+            for member in self.get_queryset().filter(workspace=workspace, user_id__in=user_ids):
+                member_cache.set((workspace.id, member.user_id), member)
+                members[member.user_id] = member
+            return members
+        else:
+            raise NotImplementedError(f'Fetching is not implemented for Workspace Kind {workspace.kind}')
+
+    def refresh_from_api(self, member: 'Member') -> 'Member':
+        workspace = member.workspace
+        if workspace.kind == Workspace.Kind.SLACK:
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
+            refreshed_user = slack_client.get_user(member.user_id)
+            if refreshed_user is not None:
+                member.name = refreshed_user.get_short_name()
+                member.real_name = refreshed_user.get_real_name()
+                member.save()
+            else:
+                logger.warning(f'Failed to refresh Slack User {member.user_id}')
+            return member
+        else:
+            raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
+
 
 class Member(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -138,33 +212,22 @@ class Member(models.Model):
 class ChannelManager(models.Manager):
     def get_or_fetch_by_workspace_and_id(self, workspace: Workspace, channel_id: str) -> 'Channel':
         try:
-            channel = self.get(workspace=workspace, channel_id=channel_id)
+            channel = channel_cache.get_or_load(
+                (workspace.id, channel_id),
+                lambda: self.get(workspace=workspace, channel_id=channel_id)
+            )
             delta: timedelta = timezone.now() - channel.updated
             if delta < timedelta(days=7):
                 # If we've refreshed in the last week, simply return it
                 return channel
             # Otherwise, we're going to be fetching from the api
-            if workspace.kind == Workspace.Kind.SLACK:
-                slack_client = SlackApiClient(workspace.access_token, enable_emergency_log=False)
-                refreshed_channel = slack_client.get_channel(channel.channel_id)
-                if refreshed_channel is not None:
-                    channel.name = refreshed_channel.name
-                    channel.is_channel = refreshed_channel.is_channel
-                    channel.is_group = refreshed_channel.is_group
-                    channel.is_private = refreshed_channel.is_private
-                    channel.is_im = refreshed_channel.is_im
-                    channel.save()
-                else:
-                    logger.warning(f'Failed to refresh Slack Channel {channel.channel_id}')
-                return channel
-            else:
-                raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
-
+            channel.workspace = workspace
+            return refresh_stale(channel, self.refresh_from_api)
         except Channel.DoesNotExist:
             # Channel does not exist, we need to look up via the api
             pass
         if workspace.kind == Workspace.Kind.SLACK:
-            slack_client = SlackApiClient(workspace.access_token, enable_emergency_log=False)
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
             fetched_channel = slack_client.get_channel(channel_id)
             new_channel = self.create(
                 workspace=workspace,
@@ -179,6 +242,24 @@ class ChannelManager(models.Manager):
         else:
             raise NotImplementedError(f'Fetching is not implemented for Workspace Kind {workspace.kind}')
 
+    def refresh_from_api(self, channel: 'Channel') -> 'Channel':
+        workspace = channel.workspace
+        if workspace.kind == Workspace.Kind.SLACK:
+            slack_client = get_slack_client(workspace.access_token, enable_emergency_log=False)
+            refreshed_channel = slack_client.get_channel(channel.channel_id)
+            if refreshed_channel is not None:
+                channel.name = refreshed_channel.name
+                channel.is_channel = refreshed_channel.is_channel
+                channel.is_group = refreshed_channel.is_group
+                channel.is_private = refreshed_channel.is_private
+                channel.is_im = refreshed_channel.is_im
+                channel.save()
+            else:
+                logger.warning(f'Failed to refresh Slack Channel {channel.channel_id}')
+            return channel
+        else:
+            raise NotImplementedError(f'Updating is not implemented for Workspace Kind {workspace.kind}')
+
 
 class Channel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -201,3 +282,21 @@ class Channel(models.Model):
 
     class Meta:
         unique_together = ('workspace_id', 'channel_id')
+
+
+@receiver(post_save, sender=Workspace)
+@receiver(post_delete, sender=Workspace)
+def invalidate_cached_workspace(sender, instance: Workspace, **kwargs):
+    workspace_cache.invalidate((instance.kind, instance.team_id))
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_cached_member(sender, instance: Member, **kwargs):
+    member_cache.invalidate((instance.workspace_id, instance.user_id))
+
+
+@receiver(post_save, sender=Channel)
+@receiver(post_delete, sender=Channel)
+def invalidate_cached_channel(sender, instance: Channel, **kwargs):
+    channel_cache.invalidate((instance.workspace_id, instance.channel_id))
@@ -2,6 +2,7 @@ from typing import Optional, Tuple, Dict, List
 
 import requests
 from django.core.cache import cache as default_cache, BaseCache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
 from frisky.events import MessageEvent, ReactionEvent
 from frisky.responses import FriskyResponse
@@ -19,11 +20,14 @@ class FriskyPlugin(object):
         def get(self, key):
             return self.cache.get(self.__get_key(key))
 
-        def set(self, key, value):
-            return self.cache.set(self.__get_key(key), value)
+        def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+            return self.cache.set(self.__get_key(key), value, timeout=timeout)
 
-        def get_or_set(self, key, default):
-            return self.cache.get_or_set(self.__get_key(key), default)
+        def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT):
+            return self.cache.get_or_set(self.__get_key(key), default, timeout=timeout)
+
+        def delete(self, key):
+            return self.cache.delete(self.__get_key(key))
 
     class HttpWrapper(object):
         def get(self, *args, **kwargs):
@@ -98,6 +102,13 @@ class FriskyPlugin(object):
     def help_text(cls) -> Optional[str]:
         return cls.help
 
+    def handles_generic(self, command: str, args: List[str]) -> bool:
+        """
+        Plugins registered for '*' are asked this before a message for an unknown command is processed, and should
+        return False only if they can cheaply tell that they would ignore it
+        """
+        return True
+
     def cacheify(self, fn, *args):
         key = ':'.join([fn.__name__] + [str(x) for x in args])
         return self.cache.get_or_set(key, lambda: fn(*args))
@@ -0,0 +1,75 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, TypeVar
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+from frisky.db import closing_db_connections
+
+logger = logging.getLogger(__name__)
+
+Model = TypeVar('Model', bound=models.Model)
+
+SYNC = 'sync'
+THREAD = 'thread'
+CELERY = 'celery'
+
+
+def refresh_key(label: str, pk: str) -> str:
+    return f'frisky:refresh:{label}:{pk}'
+
+
+@lru_cache(maxsize=None)
+def get_refresh_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.FRISKY_STALE_REFRESH_WORKERS, thread_name_prefix='frisky-refresh')
+
+
+def refresh_stale(instance: Model, refresh: Callable[[Model], Model]) -> Model:
+    """
+    Refresh a stale row from its upstream api according to FRISKY_STALE_REFRESH_MODE.
+
+    In `sync` mode the refresh happens immediately and the refreshed row is returned. In `thread` and `celery` modes
+    the stale row is returned right away and the refresh is queued in the background; concurrent requests to refresh
+    the same row are merged into a single refresh.
+    :param instance: The stale row
+    :param refresh: The manager method that refreshes the row from the api
+    :return: The refreshed row in `sync` mode, otherwise the stale row
+    """
+    mode = settings.FRISKY_STALE_REFRESH_MODE
+    if mode == SYNC:
+        return refresh(instance)
+    label = instance._meta.label
+    pk = str(instance.pk)
+    # cache.add is atomic, so only the first caller gets to queue a refresh for this row
+    if not cache.add(refresh_key(label, pk), True, timeout=settings.FRISKY_STALE_REFRESH_LOCK_TIMEOUT):
+        return instance
+    if mode == THREAD:
+        get_refresh_executor().submit(run_refresh_in_thread, label, pk)
+    elif mode == CELERY:
+        from frisky.tasks import refresh_stale_row
+        refresh_stale_row.delay(label, pk)
+    else:
+        cache.delete(refresh_key(label, pk))
+        raise ImproperlyConfigured(f'Unknown FRISKY_STALE_REFRESH_MODE: {mode}')
+    return instance
+
+
+def run_refresh(label: str, pk: str) -> None:
+    try:
+        model = apps.get_model(label)
+        instance = model.objects.get(pk=pk)
+        model.objects.refresh_from_api(instance)
+    except Exception as err:
+        logger.warning(f'Failed to refresh {label} {pk}', exc_info=err)
+    finally:
+        cache.delete(refresh_key(label, pk))
+
+
+@closing_db_connections
+def run_refresh_in_thread(label: str, pk: str) -> None:
+    run_refresh(label, pk)
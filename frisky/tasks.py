@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from frisky.refresh import run_refresh
+
+
+@shared_task
+def refresh_stale_row(label: str, pk: str):
+    run_refresh(label, pk)
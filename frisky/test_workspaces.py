@@ -5,7 +5,8 @@ from django.test import TestCase
 
 import responses
 
-from frisky.models import Workspace, Member, Channel
+from frisky.models import Workspace, Member, Channel, member_cache
+from frisky.refresh import run_refresh
 from slack.test_data import user_json
 
 slack_not_ok = '''
@@ -105,6 +106,12 @@ class FriskyWorkspaceTestCase(TestCase):
             workspace = Workspace.objects.get_or_fetch_by_kind_and_id(Workspace.Kind.SLACK, 'W12345')
         self.assertEqual(self.workspace.id, workspace.id)
 
+    def test_getting_workspace_twice_uses_the_cache(self):
+        Workspace.objects.get_or_fetch_by_kind_and_id(Workspace.Kind.SLACK, 'W12345')
+        with self.assertNumQueries(0):
+            workspace = Workspace.objects.get_or_fetch_by_kind_and_id(Workspace.Kind.SLACK, 'W12345')
+        self.assertEqual(self.workspace.id, workspace.id)
+
 
 user_ok_response = '''
 {
@@ -217,6 +224,50 @@ class FriskyMemberTestCase(TestCase):
             member = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDE')
         self.assertEqual(self.valid_member.id, member.id)
 
+    def test_getting_member_twice_uses_the_cache(self):
+        Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDE')
+        with self.assertNumQueries(0):
+            member = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDE')
+        self.assertEqual(self.valid_member.id, member.id)
+        self.assertEqual(1, member_cache.info().hits)
+
+    def test_saving_a_member_invalidates_the_cache(self):
+        Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDE')
+        self.valid_member.name = 'renamed'
+        self.valid_member.save()
+        member = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDE')
+        self.assertEqual('renamed', member.name)
+
+    def test_stale_member_is_served_while_refreshing_in_a_thread(self):
+        with self.settings(FRISKY_STALE_REFRESH_MODE='thread'), \
+                mock.patch('frisky.refresh.get_refresh_executor') as get_executor, \
+                mock.patch('frisky.models.timezone') as mock_datetime:
+            mock_datetime.now.return_value = datetime(year=2021, month=6, day=1, hour=12, minute=0, second=0,
+                                                      tzinfo=timezone.utc)
+            member = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDF')
+            Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDF')
+        self.assertEqual('rbot', member.name)
+        # The second lookup is merged into the refresh that is already queued
+        get_executor.return_value.submit.assert_called_once_with(mock.ANY, 'frisky.Member', str(member.id))
+
+    def test_stale_member_is_served_while_refreshing_in_celery(self):
+        with self.settings(FRISKY_STALE_REFRESH_MODE='celery'), \
+                mock.patch('frisky.tasks.refresh_stale_row.delay') as delay, \
+                mock.patch('frisky.models.timezone') as mock_datetime:
+            mock_datetime.now.return_value = datetime(year=2021, month=6, day=1, hour=12, minute=0, second=0,
+                                                      tzinfo=timezone.utc)
+            member = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDF')
+            Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'W012A3CDF')
+        self.assertEqual('rbot', member.name)
+        delay.assert_called_once_with('frisky.Member', str(member.id))
+
+    @responses.activate
+    def test_background_refresh_updates_the_member(self):
+        responses.add(responses.GET, url='https://slack.com/api/users.info?user=W012A3CDF', body=user_ok_response)
+        run_refresh('frisky.Member', str(self.expired_member.id))
+        self.expired_member.refresh_from_db()
+        self.assertEqual('displaynamenormalized', self.expired_member.name)
+
     @responses.activate
     def test_fetching_unsupported_workspace(self):
         with self.assertRaises(NotImplementedError, msg='Fetching is not implemented for Workspace Kind None'):
@@ -422,6 +473,12 @@ class FriskyChannelTestCase(TestCase):
         self.assertEqual('C012AB3CE', channel.channel_id)
         self.assertEqual('hidden', channel.name)
 
+    def test_getting_channel_twice_uses_the_cache(self):
+        Channel.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'C012AB3CD')
+        with self.assertNumQueries(0):
+            channel = Channel.objects.get_or_fetch_by_workspace_and_id(self.workspace, 'C012AB3CD')
+        self.assertEqual(self.valid_channel.id, channel.id)
+
     @responses.activate
     def test_getting_channel_when_it_exists(self):
         with mock.patch('frisky.models.timezone') as mock_datetime:
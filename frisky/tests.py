@@ -1,14 +1,22 @@
-from unittest import TestCase
+import asyncio
+import random
+import threading
+from unittest import TestCase, mock
 from unittest.mock import MagicMock
 
 import pytest
 import responses
 
-from frisky.bot import Frisky
+from frisky.aio import run_in_background
+from frisky.bot import Frisky, PluginRegistry
+from frisky.cache import IdentityCache
+from frisky.db import closing_db_connections
 from frisky.events import MessageEvent, ReactionEvent
 from frisky.friskyhttp import PostProcessingResponse
 from frisky.plugin import FriskyApiPlugin
+from frisky.responses import FriskyError
 from frisky.util import quotesplit
+from frisky.workers import BoundedExecutor
 
 
 class FriskyBotTestCase(TestCase):
@@ -36,13 +44,30 @@ class FriskyBotTestCase(TestCase):
         expected = ('', [])
         self.assertTupleEqual(result, expected)
 
+    def test_parsed_messages_can_be_changed_safely(self):
+        _, args = self.frisky.parse_message_string('?learn foo "bar baz"')
+        args.append('qux')
+        self.assertTupleEqual(('learn', ['foo', 'bar baz']), self.frisky.parse_message_string('?learn foo "bar baz"'))
+
+    def test_messages_without_a_handler_are_not_commands(self):
+        self.assertFalse(self.frisky.is_command('?help'))
+        self.assertFalse(self.frisky.is_command('?'))
+        self.assertFalse(self.frisky.is_command('help'))
+
+    def test_registered_commands_are_commands(self):
+        frisky = Frisky('frisky')
+        self.assertTrue(frisky.is_command('?help'))
+        self.assertTrue(frisky.is_command('@frisky help'))
+        self.assertFalse(frisky.is_command('help'))
+
     def test_loading_something_that_is_not_a_plugin(self):
         class NotAPlugin:
             def __init__(self):
                 raise Exception('whoopsie')
 
-        self.frisky._Frisky__load_plugin_from_class('notaplugin', NotAPlugin)
-        self.assertNotIn('notaplugin', self.frisky._Frisky__loaded_plugins.keys())
+        registry = PluginRegistry()
+        registry._PluginRegistry__load_plugin_from_class('notaplugin', NotAPlugin)
+        self.assertNotIn('notaplugin', registry.loaded_plugins.keys())
 
     def test_frisky_ignores_message_in_ignored_channels(self):
         message = MessageEvent(
@@ -59,6 +84,26 @@ class FriskyBotTestCase(TestCase):
         self.frisky.handle_message(message, reply_channel)
         reply_channel.assert_not_called()
 
+    def test_async_message_handling_prefers_successful_replies(self):
+        ok_plugin = MagicMock()
+        ok_plugin.handle_message.return_value = 'ok'
+        failing_plugin = MagicMock()
+        failing_plugin.handle_message.return_value = FriskyError('nope')
+        message = MessageEvent(MagicMock(), MagicMock(), MagicMock(), {}, '?cmd', 'user', 'general', '?cmd')
+        reply_channel = mock.AsyncMock()
+        with mock.patch.object(self.frisky, 'get_plugins_for_command', return_value=(failing_plugin, ok_plugin)):
+            asyncio.run(self.frisky.ahandle_message(message, reply_channel))
+        reply_channel.assert_awaited_once_with('ok')
+
+    def test_async_message_handling_sends_errors_when_nothing_succeeds(self):
+        failing_plugin = MagicMock()
+        failing_plugin.handle_message.return_value = FriskyError('nope')
+        message = MessageEvent(MagicMock(), MagicMock(), MagicMock(), {}, '?cmd', 'user', 'general', '?cmd')
+        reply_channel = mock.AsyncMock()
+        with mock.patch.object(self.frisky, 'get_plugins_for_command', return_value=(failing_plugin,)):
+            asyncio.run(self.frisky.ahandle_message(message, reply_channel))
+        reply_channel.assert_awaited_once_with('nope')
+
     def test_frisky_ignores_reaction_in_ignored_channels(self):
         reaction = ReactionEvent(
             MagicMock(),
@@ -100,6 +145,161 @@ class FriskyUtilTestCase(TestCase):
     def test_quotesplit_errors_with_dupe_chars(self):
         with self.assertRaises(ValueError):
             quotesplit("", separators=('a', 'b'), groupers=('b', 'c'))
+        # Only valid configurations are cached, so the second call must fail too
+        with self.assertRaises(ValueError):
+            quotesplit("", separators=('a', 'b'), groupers=('b', 'c'))
+
+    def test_quotesplit_mixed_groupers(self):
+        groupers = ('"', "'")
+        self.assertEqual(['a', 'b "c" d', 'e'], quotesplit('a \'b "c" d\' e', groupers=groupers))
+        self.assertEqual(['ab c', 'd'], quotesplit('a"b c" d', groupers=groupers))
+        self.assertEqual(['a', 'b c\'d'], quotesplit('a "b c\'d', groupers=groupers))
+        self.assertEqual(['a', '', 'b'], quotesplit('a\t""\t\tb', groupers=groupers))
+
+    def test_quotesplit_matches_character_by_character_splitting(self):
+        def reference(string, separators, groupers):
+            result, stack, substring = [], [], ''
+            for character in string:
+                if character in separators:
+                    if len(stack) == 0:
+                        if len(substring) > 0:
+                            result.append(substring)
+                            substring = ''
+                    else:
+                        substring += character
+                elif character in groupers:
+                    if len(stack) == 0:
+                        stack.append(character)
+                    elif stack[-1] == character:
+                        stack.pop()
+                        if len(stack) == 0:
+                            result.append(substring)
+                            substring = ''
+                        else:
+                            substring += character
+                    else:
+                        stack.append(character)
+                        substring += character
+                else:
+                    substring += character
+            if len(substring) > 0:
+                result.append(substring)
+            return result
+
+        rng = random.Random(1234)
+        for _ in range(2000):
+            string = ''.join(rng.choice('ab |\t"\'-.') for _ in range(rng.randint(0, 30)))
+            for separators, groupers in [((' ', '\t'), ('"',)), ((' ', '|'), ('"', "'")), (('.',), ('-', '|'))]:
+                self.assertEqual(reference(string, separators, groupers), quotesplit(string, separators, groupers),
+                                 msg=repr(string))
+
+
+class IdentityCacheTestCase(TestCase):
+
+    def test_get_or_load_only_loads_once(self):
+        cache = IdentityCache(maxsize=10, ttl=60)
+        loader = MagicMock(return_value='value')
+        self.assertEqual('value', cache.get_or_load('key', loader))
+        self.assertEqual('value', cache.get_or_load('key', loader))
+        loader.assert_called_once()
+        self.assertEqual((1, 1, 10, 1), tuple(cache.info()))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = IdentityCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_entries_expire(self):
+        cache = IdentityCache(maxsize=2, ttl=60)
+        with mock.patch('frisky.cache.time.monotonic', return_value=1000.0):
+            cache.set('a', 1)
+        with mock.patch('frisky.cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, cache.info().currsize)
+
+    def test_invalidate(self):
+        cache = IdentityCache()
+        cache.set('a', 1)
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_zero_ttl_disables_caching(self):
+        cache = IdentityCache(ttl=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class ClosingDbConnectionsTestCase(TestCase):
+
+    @mock.patch('frisky.db.connection')
+    def test_connection_is_closed_after_returning(self, connection):
+        self.assertEqual(3, closing_db_connections(lambda a, b: a + b)(1, b=2))
+        connection.close.assert_called_once()
+
+    @mock.patch('frisky.db.connection')
+    def test_connection_is_closed_after_raising(self, connection):
+        with self.assertRaises(ZeroDivisionError):
+            closing_db_connections(lambda: 1 / 0)()
+        connection.close.assert_called_once()
+
+
+class RunInBackgroundTestCase(TestCase):
+
+    def test_tasks_outlive_the_loop_they_were_started_from(self):
+        finished = threading.Event()
+
+        async def slow_task():
+            await asyncio.sleep(0.01)
+            finished.set()
+
+        async def view():
+            run_in_background(slow_task())
+
+        # Like an async view served over WSGI, whose event loop is closed as soon as it returns
+        asyncio.run(view())
+        self.assertTrue(finished.wait(5))
+
+
+class BoundedExecutorTestCase(TestCase):
+
+    def test_jobs_run_on_the_pool(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=1)
+        job = MagicMock()
+        self.assertTrue(executor.submit(job, 'arg', key='value'))
+        executor.shutdown()
+        job.assert_called_once_with('arg', key='value')
+        self.assertEqual(0, executor.in_flight)
+
+    def test_full_pool_refuses_work(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=1)
+        release = threading.Event()
+        self.assertTrue(executor.submit(release.wait))
+        self.assertTrue(executor.submit(release.wait))
+        self.assertFalse(executor.submit(release.wait))
+        self.assertEqual(2, executor.in_flight)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(0, executor.in_flight)
+
+    def test_shutdown_drains_queued_jobs(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=5)
+        results = []
+        for i in range(5):
+            executor.submit(results.append, i)
+        executor.shutdown()
+        self.assertEqual([0, 1, 2, 3, 4], results)
+        self.assertFalse(executor.submit(results.append, 5))
+
+    def test_errors_do_not_leak_slots(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_depth=0)
+        executor.submit(MagicMock(side_effect=RuntimeError('whoopsie')))
+        executor.shutdown()
+        self.assertEqual(0, executor.in_flight)
 
 
 class FriskyApiPluginTestCase(TestCase):
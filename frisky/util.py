@@ -1,4 +1,22 @@
-from typing import Tuple, List
+import re
+from functools import lru_cache
+from typing import Tuple, List, Pattern
+
+
+def _character_class(characters: Tuple[str, ...]) -> Pattern:
+    # Only single characters can ever match, as the string is looked at one character at a time
+    characters = [character for character in characters if len(character) == 1]
+    if len(characters) == 0:
+        return re.compile(r'(?!)')
+    return re.compile('[' + ''.join(re.escape(character) for character in characters) + ']')
+
+
+@lru_cache(maxsize=32)
+def _compile_quotesplit(separators: Tuple[str, ...], groupers: Tuple[str, ...]) -> Tuple[Pattern, Pattern]:
+    intersection = [value for value in separators if value in groupers]
+    if len(intersection) > 0:
+        raise ValueError(f'No characters can be shared between separators and groupers: {intersection}')
+    return _character_class(separators), _character_class(groupers)
 
 
 def quotesplit(string: str, separators: Tuple[str, ...] = (' ', '\t'), groupers: Tuple[str, ...] = ('"',)) -> List[str]:
@@ -10,39 +28,50 @@ def quotesplit(string: str, separators: Tuple[str, ...] = (' ', '\t'), groupers:
         separator characters without being broken apart
     :return: a list of substrings
     """
-    intersection = [value for value in separators if value in groupers]
-    if len(intersection) > 0:
-        raise ValueError(f'No characters can be shared between separators and groupers: {intersection}')
+    separator_pattern, grouper_pattern = _compile_quotesplit(tuple(separators), tuple(groupers))
 
     result: List[str] = []
-    stack: List[chr] = []
-    substring: str = ""
-
-    for character in string:
-        if character in separators:
-            if len(stack) == 0:
-                if len(substring) > 0:
-                    result.append(substring)
-                    substring = ''
+    stack: List[str] = []
+    # The pieces of the substring being built, joined once it is complete
+    pieces: List[str] = []
+
+    def add_ungrouped(text: str) -> None:
+        nonlocal pieces
+        parts = separator_pattern.split(text)
+        pieces.append(parts[0])
+        if len(parts) > 1:
+            substring = ''.join(pieces)
+            if len(substring) > 0:
+                result.append(substring)
+            result.extend(part for part in parts[1:-1] if len(part) > 0)
+            pieces = [parts[-1]]
+
+    # Only groupers are looked at one by one, the text between them is split or copied across in one go
+    start = 0
+    for match in grouper_pattern.finditer(string):
+        character = match.group()
+        if len(stack) == 0:
+            add_ungrouped(string[start:match.start()])
+            stack.append(character)
+        else:
+            pieces.append(string[start:match.start()])
+            if stack[-1] == character:
+                stack.pop()
+                if len(stack) == 0:
+                    result.append(''.join(pieces))
+                    pieces = []
+                else:
+                    pieces.append(character)
             else:
-                substring += character
-        elif character in groupers:
-            if len(stack) == 0:
                 stack.append(character)
-            else:
-                if stack[-1] == character:
-                    stack.pop()
-                    if len(stack) == 0:
-                        result.append(substring)
-                        substring = ''
-                    else:
-                        substring += character
-                else:
-                    stack.append(character)
-                    substring += character
-        else:
-            substring += character
+                pieces.append(character)
+        start = match.end()
 
+    if len(stack) == 0:
+        add_ungrouped(string[start:])
+    else:
+        pieces.append(string[start:])
+    substring = ''.join(pieces)
     if len(substring) > 0:
         result.append(substring)
 
@@ -0,0 +1,81 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from django.conf import settings
+
+from frisky.db import closing_db_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor(object):
+    """
+    A thread pool that accepts at most max_workers running jobs plus max_queue_depth waiting jobs. Once it is full,
+    submit() refuses new work instead of letting the queue grow without bound, so callers can apply backpressure.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int, name: str = 'frisky-worker') -> None:
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.__slots = threading.BoundedSemaphore(max_workers + max_queue_depth)
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__accepting = True
+
+    @property
+    def in_flight(self) -> int:
+        """
+        :return: the number of jobs that are running or waiting to run
+        """
+        return self.__in_flight
+
+    def submit(self, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Queue fn(*args, **kwargs) to run on the pool
+        :return: True if the job was accepted, False if the pool is full or shutting down
+        """
+        if not self.__accepting or not self.__slots.acquire(blocking=False):
+            return False
+        with self.__lock:
+            self.__in_flight += 1
+        try:
+            self.__executor.submit(self.__run, fn, args, kwargs)
+        except RuntimeError:
+            # The executor was shut down between our check and the submit
+            self.__finish()
+            return False
+        return True
+
+    @closing_db_connections
+    def __run(self, fn: Callable, args, kwargs) -> None:
+        try:
+            fn(*args, **kwargs)
+        except Exception as err:
+            logger.error(f'Error running {fn} on the worker pool', exc_info=err)
+        finally:
+            self.__finish()
+
+    def __finish(self) -> None:
+        with self.__lock:
+            self.__in_flight -= 1
+        self.__slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting new jobs and, if wait is True, block until every accepted job has finished
+        """
+        self.__accepting = False
+        self.__executor.shutdown(wait=wait)
+
+
+@lru_cache(maxsize=None)
+def get_worker_pool() -> BoundedExecutor:
+    pool = BoundedExecutor(settings.WORKER_POOL_SIZE, settings.WORKER_POOL_QUEUE_DEPTH)
+    # Drain whatever is still queued when the process exits gracefully
+    atexit.register(pool.shutdown)
+    return pool
@@ -0,0 +1,129 @@
+import json
+import threading
+from typing import Iterable, List, Optional, Sequence
+
+import markovify
+from django.conf import settings
+
+from learns.models import Learn, MarkovModel, markov_cache, normalize_label
+
+STATE_SIZE = 2
+
+# The label the model over every learn is kept under
+ALL_LEARNS = ''
+
+# Only used to split learns into sentences and words exactly as NewlineText does
+_parser = markovify.NewlineText('frisky', well_formed=False, retain_original=False)
+
+# Models are grown in place, so bringing them up to date and generating from them are serialized
+_lock = threading.RLock()
+
+
+def _merge_chain(into: dict, chain: dict) -> None:
+    for state, follows in chain.items():
+        current = into.setdefault(state, {})
+        for word, count in follows.items():
+            current[word] = current.get(word, 0) + count
+
+
+class LearnMarkovModel(object):
+    """
+    The Markov chain for the learns of one label, or for every learn, which knows the newest learn it includes so it
+    can be brought up to date without being rebuilt
+    """
+
+    def __init__(self, label: str, chain: dict, sentences: List[List[str]], through_id: int = 0) -> None:
+        self.label = label
+        self.chain = chain
+        self.sentences = sentences
+        self.through_id = through_id
+        self.unsaved = 0
+        self.__text = None
+
+    @classmethod
+    def load(cls, label: str) -> 'LearnMarkovModel':
+        try:
+            saved = MarkovModel.objects.get(label=label)
+        except MarkovModel.DoesNotExist:
+            return cls(label, {}, [])
+        exported = json.loads(saved.model_json)
+        chain = markovify.Chain.from_json(exported['chain'])
+        return cls(label, chain.model, exported['parsed_sentences'], saved.through_id)
+
+    @property
+    def text(self) -> Optional[markovify.NewlineText]:
+        if self.__text is None and len(self.sentences) > 0:
+            self.__text = markovify.NewlineText(
+                None,
+                state_size=STATE_SIZE,
+                chain=markovify.Chain(None, STATE_SIZE, model=self.chain),
+                parsed_sentences=self.sentences,
+                well_formed=False,
+            )
+        return self.__text
+
+    def add(self, learn_id: int, content: str) -> None:
+        sentences = list(_parser.generate_corpus(content))
+        _merge_chain(self.chain, _parser.chain.build(sentences, STATE_SIZE))
+        self.sentences.extend(sentences)
+        self.through_id = learn_id
+        self.unsaved += 1
+        self.__text = None
+
+    def catch_up(self) -> None:
+        """
+        Fold in any learns added since this model was last brought up to date, by this or any other process, and save
+        the model once enough of them have accumulated
+        """
+        learns = Learn.objects.all() if self.label == ALL_LEARNS else Learn.objects.for_label(self.label)
+        for learn_id, content in learns.filter(id__gt=self.through_id).order_by('id').values_list('id', 'content'):
+            self.add(learn_id, content)
+        if self.unsaved >= settings.MARKOV_SAVE_INTERVAL and self.text is not None:
+            self.save()
+
+    def save(self) -> None:
+        MarkovModel.objects.update_or_create(
+            label=self.label,
+            defaults={'through_id': self.through_id, 'model_json': self.text.to_json()},
+        )
+        self.unsaved = 0
+
+
+def get_markov_model(label: str = ALL_LEARNS) -> LearnMarkovModel:
+    label = normalize_label(label)
+    with _lock:
+        model = markov_cache.get_or_load(label, lambda: LearnMarkovModel.load(label))
+        model.catch_up()
+        return model
+
+
+def combine(models: Iterable[LearnMarkovModel]) -> Optional[markovify.NewlineText]:
+    models = [model for model in models if model.text is not None]
+    if len(models) == 0:
+        return None
+    if len(models) == 1:
+        return models[0].text
+    chain = {}
+    sentences = []
+    for model in models:
+        _merge_chain(chain, model.chain)
+        sentences.extend(model.sentences)
+    return markovify.NewlineText(
+        None,
+        state_size=STATE_SIZE,
+        chain=markovify.Chain(None, STATE_SIZE, model=chain),
+        parsed_sentences=sentences,
+        well_formed=False,
+    )
+
+
+def make_sentence(labels: Sequence[str] = (), tries: int = 100) -> Optional[str]:
+    """
+    Generate a sentence from the learns for the given labels, or from every learn if no labels are given
+    """
+    labels = list(dict.fromkeys(normalize_label(label) for label in labels)) or [ALL_LEARNS]
+    with _lock:
+        text = combine(get_markov_model(label) for label in labels)
+        if text is None:
+            return None
+        return text.make_sentence(tries=tries)
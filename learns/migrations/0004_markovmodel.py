@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learns', '0003_learn_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarkovModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(blank=True, max_length=50, unique=True)),
+                ('through_id', models.IntegerField(default=0)),
+                ('model_json', models.TextField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
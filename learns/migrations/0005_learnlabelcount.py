@@ -0,0 +1,32 @@
+# Generated by Django 3.2.4 on 2026-10-18 14:59
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_learns(apps, schema_editor):
+    Learn = apps.get_model('learns', 'Learn')
+    LearnLabelCount = apps.get_model('learns', 'LearnLabelCount')
+    LearnLabelCount.objects.bulk_create([
+        LearnLabelCount(label=row['label'], total=row['total'])
+        for row in Learn.objects.values('label').annotate(total=Count('id')).order_by()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learns', '0004_markovmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LearnLabelCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=50, unique=True)),
+                ('total', models.IntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_learns, migrations.RunPython.noop),
+    ]
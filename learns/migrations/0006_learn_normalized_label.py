@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+from learns.search import install_search_index
+
+
+def normalize_labels(apps, schema_editor):
+    Learn = apps.get_model('learns', 'Learn')
+    LearnLabelCount = apps.get_model('learns', 'LearnLabelCount')
+    for label in Learn.objects.values_list('label', flat=True).distinct():
+        Learn.objects.filter(label=label).update(normalized_label=label.lower())
+
+    # Labels that only differ by case are now counted together
+    LearnLabelCount.objects.all().delete()
+    LearnLabelCount.objects.bulk_create([
+        LearnLabelCount(label=row['normalized_label'], total=row['total'])
+        for row in Learn.objects.values('normalized_label').annotate(total=Count('id')).order_by()
+    ])
+
+
+def reinstall_search_index(apps, schema_editor):
+    # Adding a column rebuilds learns_learn on SQLite, which drops the triggers that keep the search index in sync
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learns', '0005_learnlabelcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learn',
+            name='normalized_label',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+            preserve_default=False,
+        ),
+        migrations.RunPython(normalize_labels, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='learn',
+            name='label',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -1,28 +1,57 @@
+import time
 from random import randint
-from typing import Optional
+from typing import List, NamedTuple, Optional, Tuple
 
-from django.db import models
-from django.db.models import Count
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from frisky.cache import IdentityCache
+from learns.search import get_learn_search_backend
+
+# In-process cache of the ids of every learn for a label (or None for all learns), so a random learn can be picked
+# with a single primary key lookup instead of an OFFSET scan
+learn_id_cache = IdentityCache(settings.LEARN_ID_CACHE_SIZE, settings.LEARN_ID_CACHE_TTL)
+
+
+class LearnIds(NamedTuple):
+    loaded: float
+    checked: float
+    ids: Tuple[int, ...]
+
+# In-process cache of Markov models, see learns.markov
+markov_cache = IdentityCache(settings.MARKOV_CACHE_SIZE, settings.MARKOV_CACHE_TTL)
+
+
+def normalize_label(label: str) -> str:
+    """
+    Labels are case insensitive, every lookup goes through this normalized form
+    """
+    return label.lower()
 
 
 class LearnManager(models.Manager):
 
     def count_for_label(self, label):
-        results = self.get_queryset().filter(label=label) \
-            .values('label') \
-            .annotate(total=Count('label'))
-        if len(results) == 0:
-            return None
-        return results[0]
+        return LearnLabelCount.objects.filter(label=normalize_label(label)).values('label', 'total').first()
+
+    def counts_for_labels(self, labels: List[str]) -> List[dict]:
+        """
+        :return: the counts for whichever of labels have learns, in the order they were asked for
+        """
+        labels = list(dict.fromkeys(normalize_label(label) for label in labels))
+        counts = {lc['label']: lc for lc in LearnLabelCount.objects.filter(label__in=labels).values('label', 'total')}
+        return [counts[label] for label in labels if label in counts]
 
-    def label_counts(self):
-        return self.get_queryset() \
-            .values('label') \
-            .annotate(total=Count('label')) \
-            .order_by('-total')
+    def label_counts(self, minimum: int = 1):
+        return LearnLabelCount.objects.filter(total__gte=minimum) \
+            .values('label', 'total') \
+            .order_by('-total', 'label')
 
     def for_label(self, label):
-        return self.get_queryset().filter(label__iexact=label)
+        return self.get_queryset().filter(normalized_label=normalize_label(label))
 
     def for_label_indexed(self, label: str, index: int):
         learns = self.for_label(label)
@@ -34,18 +63,41 @@ class LearnManager(models.Manager):
             index += count
         return learns[int(index)]
 
+    def ids_for_label(self, label: Optional[str] = None) -> Tuple[int, ...]:
+        """
+        :return: the ids of every learn for label, or of every learn. Learns added by other processes are picked up
+            within LEARN_ID_REFRESH_INTERVAL seconds by fetching only the newer ids, and the whole list is reloaded
+            every LEARN_ID_CACHE_TTL seconds.
+        """
+        key = None if label is None else normalize_label(label)
+        learns = self.get_queryset() if key is None else self.get_queryset().filter(normalized_label=key)
+        now = time.monotonic()
+        entry = learn_id_cache.get(key)
+        if entry is None or now - entry.loaded >= settings.LEARN_ID_CACHE_TTL:
+            entry = LearnIds(now, now, tuple(learns.order_by('id').values_list('id', flat=True)))
+        elif now - entry.checked >= settings.LEARN_ID_REFRESH_INTERVAL:
+            newer = learns.filter(id__gt=entry.ids[-1]) if len(entry.ids) > 0 else learns
+            entry = LearnIds(entry.loaded, now, entry.ids + tuple(newer.order_by('id').values_list('id', flat=True)))
+        else:
+            return entry.ids
+        learn_id_cache.set(key, entry)
+        return entry.ids
+
     def random(self, label=None):
-        if label is None:
-            all_learns = self.get_queryset().all()
-            count = all_learns.aggregate(count=Count('id'))['count']
-            if count == 0:
-                return None
-            random_index = randint(0, count - 1)
-            return all_learns[random_index]
-        learns = self.for_label(label)
-        count = learns.aggregate(count=Count('id'))['count']
-        random_index = randint(0, count - 1)
-        return learns[random_index]
+        """
+        :raises ValueError: if a label is given and it has no learns
+        """
+        ids = self.ids_for_label(label)
+        if label is None and len(ids) == 0:
+            return None
+        random_index = randint(0, len(ids) - 1)
+        learns = self.get_queryset() if label is None else self.for_label(label)
+        learn = learns.filter(id=ids[random_index]).first()
+        if learn is None:
+            # Deleted or relabelled by another process since the ids were cached, so try again with fresh ids
+            learn_id_cache.invalidate(None if label is None else normalize_label(label))
+            return self.random(label)
+        return learn
 
     def add(self, label: str, content: str) -> bool:
         """
@@ -54,22 +106,145 @@ class LearnManager(models.Manager):
         :param content:
         :return: True if the record was created
         """
-        if not self.get_queryset().filter(label=label, content=content).exists():
+        if not self.for_label(label).filter(content=content).exists():
             self.get_queryset().create(label=label, content=content)
             return True
         return False
 
-    def search(self, query: str, label: Optional[str] = None):
-        if label is None:
-            return self.get_queryset().filter(content__icontains=query)
-        return self.get_queryset().filter(label=label, content__icontains=query)
+    def search(self, query: str, label: Optional[str] = None, limit: Optional[int] = None) -> List:
+        """
+        :return: at most limit learns matching query, best matches first
+        """
+        if limit is None:
+            limit = settings.LEARN_SEARCH_LIMIT
+        if label is not None:
+            label = normalize_label(label)
+        return get_learn_search_backend().search(self.get_queryset(), query, label, limit)
 
 
 class Learn(models.Model):
-    label = models.CharField(max_length=50, db_index=True)
+    label = models.CharField(max_length=50)
+    normalized_label = models.CharField(max_length=50, db_index=True, editable=False)
     content = models.CharField(max_length=2000)
 
     objects = LearnManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the label as loaded, so a relabel can be counted after saving without reading the row back
+        if 'normalized_label' in field_names:
+            instance._saved_label = instance.normalized_label
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.normalized_label = normalize_label(self.label)
+        # The label counts are updated by the post_save receivers, in the same transaction as the learn
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        # Only once every receiver has seen the label it was saved under before
+        self._saved_label = self.normalized_label
+
     def __str__(self):
         return f'{self.label}: "{self.content}"'
+
+
+class LearnLabelCountManager(models.Manager):
+
+    def increment(self, label: str) -> None:
+        if self.get_queryset().filter(label=label).update(total=F('total') + 1) == 0:
+            try:
+                with transaction.atomic():
+                    self.get_queryset().create(label=label, total=1)
+            except IntegrityError:
+                # Another process counted the label's first learn at the same time
+                self.get_queryset().filter(label=label).update(total=F('total') + 1)
+
+    def decrement(self, label: str) -> None:
+        self.get_queryset().filter(label=label).update(total=F('total') - 1)
+        self.get_queryset().filter(label=label, total__lte=0).delete()
+
+
+class LearnLabelCount(models.Model):
+    """
+    The number of learns for each normalized label, kept up to date as learns are saved and deleted so counts never need to
+    aggregate the learns table. Bulk operations that skip model signals (bulk_create, QuerySet.update) are not counted.
+    """
+    label = models.CharField(max_length=50, unique=True)
+    total = models.IntegerField(default=0, db_index=True)
+
+    objects = LearnLabelCountManager()
+
+    def __str__(self):
+        return f'{self.label}: {self.total}'
+
+
+class MarkovModel(models.Model):
+    """
+    A saved markovify model for the learns of one label, or for every learn when label is blank, which includes every
+    learn up to and including through_id
+    """
+    label = models.CharField(max_length=50, unique=True, blank=True)
+    through_id = models.IntegerField(default=0)
+    model_json = models.TextField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Markov model for {self.label or "all learns"} through {self.through_id}'
+
+
+@receiver(post_save, sender=Learn)
+@receiver(post_delete, sender=Learn)
+def update_cached_learn_ids(sender, instance: Learn, created: bool = False, **kwargs):
+    if created:
+        # New learns have the highest id yet, so they can go on the end of the cached ids instead of reloading them
+        for key in (instance.normalized_label, None):
+            entry = learn_id_cache.get(key)
+            if entry is not None and (len(entry.ids) == 0 or entry.ids[-1] < instance.id):
+                learn_id_cache.set(key, entry._replace(ids=entry.ids + (instance.id,)))
+        return
+    previous_label = getattr(instance, '_saved_label', None)
+    if previous_label is not None:
+        learn_id_cache.invalidate(previous_label)
+    learn_id_cache.invalidate(instance.normalized_label)
+    learn_id_cache.invalidate(None)
+
+
+@receiver(post_save, sender=Learn)
+@receiver(post_delete, sender=Learn)
+def invalidate_markov_models(sender, instance: Learn, created: bool = False, **kwargs):
+    if created:
+        # New learns are folded into the models incrementally the next time they are used
+        return
+    labels = [instance.normalized_label, '']
+    previous_label = getattr(instance, '_saved_label', None)
+    if previous_label is not None and previous_label != instance.normalized_label:
+        # A relabelled learn's text is still in the model for its old label
+        labels.append(previous_label)
+    MarkovModel.objects.filter(label__in=labels).delete()
+    for label in labels:
+        markov_cache.invalidate(label)
+
+
+@receiver(pre_save, sender=Learn)
+def load_saved_label(sender, instance: Learn, **kwargs):
+    if instance._state.adding or hasattr(instance, '_saved_label'):
+        return
+    # Only for learns that weren't loaded with their label, eg from .only() or built with a primary key
+    instance._saved_label = Learn.objects.filter(pk=instance.pk).values_list('normalized_label', flat=True).first()
+
+
+@receiver(post_save, sender=Learn)
+def count_saved_learn(sender, instance: Learn, created: bool, **kwargs):
+    if created:
+        LearnLabelCount.objects.increment(instance.normalized_label)
+    else:
+        previous_label = instance._saved_label
+        if previous_label is not None and previous_label != instance.normalized_label:
+            LearnLabelCount.objects.decrement(previous_label)
+            LearnLabelCount.objects.increment(instance.normalized_label)
+
+
+@receiver(post_delete, sender=Learn)
+def count_deleted_learn(sender, instance: Learn, **kwargs):
+    LearnLabelCount.objects.decrement(instance.normalized_label)
@@ -0,0 +1,162 @@
+import logging
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import QuerySet
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TOKEN_PATTERN = re.compile(r'\w+')
+
+SQLITE_FTS_TABLE = 'learns_learn_fts'
+
+SQLITE_FTS_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+    f"content, content='learns_learn', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_insert AFTER INSERT ON learns_learn BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_delete AFTER DELETE ON learns_learn BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_update AFTER UPDATE ON learns_learn BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRES_SEARCH_CONFIG = 'english'
+POSTGRES_SEARCH_INDEX = 'learns_learn_content_search'
+
+
+def install_search_index(schema_editor) -> None:
+    """
+    Creates the full text index for learns on databases that support one. This is safe to run repeatedly, and must be
+    re-run by any migration that rebuilds the learns_learn table on SQLite, as that drops the table's triggers.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for statement in SQLITE_FTS_STATEMENTS:
+                schema_editor.execute(statement)
+        except Exception:
+            # SQLite was built without FTS5, searches will fall back to scanning the table
+            logger.warning('Unable to create the learns full text index, is FTS5 available?', exc_info=True)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_SEARCH_INDEX} ON learns_learn "
+            f"USING gin (to_tsvector('{POSTGRES_SEARCH_CONFIG}'::regconfig, COALESCE(content, '')))"
+        )
+
+
+def uninstall_search_index(schema_editor) -> None:
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {POSTGRES_SEARCH_INDEX}')
+
+
+class LearnSearchBackend(object):
+    """
+    Finds learns whose content matches a query, best matches first
+    """
+
+    def search(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        """
+        :param label: a normalized label to search within, or None to search every learn
+        """
+        raise NotImplementedError()
+
+
+class ScanLearnSearchBackend(LearnSearchBackend):
+    """
+    Substring matching with no index, for databases without full text search
+    """
+
+    def search(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        if label is not None:
+            learns = learns.filter(normalized_label=label)
+        return list(learns.filter(content__icontains=query).order_by('id')[:limit])
+
+
+class IndexedLearnSearchBackend(ScanLearnSearchBackend):
+    """
+    Searches a full text index. Queries without any words, like punctuation, can't be looked up in the index and are
+    matched as substrings instead. With LEARN_SEARCH_SUBSTRING_FALLBACK, so are queries that match nothing in the
+    index, eg part of a word, at the cost of scanning the whole table whenever a search finds nothing.
+    """
+
+    def search(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        if len(SEARCH_TOKEN_PATTERN.findall(query)) == 0:
+            return super().search(learns, query, label, limit)
+        results = self.search_index(learns, query, label, limit)
+        if len(results) == 0 and settings.LEARN_SEARCH_SUBSTRING_FALLBACK:
+            return super().search(learns, query, label, limit)
+        return results
+
+    def search_index(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        raise NotImplementedError()
+
+
+class SqliteLearnSearchBackend(IndexedLearnSearchBackend):
+    """
+    Searches the FTS5 index, matching each word of the query as a prefix and ranking results with bm25
+    """
+
+    def search_index(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        tokens = SEARCH_TOKEN_PATTERN.findall(query)
+        if len(tokens) == 0:
+            return []
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        sql = f'SELECT learn.id FROM {SQLITE_FTS_TABLE} ' \
+              f'JOIN learns_learn learn ON learn.id = {SQLITE_FTS_TABLE}.rowid ' \
+              f'WHERE {SQLITE_FTS_TABLE} MATCH %s'
+        params = [match]
+        if label is not None:
+            sql += ' AND learn.normalized_label = %s'
+            params.append(label)
+        sql += f' ORDER BY {SQLITE_FTS_TABLE}.rank, learn.id LIMIT %s'
+        params.append(limit)
+        with connections[learns.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+        found = learns.in_bulk(ids)
+        return [found[learn_id] for learn_id in ids if learn_id in found]
+
+
+class PostgresLearnSearchBackend(IndexedLearnSearchBackend):
+    """
+    Searches the tsvector GIN index, matching each word of the query as a prefix and ranking results with ts_rank
+    """
+
+    def search_index(self, learns: QuerySet, query: str, label: Optional[str], limit: int) -> List:
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        tokens = SEARCH_TOKEN_PATTERN.findall(query)
+        if len(tokens) == 0:
+            return []
+        search_query = SearchQuery(
+            ' & '.join(f"'{token}':*" for token in tokens),
+            config=POSTGRES_SEARCH_CONFIG,
+            search_type='raw',
+        )
+        vector = SearchVector('content', config=POSTGRES_SEARCH_CONFIG)
+        if label is not None:
+            learns = learns.filter(normalized_label=label)
+        learns = learns.annotate(search=vector, rank=SearchRank(vector, search_query)) \
+            .filter(search=search_query) \
+            .order_by('-rank', 'id')
+        return list(learns[:limit])
+
+
+@lru_cache(maxsize=None)
+def get_learn_search_backend() -> LearnSearchBackend:
+    if connection.vendor == 'sqlite' and SQLITE_FTS_TABLE in connection.introspection.table_names():
+        return SqliteLearnSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresLearnSearchBackend()
+    return ScanLearnSearchBackend()
@@ -1,6 +1,11 @@
+from unittest.mock import patch
+
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from learns.models import Learn
+from learns.models import Learn, LearnLabelCount
+from learns.search import get_learn_search_backend, SqliteLearnSearchBackend
 
 
 class LearnModelTestCase(TestCase):
@@ -8,3 +13,221 @@ class LearnModelTestCase(TestCase):
     def test_tostring(self):
         learn = Learn(label='foo', content='bar')
         self.assertEqual(str(learn), 'foo: "bar"')
+
+    def test_random_picks_with_a_single_query_once_ids_are_cached(self):
+        for i in range(5):
+            Learn.objects.add('foo', f'bar{i}')
+        Learn.objects.random('foo')
+
+        with self.assertNumQueries(1):
+            learn = Learn.objects.random('FOO')
+        self.assertEqual('foo', learn.label)
+
+    def test_adding_a_learn_extends_cached_ids(self):
+        Learn.objects.add('foo', 'bar')
+        self.assertEqual(1, len(Learn.objects.ids_for_label('foo')))
+        self.assertEqual(1, len(Learn.objects.ids_for_label()))
+
+        Learn.objects.add('foo', 'baz')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(2, len(Learn.objects.ids_for_label('foo')))
+            self.assertEqual(2, len(Learn.objects.ids_for_label()))
+
+    def test_learns_added_elsewhere_are_fetched_incrementally(self):
+        Learn.objects.add('foo', 'bar')
+        Learn.objects.ids_for_label('foo')
+        # Simulate an add made by another process by skipping the signals that update this process's cache
+        Learn.objects.bulk_create([Learn(label='foo', normalized_label='foo', content='baz')])
+
+        self.assertEqual(1, len(Learn.objects.ids_for_label('foo')))
+        with self.settings(LEARN_ID_REFRESH_INTERVAL=0), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(2, len(Learn.objects.ids_for_label('foo')))
+        self.assertEqual(1, len(queries.captured_queries))
+        self.assertIn('"id" >', queries.captured_queries[0]['sql'])
+
+    def test_random_skips_learns_relabelled_elsewhere(self):
+        Learn.objects.add('foo', 'bar')
+        Learn.objects.add('foo', 'baz')
+        Learn.objects.ids_for_label('foo')
+        Learn.objects.filter(content='bar').update(label='qux', normalized_label='qux')
+
+        for _ in range(5):
+            self.assertEqual('baz', Learn.objects.random('foo').content)
+
+    def test_relabelling_a_learn_drops_its_old_labels_ids(self):
+        Learn.objects.add('foo', 'bar')
+        Learn.objects.ids_for_label('foo')
+        learn = Learn.objects.get(content='bar')
+        learn.label = 'qux'
+        learn.save()
+
+        self.assertEqual((), Learn.objects.ids_for_label('foo'))
+        self.assertEqual((learn.id,), Learn.objects.ids_for_label('qux'))
+
+    def test_random_skips_learns_deleted_elsewhere(self):
+        Learn.objects.add('foo', 'bar')
+        Learn.objects.add('foo', 'baz')
+        Learn.objects.ids_for_label('foo')
+        # Simulate a delete made by another process by skipping the signals that invalidate this process's cache
+        Learn.objects.filter(content='bar')._raw_delete(Learn.objects.db)
+
+        for _ in range(5):
+            self.assertEqual('baz', Learn.objects.random('foo').content)
+
+    def test_random_for_an_empty_label_raises(self):
+        self.assertRaises(ValueError, lambda: Learn.objects.random('foo'))
+
+
+class LearnSearchTestCase(TestCase):
+
+    def setUp(self) -> None:
+        Learn.objects.add('foo', 'the quick brown fox')
+        Learn.objects.add('foo', 'a lazy dog')
+        Learn.objects.add('bar', 'fox fox fox')
+
+    def test_sqlite_uses_the_full_text_index(self):
+        self.assertIsInstance(get_learn_search_backend(), SqliteLearnSearchBackend)
+
+    def test_search_ranks_the_best_match_first(self):
+        results = Learn.objects.search('fox')
+        self.assertEqual(['fox fox fox', 'the quick brown fox'], [learn.content for learn in results])
+
+    def test_search_matches_word_prefixes(self):
+        results = Learn.objects.search('qui')
+        self.assertEqual(['the quick brown fox'], [learn.content for learn in results])
+
+    def test_search_within_a_label(self):
+        results = Learn.objects.search('fox', label='foo')
+        self.assertEqual(['the quick brown fox'], [learn.content for learn in results])
+
+    def test_search_is_capped(self):
+        for i in range(5):
+            Learn.objects.add('many', f'fox number {i}')
+
+        self.assertEqual(['fox number 0', 'fox number 1'],
+                         [learn.content for learn in Learn.objects.search('number', limit=2)])
+        with self.settings(LEARN_SEARCH_LIMIT=3):
+            self.assertEqual(3, len(Learn.objects.search('number')))
+
+    def test_index_follows_updates_and_deletes(self):
+        learn = Learn.objects.get(content='a lazy dog')
+        learn.content = 'a sleepy dog'
+        learn.save()
+        Learn.objects.filter(label='bar').delete()
+
+        self.assertEqual([], Learn.objects.search('lazy'))
+        self.assertEqual(['a sleepy dog'], [learn.content for learn in Learn.objects.search('sleepy')])
+        self.assertEqual(['the quick brown fox'], [learn.content for learn in Learn.objects.search('fox')])
+
+    def test_queries_without_words_match_substrings(self):
+        Learn.objects.add('foo', 'what?!')
+        self.assertEqual(['what?!'], [learn.content for learn in Learn.objects.search('?!')])
+
+    def test_parts_of_words_only_match_with_the_substring_fallback(self):
+        self.assertEqual([], Learn.objects.search('uick'))
+        with self.settings(LEARN_SEARCH_SUBSTRING_FALLBACK=True):
+            self.assertEqual(['the quick brown fox'], [learn.content for learn in Learn.objects.search('uick')])
+            self.assertEqual([], Learn.objects.search('uick', label='bar'))
+
+    def test_searches_without_a_match_do_not_scan_the_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([], Learn.objects.search('zzyzx'))
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries.captured_queries))
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual([], Learn.objects.search('"*'))
+        Learn.objects.add('foo', 'not so quick')
+        self.assertEqual(['not so quick'], [learn.content for learn in Learn.objects.search('NOT quick')])
+
+
+class LearnLabelCountTestCase(TestCase):
+
+    def setUp(self) -> None:
+        for i in range(3):
+            Learn.objects.add('foo', f'foo{i}')
+        for i in range(2):
+            Learn.objects.add('bar', f'bar{i}')
+        Learn.objects.add('baz', 'baz')
+
+    def test_counts_follow_adds(self):
+        self.assertEqual({'label': 'foo', 'total': 3}, Learn.objects.count_for_label('foo'))
+        self.assertEqual(
+            [{'label': 'foo', 'total': 3}, {'label': 'bar', 'total': 2}, {'label': 'baz', 'total': 1}],
+            list(Learn.objects.label_counts())
+        )
+
+    def test_counts_follow_deletes(self):
+        Learn.objects.filter(label='foo', content='foo0').delete()
+        Learn.objects.get(label='baz').delete()
+
+        self.assertEqual({'label': 'foo', 'total': 2}, Learn.objects.count_for_label('foo'))
+        self.assertIsNone(Learn.objects.count_for_label('baz'))
+
+    def test_counts_follow_relabels(self):
+        learn = Learn.objects.get(label='baz')
+        learn.label = 'bar'
+        learn.save()
+
+        self.assertEqual({'label': 'bar', 'total': 3}, Learn.objects.count_for_label('bar'))
+        self.assertIsNone(Learn.objects.count_for_label('baz'))
+
+    def test_relabels_do_not_read_the_learn_back(self):
+        learn = Learn.objects.get(label='baz')
+        learn.label = 'bar'
+        with CaptureQueriesContext(connection) as queries:
+            learn.save()
+
+        self.assertFalse(any(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+        self.assertEqual({'label': 'bar', 'total': 3}, Learn.objects.count_for_label('bar'))
+
+    def test_relabels_of_partially_loaded_learns_are_counted(self):
+        learn = Learn.objects.only('id', 'label').get(label='baz')
+        learn.label = 'bar'
+        learn.save()
+
+        self.assertEqual({'label': 'bar', 'total': 3}, Learn.objects.count_for_label('bar'))
+        self.assertIsNone(Learn.objects.count_for_label('baz'))
+
+    def test_relabels_are_saved_together_with_their_counts(self):
+        learn = Learn.objects.get(label='baz')
+        learn.label = 'bar'
+        with patch.object(LearnLabelCount.objects, 'increment', side_effect=DatabaseError('whoopsie')):
+            with self.assertRaises(DatabaseError):
+                learn.save()
+
+        self.assertEqual('baz', Learn.objects.get(pk=learn.pk).label)
+        self.assertEqual({'label': 'baz', 'total': 1}, Learn.objects.count_for_label('baz'))
+
+    def test_top_counts_are_a_single_query(self):
+        with self.assertNumQueries(1):
+            counts = list(Learn.objects.label_counts(minimum=2)[:10])
+        self.assertEqual(['foo', 'bar'], [lc['label'] for lc in counts])
+
+    def test_multiple_labels_are_a_single_query(self):
+        with self.assertNumQueries(1):
+            counts = Learn.objects.counts_for_labels(['bar', 'missing', 'foo'])
+        self.assertEqual([{'label': 'bar', 'total': 2}, {'label': 'foo', 'total': 3}], counts)
+
+
+class LearnLabelNormalizationTestCase(TestCase):
+
+    def test_labels_are_normalized_on_save(self):
+        learn = Learn.objects.create(label='FooBar', content='baz')
+        self.assertEqual('foobar', learn.normalized_label)
+        self.assertEqual('FooBar', learn.label)
+
+    def test_lookups_use_the_normalized_label(self):
+        self.assertIn('"normalized_label" = foo', str(Learn.objects.for_label('FOO').query))
+
+    def test_add_is_case_insensitive(self):
+        self.assertTrue(Learn.objects.add('Foo', 'bar'))
+        self.assertFalse(Learn.objects.add('foo', 'bar'))
+
+    def test_reads_and_writes_agree_on_case(self):
+        Learn.objects.add('Foo', 'bar')
+        Learn.objects.add('FOO', 'baz')
+
+        self.assertEqual({'label': 'foo', 'total': 2}, Learn.objects.count_for_label('fOo'))
+        self.assertEqual(2, Learn.objects.for_label('foo').count())
+        self.assertEqual(['baz'], [learn.content for learn in Learn.objects.search('baz', label='Foo')])
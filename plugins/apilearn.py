@@ -1,3 +1,5 @@
+from typing import List
+
 from frisky.events import MessageEvent
 from frisky.plugin import FriskyPlugin
 from frisky.responses import FriskyResponse
@@ -12,6 +14,9 @@ class ApiLearnPlugin(FriskyPlugin):
         '*': 'get_api',
     }
 
+    def handles_generic(self, command: str, args: List[str]) -> bool:
+        return ApiLearn.objects.filter(label=command).exists()
+
     def command_learnapi(self, message: MessageEvent) -> FriskyResponse:
         if len(message.args) == 2:
             label = message.args[0]
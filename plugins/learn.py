@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from frisky.events import ReactionEvent, MessageEvent
 from frisky.plugin import FriskyPlugin
@@ -30,6 +30,17 @@ class LearnPlugin(FriskyPlugin):
         '*': 'learn'
     }
 
+    def handles_generic(self, command: str, args: List[str]) -> bool:
+        if len(args) == 0:
+            # A random learn, or a random error if there are none
+            return len(Learn.objects.counts_for_labels([command.lstrip('@'), 'error'])) > 0
+        # An indexed learn, which answers even if there's no such learn
+        try:
+            int(args[0])
+            return True
+        except ValueError:
+            return False
+
     def reaction_brain(self, reaction: ReactionEvent) -> Optional[str]:
         if not reaction.message.channel.is_private and reaction.message.text is not None:
             return self.create_new_learn(reaction.message.username, reaction.message.text)
@@ -38,20 +49,14 @@ class LearnPlugin(FriskyPlugin):
     @staticmethod
     def command_learn_count(message: MessageEvent):
         if len(message.args) == 0:
-            learn_counts = Learn.objects.label_counts()
-            learn_counts = [lc for lc in learn_counts if lc["total"] > 1]
-            learn_counts = learn_counts[:10]
+            learn_counts = Learn.objects.label_counts(minimum=2)[:10]
         elif len(message.args) == 1:
             counts = Learn.objects.count_for_label(message.args[0])
             if counts is None:
                 return None
             return f'Count: {counts["total"]}'
         else:
-            learn_counts = []
-            for item in message.args:
-                counts = Learn.objects.count_for_label(item)
-                if counts is not None:
-                    learn_counts.append(counts)
+            learn_counts = Learn.objects.counts_for_labels(message.args)
 
         if len(learn_counts) == 0:
             return None
@@ -1,8 +1,6 @@
-import markovify
-
 from frisky.events import MessageEvent
 from frisky.plugin import FriskyPlugin
-from learns.models import Learn
+from learns.markov import make_sentence
 
 
 class MarkovPlugin(FriskyPlugin):
@@ -13,17 +11,4 @@ class MarkovPlugin(FriskyPlugin):
     }
 
     def command_markov(self, message: MessageEvent):
-        if len(message.args) > 0:
-            quotes = []
-            for item in message.args:
-                query = Learn.objects.for_label(item)
-                quotes.extend(list(query.values_list('content', flat=True)))
-        else:
-            query = Learn.objects.all()
-            quotes = list(query.values_list('content', flat=True))
-        text = '\n'.join(quotes)
-
-        text_model = markovify.NewlineText(text, well_formed=False)
-
-        sentence = text_model.make_sentence(tries=100)
-        return sentence
+        return make_sentence(message.args, tries=100)
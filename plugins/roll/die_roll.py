@@ -1,10 +1,17 @@
-import re
 from random import randint, normalvariate
 from dataclasses import dataclass
-from math import sqrt, erf, floor
+from math import sqrt, erf
 from typing import Optional
 
+from .distribution import dice_sum, has_exact_distribution
 from .roll_result import RollResult
+from .sampling import MAX_BULK_SIDES, bulk_roll
+
+# Up to this many dice are rolled one randint at a time, more than that are rolled in bulk
+MAX_SINGLE_ROLL_DICE = 1000
+
+# Up to this many dice are actually rolled, past that the total is drawn from a normal approximation
+MAX_ROLLED_DICE = 1000000
 
 def clamp(num: int, min_value: int, max_value: int) -> int:
     return max(min(num, max_value), min_value)
@@ -19,16 +26,12 @@ class DieRoll:
 
     @staticmethod
     def parse(msg: str) -> Optional['DieRoll']:
-        regex = re.compile(r'(\d+)?d(\d+)([+\-]\d+)?(q?)')
-        m = regex.match(msg)
-        if m is None:
+        from .expression import DiceExpressionError, parse_expression
+
+        try:
+            return parse_expression(msg).as_die_roll()
+        except DiceExpressionError:
             return None
-        return DieRoll(
-            dice = int(m.group(1) or 1),  # Default to rolling 1 die,
-            sides = int(m.group(2)),  # This is the only hard required value
-            modifier = int(m.group(3) or 0),  # Default to zero modifier
-            stats = m.group(4) != 'q',
-        )
 
     def mean(self) -> int:
         # https://boardgamegeek.com/blogpost/25470/variance-dice-sums
@@ -48,7 +51,14 @@ class DieRoll:
         return self.dice * one_dice_variance
 
 
+    def can_roll(self) -> bool:
+        if self.dice <= MAX_SINGLE_ROLL_DICE:
+            return True
+        return self.dice <= MAX_ROLLED_DICE and self.sides <= MAX_BULK_SIDES
+
     def regular_roll(self) -> int:
+        if self.dice > MAX_SINGLE_ROLL_DICE:
+            return bulk_roll(self.dice, self.sides) + self.modifier
         total = 0
         for i in range(0, self.dice):
             result = randint(1, self.sides)
@@ -65,35 +75,14 @@ class DieRoll:
         return clamp(round(result), self.sides, self.sides * self.dice) + self.modifier
 
 
-    def chance_dice_exactly_equals(self, n: int, k: int, cache = None) -> float:
-        # The computation is too slow without a cache
-        if cache == None:
-            cache = dict()
-        if n <= 1:
-            if k < 1 or k > self.sides: # You can't roll a 7 on a 6-sided die
-                return 0
-            return 1 / self.sides
-        else:
-            result = 0
-            for i in range(1, k - n + 2):
-                # we are looking for 'i' on the first dice
-                # and 'k - i' on the remaining dice
-                # if 'k - i' > (n - 1) * sides, this is zero
-                if k - i <= (n - 1) * self.sides:
-                    if (n - 1, k - i) not in cache:
-                        cache[(n - 1, k - i)] = self.chance_dice_exactly_equals(n - 1, k - i, cache)
-                    result += self.chance_dice_exactly_equals(1, i, cache) * cache[(n - 1, k - i)]
-            return result
+    def has_exact_odds(self) -> bool:
+        return has_exact_distribution(self.dice, self.sides)
 
 
     def cdf(self, r: float) -> float:
-        if self.sides <= 50 and self.dice <= 4:
-            r = floor(r)
-            result = 0
-            for i in range(1, int(r) + 1):
-                result += self.chance_dice_exactly_equals(self.dice, i)
-            return result
-            
+        if self.has_exact_odds():
+            return dice_sum(self.dice, self.sides).cdf(r)
+
         # Well, I think this method is clear to anyone who sees it.
         #
         # In case it's not, this is an approximation function for the probability
@@ -158,24 +147,27 @@ class DieRoll:
             return 1.0
         elif self.dice == 1:
             return 1 / self.sides
+        elif self.has_exact_odds():
+            return dice_sum(self.dice, self.sides).probability_eq(r)
         return self.cdf(r + 0.5) - self.cdf(r - 0.5)
 
 
     def roll(self) -> RollResult:
         try:
             s = 0
-            if self.dice > 10000:
-                s = self.probability_roll()
-            else:
+            rolled = self.can_roll()
+            if rolled:
                 s = self.regular_roll()
+            else:
+                s = self.probability_roll()
             return RollResult(
                 result = s,
                 is_minimum = (s == self.dice + self.modifier),
                 is_maximum = (s == self.dice * self.sides + self.modifier),
                 is_average = (s == self.mean()),
                 chance = self.probability_eq(s - self.modifier),
-                chance_ish = (self.sides > 50 or self.dice > 4) and self.dice != 1,
-                used_probability = self.dice > 10000,
+                chance_ish = not self.has_exact_odds() and self.dice > 1,
+                used_probability = not rolled,
                 overflow = False,
             )
         except OverflowError:
@@ -0,0 +1,64 @@
+from functools import lru_cache
+from math import comb, floor
+from typing import List
+
+# Exact odds are worked out for up to this many dice, with a highest possible total of at most MAX_EXACT_TOTAL. Past
+# that the roll falls back to a normal approximation, as the exact sums get slow to work out.
+MAX_EXACT_DICE = 500
+MAX_EXACT_TOTAL = 100000
+
+
+def has_exact_distribution(dice: int, sides: int) -> bool:
+    return 0 < dice <= MAX_EXACT_DICE and 0 < sides and dice * sides <= MAX_EXACT_TOTAL
+
+
+class DiceSum(object):
+    """
+    The exact distribution of the sum of a number of fair dice. The number of ways to roll at most r is found by
+    inclusion-exclusion over how many dice would have to roll above their sides:
+
+        sum over k of (-1)^k * C(dice, k) * C(r - k * sides, dice)
+
+    which is exact integer arithmetic, and needs at most `dice` terms however many sides the dice have.
+    """
+
+    def __init__(self, dice: int, sides: int) -> None:
+        self.dice = dice
+        self.sides = sides
+        self.minimum = dice
+        self.maximum = dice * sides
+        self.outcomes = sides ** dice
+        self.__choose: List[int] = [comb(dice, k) for k in range(dice + 1)]
+
+    def ways_at_most(self, r: int) -> int:
+        if r < self.minimum:
+            return 0
+        if r >= self.maximum:
+            return self.outcomes
+        if r - self.minimum > self.maximum - r:
+            # The distribution is symmetric, and the series is shorter from the nearer end
+            return self.outcomes - self.ways_at_most(self.minimum + self.maximum - r - 1)
+        total = 0
+        for k in range(min(self.dice, (r - self.dice) // self.sides) + 1):
+            term = self.__choose[k] * comb(r - k * self.sides, self.dice)
+            total += -term if k & 1 else term
+        return total
+
+    def ways(self, r: int) -> int:
+        if r < self.minimum or r > self.maximum:
+            return 0
+        return self.ways_at_most(r) - self.ways_at_most(r - 1)
+
+    def probability_eq(self, r: int) -> float:
+        return self.ways(r) / self.outcomes
+
+    def cdf(self, r: float) -> float:
+        """
+        :return: the chance of rolling at most r
+        """
+        return self.ways_at_most(floor(r)) / self.outcomes
+
+
+@lru_cache(maxsize=128)
+def dice_sum(dice: int, sides: int) -> DiceSum:
+    return DiceSum(dice, sides)
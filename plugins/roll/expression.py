@@ -0,0 +1,177 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from random import randint
+from typing import List, Optional, Tuple, Union
+
+from .die_roll import MAX_ROLLED_DICE, DieRoll
+
+# Dice that have to be looked at one at a time, to keep the highest or to explode them, are capped at this many
+MAX_INDIVIDUAL_DICE = 1000
+
+# An exploding die rolls again at most this many times
+MAX_EXPLOSIONS = 100
+
+# `6x 4d6` rolls 4d6 six times, up to this many times
+MAX_REPEATS = 100
+
+# A roll can add up at most this many dice and constants
+MAX_TERMS = 20
+
+REPEAT_PATTERN = re.compile(r'(\d+)x')
+
+TERM_PATTERN = re.compile(
+    r'(?P<sign>[+\-])'
+    r'(?:(?P<count>\d*)d(?P<sides>\d+)(?:k(?P<keep>[hl]?)(?P<kept>\d+))?(?P<explode>!)?|(?P<constant>\d+))'
+)
+
+
+class DiceExpressionError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Dice:
+    count: int
+    sides: int
+    keep: Optional[str] = None
+    kept: int = 0
+    explode: bool = False
+
+    @property
+    def is_plain(self) -> bool:
+        return self.keep is None and not self.explode
+
+    def roll_each(self) -> List[int]:
+        rolls = []
+        for _ in range(self.count):
+            roll = total = randint(1, self.sides)
+            explosions = 0
+            while self.explode and roll == self.sides and explosions < MAX_EXPLOSIONS:
+                roll = randint(1, self.sides)
+                total += roll
+                explosions += 1
+            rolls.append(total)
+        return rolls
+
+    def roll(self) -> int:
+        if self.is_plain:
+            return DieRoll(dice=self.count, sides=self.sides).regular_roll()
+        rolls = self.roll_each()
+        if self.keep is not None:
+            rolls = sorted(rolls, reverse=self.keep == 'h')[:self.kept]
+        return sum(rolls)
+
+
+Term = Union[Dice, int]
+
+
+@dataclass(frozen=True)
+class DiceExpression:
+    """
+    A parsed roll, such as `2d20+1d4+3`, `4d6kh3`, `3d6!` or `6x4d6`. Each term is a (sign, Dice or constant) pair.
+    """
+    terms: Tuple[Tuple[int, Term], ...]
+    repeat: int = 1
+    stats: bool = True
+
+    def as_die_roll(self) -> Optional[DieRoll]:
+        """
+        :return: this expression as a DieRoll, if it is a single plain roll of dice with a modifier, whose odds are known
+        """
+        dice = [(sign, term) for sign, term in self.terms if isinstance(term, Dice)]
+        if self.repeat != 1 or len(dice) != 1:
+            return None
+        sign, term = dice[0]
+        if sign < 0 or not term.is_plain:
+            return None
+        modifier = sum(sign * term for sign, term in self.terms if not isinstance(term, Dice))
+        return DieRoll(dice=term.count, sides=term.sides, modifier=modifier, stats=self.stats)
+
+    @property
+    def rolled_dice(self) -> int:
+        """
+        :return: how many dice have to actually be rolled, counting each repeat, to evaluate this expression
+        """
+        roll = self.as_die_roll()
+        if roll is not None:
+            # Too many plain dice to roll are approximated instead
+            return roll.dice if roll.can_roll() else 0
+        return self.repeat * sum(term.count for _, term in self.terms if isinstance(term, Dice))
+
+    def evaluate(self) -> List[int]:
+        """
+        :return: the total of each repeat of this roll
+        """
+        return [
+            sum(sign * (term.roll() if isinstance(term, Dice) else term) for sign, term in self.terms)
+            for _ in range(self.repeat)
+        ]
+
+
+def _parse_dice(match) -> Dice:
+    count = int(match.group('count') or 1)
+    sides = int(match.group('sides'))
+    keep = None
+    kept = 0
+    if match.group('kept') is not None:
+        keep = match.group('keep') or 'h'
+        kept = int(match.group('kept'))
+    dice = Dice(count=count, sides=sides, keep=keep, kept=kept, explode=match.group('explode') is not None)
+    if sides < 1:
+        raise DiceExpressionError(f"There's no such thing as a d{sides}")
+    if dice.explode and sides < 2:
+        raise DiceExpressionError(f'A d{sides} would explode forever')
+    if not dice.is_plain and count > MAX_INDIVIDUAL_DICE:
+        raise DiceExpressionError(f'Too many dice to keep or explode: {count}')
+    return dice
+
+
+@lru_cache(maxsize=1024)
+def parse_expression(text: str) -> DiceExpression:
+    """
+    Compile a roll into a DiceExpression. Parsed expressions are cached, so rolling the same thing again is cheap.
+    :raises DiceExpressionError: if text isn't a roll
+    """
+    text = text.lower()
+    stats = True
+    if text.endswith('q'):
+        text = text[:-1]
+        stats = False
+
+    repeat = 1
+    match = REPEAT_PATTERN.match(text)
+    if match is not None:
+        repeat = int(match.group(1))
+        text = text[match.end():]
+        if not 0 < repeat <= MAX_REPEATS:
+            raise DiceExpressionError(f'Can only repeat a roll from 1 to {MAX_REPEATS} times')
+
+    if not text.startswith(('+', '-')):
+        text = '+' + text
+    terms = []
+    position = 0
+    while position < len(text):
+        match = TERM_PATTERN.match(text, position)
+        if match is None:
+            raise DiceExpressionError(f'Unexpected {text[position:]}')
+        sign = -1 if match.group('sign') == '-' else 1
+        if match.group('constant') is not None:
+            terms.append((sign, int(match.group('constant'))))
+        else:
+            terms.append((sign, _parse_dice(match)))
+        position = match.end()
+        if len(terms) > MAX_TERMS:
+            raise DiceExpressionError(f'Can only add up to {MAX_TERMS} dice and numbers')
+
+    expression = DiceExpression(terms=tuple(terms), repeat=repeat, stats=stats)
+    dice = [term for _, term in terms if isinstance(term, Dice)]
+    if len(dice) == 0:
+        raise DiceExpressionError('Nothing to roll')
+    # A lone roll of plain dice can fall back to an approximation, anything else has to actually be rolled
+    if expression.as_die_roll() is None and not all(DieRoll(dice=term.count, sides=term.sides).can_roll()
+                                                    for term in dice):
+        raise DiceExpressionError('Those dice are too big to roll')
+    if expression.rolled_dice > MAX_ROLLED_DICE:
+        raise DiceExpressionError(f'Can only roll up to {MAX_ROLLED_DICE} dice at once')
+    return expression
@@ -5,10 +5,21 @@ from frisky.events import MessageEvent
 from frisky.plugin import FriskyPlugin
 from frisky.responses import FriskyResponse
 from .roll_result import RollResult
-from .die_roll import DieRoll
-
-def parse_dice_syntax(inputs: List[str]) -> List[DieRoll]:
-    return [DieRoll.parse(expr) for expr in inputs]
+from .die_roll import MAX_ROLLED_DICE
+from .expression import REPEAT_PATTERN, DiceExpressionError, parse_expression
+
+
+def join_repeats(inputs: List[str]) -> List[str]:
+    """
+    Join a repeat given as its own argument, like `6x 4d6`, onto the roll it repeats
+    """
+    result = []
+    for expr in inputs:
+        if len(result) > 0 and REPEAT_PATTERN.fullmatch(result[-1].lower()):
+            result[-1] += expr
+        else:
+            result.append(expr)
+    return result
 
 
 class RollPlugin(FriskyPlugin):
@@ -21,28 +32,35 @@ class RollPlugin(FriskyPlugin):
         return 'roll',
 
     def handle_message(self, message: MessageEvent) -> FriskyResponse:
-        parsed_rolls = []
-        args = []
         if len(message.args) == 0:
             # With no inputs, default to rolling 1d20
-            d20 = DieRoll(dice=1, sides=20)
-            roll = d20.roll().result
-
-            # place the D20 into parsed rolls
-            parsed_rolls = [DieRoll(dice=1, sides=20)]
             args = ["1d20"]
         else:
-            parsed_rolls = parse_dice_syntax(message.args)
-            args = message.args
+            args = join_repeats(message.args)
 
         results = []
         errors = []
         total = 0
         overflow = False
-        for expr, roll in zip(args, parsed_rolls):
-            if roll is None:
+        # Every roll in the message shares one budget of dice, so piling up arguments can't stall the bot either
+        rolled_dice = 0
+        for expr in args:
+            try:
+                expression = parse_expression(expr)
+            except DiceExpressionError:
                 errors.append(expr)
                 results.append('???')
+                continue
+            rolled_dice += expression.rolled_dice
+            if rolled_dice > MAX_ROLLED_DICE:
+                overflow = True
+                break
+            roll = expression.as_die_roll()
+            if roll is None:
+                # Anything fancier than NdS+M is rolled without working out its odds
+                totals = expression.evaluate()
+                total += sum(totals)
+                results.append(f"{', '.join(str(t) for t in totals)} on {expr}")
             else:
                 # We want a message in the format "1d4+1 and it's a 5" in the variable 'quiet'
                 result = roll.roll()
@@ -102,7 +120,7 @@ class RollPlugin(FriskyPlugin):
         errors_string = ', '.join(errors)
 
         total_string = ""
-        if len(parsed_rolls) > 1:
+        if len(args) > 1:
             total_string = f" for a total of {total}"
         message = f'{message.username} rolled {result_string}{total_string}'
         if errors_string:
@@ -0,0 +1,21 @@
+from random import choices
+
+# Dice are drawn in batches of this many, to keep memory flat however many are rolled
+BATCH_SIZE = 65536
+
+# random.choices picks faces by scaling a float, so it is only uniform for dice with up to 2^53 sides
+MAX_BULK_SIDES = 2 ** 53
+
+
+def bulk_roll(dice: int, sides: int) -> int:
+    """
+    Roll dice fair dice with the given number of sides and total them, drawing a batch at a time in C rather than one
+    randint call per die
+    """
+    faces = range(1, sides + 1)
+    total = 0
+    while dice > 0:
+        batch = min(dice, BATCH_SIZE)
+        total += sum(choices(faces, k=batch))
+        dice -= batch
+    return total
@@ -1,10 +1,9 @@
 from typing import Optional, Tuple
 
-import requests
-
 from frisky.events import MessageEvent
 from frisky.plugin import FriskyPlugin
 from frisky.responses import FriskyResponse
+from stonkgame.quotes import get_quote_service
 
 
 class StockPlugin(FriskyPlugin):
@@ -17,9 +16,6 @@ class StockPlugin(FriskyPlugin):
     def help_text(cls) -> Optional[str]:
         return 'Usage: ?stock $SYMBOL'
 
-    def format_url(self, symbol):
-        return f'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=1d&includePrePost=false&interval=2m'
-
     def format_money(self, money, currency):
         if currency == 'USD':
             if money >= 0:
@@ -40,22 +36,19 @@ class StockPlugin(FriskyPlugin):
             return self.help_text()
 
         symbol = message.args[0]
-        url = self.format_url(symbol)
-        response = requests.get(url)
-        if response.status_code == 200:
-            json = response.json()
-            result = json['chart']['result'][0]
-            currency = result['meta']['currency']
-            last_close = result['meta']['previousClose']
-            trades = result['indicators']['quote'][0]['close']
-            if len(trades):
-                last_trade = trades.pop()
-                daily_change = last_trade - last_close
-                percentage_change = 100 * daily_change / last_close
-                is_positive = daily_change > 0
-                return f'{self.get_chart_emoji(is_positive)}  {symbol} last traded at ' \
-                       f'{self.format_money(last_trade, currency)} ' \
-                       f'({self.format_money(daily_change, currency)} {percentage_change:.2f}%)'
-            else:
-                close_msg = f'{symbol} last closed at {self.format_money(last_close, currency)}'
-                return close_msg
+        quote = get_quote_service().get_quote(symbol)
+        if quote is None:
+            return None
+        currency = quote.currency
+        last_close = quote.previous_close
+        if quote.market_open:
+            last_trade = quote.last_trade
+            daily_change = last_trade - last_close
+            percentage_change = 100 * daily_change / last_close
+            is_positive = daily_change > 0
+            return f'{self.get_chart_emoji(is_positive)}  {symbol} last traded at ' \
+                   f'{self.format_money(last_trade, currency)} ' \
+                   f'({self.format_money(daily_change, currency)} {percentage_change:.2f}%)'
+        else:
+            close_msg = f'{symbol} last closed at {self.format_money(last_close, currency)}'
+            return close_msg
@@ -1,11 +1,14 @@
 from decimal import Decimal, InvalidOperation
 from operator import itemgetter
-from typing import Tuple
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
 
 from frisky.events import MessageEvent
 from frisky.plugin import FriskyPlugin
 from frisky.responses import FriskyResponse, Image
 from stonkgame.models import StonkGame, StonkPlayer
+from stonkgame.quotes import get_quote_service
 
 
 class StonkException(Exception):
@@ -81,24 +84,24 @@ class StonkGamePlugin(FriskyPlugin):
             'balance': game.starting_balance
         })
         if created:
+            self.__invalidate_leaderboard(channel_name)
             return f'Welcome to the stonk game, {player.username}. You have ${player.balance}'
         else:
             return f"You're already in the game, {player.username}"
 
     def get_stock_price(self, symbol) -> Tuple[str, Decimal, bool]:
-        url = f'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=1d&includePrePost=false&interval=2m'
-        response = self.http.get(url)
-        if response.status_code == 200:
-            json = response.json()
-            result = json['chart']['result'][0]
-            currency = result['meta']['currency']
-            last_close = result['meta']['previousClose']
-            trades = result['indicators']['quote'][0]['close']
-            if len(trades):
-                return currency, round(Decimal(trades.pop()), 2), True
-            else:
-                return currency, round(Decimal(last_close), 2), False
-        raise StonkException("I don't have any information for that stock")
+        quote = get_quote_service().get_quote(symbol)
+        if quote is None:
+            raise StonkException("I don't have any information for that stock")
+        return quote.currency, quote.price, quote.market_open
+
+    def get_stock_prices(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        symbols = set(symbol.upper() for symbol in symbols)
+        quotes = get_quote_service().get_quotes(symbols)
+        missing = symbols - quotes.keys()
+        if len(missing) > 0:
+            raise StonkException(f"I don't have any information for {', '.join(sorted(missing))}")
+        return {symbol: quote.price for symbol, quote in quotes.items()}
 
     def __balance(self, channel_name, username):
         game = StonkGame.objects.get(channel_name=channel_name)
@@ -107,17 +110,14 @@ class StonkGamePlugin(FriskyPlugin):
 
     def __prep_transaction(self, channel_name: str, username: str, symbol: str, amount: int):
         game = StonkGame.objects.get(channel_name=channel_name)
-        player = game.players.get(username=username)
+        player_id = game.players.values_list('id', flat=True).get(username=username)
         currency, stock_price, market_open = self.get_stock_price(symbol)
         if not market_open:
             raise StonkException('The market is closed, man.')
         if currency != 'USD':
             raise StonkException('I only do dollars!')
-        holding, created = player.holdings.get_or_create(symbol=symbol, defaults={
-            'amount': 0,
-        })
         price: Decimal = stock_price * amount
-        return player, holding, price
+        return player_id, price
 
     def __buy(self, channel_name: str, username: str, symbol: str, amount: int):
         if amount == 0:
@@ -125,20 +125,14 @@ class StonkGamePlugin(FriskyPlugin):
         if amount < 0:
             return "I don't do negatives"
         symbol = symbol.upper()
-        player, holding, price = self.__prep_transaction(channel_name, username, symbol, amount)
-        if player.balance < price:
-            if holding.amount == 0:
-                holding.delete()
-            return "You don't have enough cash"
+        player_id, price = self.__prep_transaction(channel_name, username, symbol, amount)
         if price == Decimal('0.00'):
-            if holding.amount == 0:
-                holding.delete()
             return "I don't deal in peasant stonks"
-        player.balance -= price
-        holding.amount += amount
-        player.save()
-        holding.save()
-        return f'Bought {amount} share of {symbol}. Current balance is: ${player.balance}'
+        balance = StonkPlayer.objects.buy(player_id, symbol, amount, price)
+        if balance is None:
+            return "You don't have enough cash"
+        self.__invalidate_leaderboard(channel_name)
+        return f'Bought {amount} share of {symbol}. Current balance is: ${balance}'
 
     def __sell(self, channel_name: str, username: str, symbol: str, amount: int):
         if amount == 0:
@@ -146,56 +140,61 @@ class StonkGamePlugin(FriskyPlugin):
         if amount < 0:
             return "I don't do negatives"
         symbol = symbol.upper()
-        player, holding, price = self.__prep_transaction(channel_name, username, symbol, amount)
-        if holding.amount < amount:
+        player_id, price = self.__prep_transaction(channel_name, username, symbol, amount)
+        balance = StonkPlayer.objects.sell(player_id, symbol, amount, price)
+        if balance is None:
             return "You don't have enough shares"
-        player.balance += price
-        holding.amount -= amount
-        player.save()
-        holding.save()
-        if holding.amount == 0:
-            holding.delete()
-        return f'Sold {amount} share of {symbol}. Current balance is: ${player.balance}'
+        self.__invalidate_leaderboard(channel_name)
+        return f'Sold {amount} share of {symbol}. Current balance is: ${balance}'
 
     def __portfolio(self, channel_name: str, username: str):
         game = StonkGame.objects.get(channel_name=channel_name)
-        player = game.players.get(username=username)
+        player = game.players.prefetch_related('holdings').get(username=username)
+        holdings = player.holdings.all()
+        prices = self.get_stock_prices([holding.symbol for holding in holdings])
         responses = [f'Total Holdings for {username}:']
         running_total = Decimal('0.00')
-        for holding in player.holdings.all():
-            currency, stock_price, _ = self.get_stock_price(holding.symbol)
+        for holding in holdings:
+            stock_price = prices[holding.symbol.upper()]
             total_value = stock_price * holding.amount
             responses += [f'{holding.amount} shares of {holding.symbol} (${stock_price}) total ${total_value}']
             running_total += total_value
         responses += [f'Total portfolio value: {running_total}. Cash on hand: {player.balance}']
         return '\n'.join(responses)
 
+    @staticmethod
+    def __leaderboard_key(channel_name: str) -> str:
+        return f'leaderboard:{channel_name}'
+
     def __leaderboard(self, channel_name: str):
-        def calculate_leaderboard(channel: str):
-            game = StonkGame.objects.get(channel_name=channel)
-            responses = [f'Leaderboard for the #{channel} game:']
+        def calculate_leaderboard():
+            game = StonkGame.objects.prefetch_related('players__holdings').get(channel_name=channel_name)
+            players = game.players.all()
+            stonk_prices = self.get_stock_prices(
+                holding.symbol for player in players for holding in player.holdings.all()
+            )
+            responses = [f'Leaderboard for the #{channel_name} game:']
             net_worths = []
-            stonk_prices = {}
-            for player in game.players.all():
+            for player in players:
                 net_worth = player.balance
                 for holding in player.holdings.all():
-                    if holding.symbol in stonk_prices:
-                        price = stonk_prices[holding.symbol]
-                    else:
-                        _, price, _ = self.get_stock_price(holding.symbol)
-                        stonk_prices[holding.symbol] = price
-                    net_worth += (price * holding.amount)
+                    net_worth += (stonk_prices[holding.symbol.upper()] * holding.amount)
                 net_worths.append((player.username, net_worth))
             net_worths = sorted(net_worths, key=itemgetter(1), reverse=True)
             for net_worth in net_worths:
                 responses += [f'{net_worth[0]}, with ${net_worth[1]}']
             return '\n'.join(responses)
-        return self.cacheify(calculate_leaderboard, channel_name)
+        return self.cache.get_or_set(self.__leaderboard_key(channel_name), calculate_leaderboard,
+                                     timeout=settings.STONKGAME_LEADERBOARD_TTL)
+
+    def __invalidate_leaderboard(self, channel_name: str) -> None:
+        self.cache.delete(self.__leaderboard_key(channel_name))
 
     def __declare(self, channel_name, username, param) -> FriskyResponse:
         if param == 'bankruptcy':
             game = StonkGame.objects.get(channel_name=channel_name)
             player = game.players.get(username=username)
             player.delete()
+            self.__invalidate_leaderboard(channel_name)
             return Image(url="https://i.redd.it/t0koevtqbsjz.jpg", alt_text="I didn't say it. I declared it.")
         return None
@@ -4,7 +4,14 @@ from typing import Optional, Tuple
 from frisky.events import ReactionEvent, MessageEvent
 from frisky.plugin import FriskyPlugin
 from frisky.responses import FriskyResponse
-from votes.models import Vote
+from votes.leaderboard import period_for
+from votes.models import Vote, PeriodVote
+
+# The month of each festive season, and the units votes are counted in during it
+FESTIVE_SEASONS = {
+    'halloween': (10, ('halloween candy', 'halloween candies')),
+    'christmas': (12, ('candy cane', 'candy canes')),
+}
 
 
 class VotesPlugin(FriskyPlugin):
@@ -15,16 +22,30 @@ class VotesPlugin(FriskyPlugin):
         '--': 'downvote',
     }
     reactions = ['upvote', 'downvote']
-    help = 'Usage: `?votes <thing>` to get the vote count for `thing`, :upvote: and :downvote: to vote'
+    help = 'Usage: `?votes <thing>` to get the vote count for `thing`, :upvote: and :downvote: to vote, ' \
+           '`?leaderboard [month|halloween|christmas]` for the top votes of all time or of a period'
 
     def __get_festive_score_unit(self) -> Tuple[str, str]:
         today = date.today()
-        if today.month == 10:
-            return 'halloween candy', 'halloween candies',
-        if today.month == 12:
-            return 'candy cane', 'candy canes'
+        for month, units in FESTIVE_SEASONS.values():
+            if today.month == month:
+                return units
         return 'friskypoint', 'friskypoints'
 
+    @staticmethod
+    def __get_period_start(name: str) -> Optional[date]:
+        """
+        :return: the first day of the month named by a ?leaderboard argument, festive seasons are their latest month
+        """
+        today = date.today()
+        if name == 'month':
+            return date(today.year, today.month, 1)
+        if name in FESTIVE_SEASONS:
+            month = FESTIVE_SEASONS[name][0]
+            year = today.year if today.month >= month else today.year - 1
+            return date(year, month, 1)
+        return None
+
     def __format_score(self, count):
         units = self.__get_festive_score_unit()
         if count == 1:
@@ -60,8 +81,14 @@ class VotesPlugin(FriskyPlugin):
             return self.__do_downvote(message.username, message.args[0])
 
     def command_leaderboard(self, message: MessageEvent) -> FriskyResponse:
-        votes = Vote.objects.order_by('-votes')[:10]
-        return '*Upvote Leaderboard*\n' + '\n'.join([f'{vote.label}: {vote.votes}' for vote in votes])
+        start = self.__get_period_start(message.args[0].lower()) if len(message.args) > 0 else None
+        if start is None:
+            title = 'Upvote Leaderboard'
+            leaderboard = Vote.objects.leaderboard()
+        else:
+            title = f'Upvote Leaderboard for {start:%B %Y}'
+            leaderboard = PeriodVote.objects.leaderboard(period_for(start))
+        return f'*{title}*\n' + '\n'.join([f'{label}: {votes}' for label, votes in leaderboard])
 
     def command_votes(self, message: MessageEvent) -> FriskyResponse:
         response = []
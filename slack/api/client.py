@@ -1,19 +1,41 @@
+from functools import lru_cache
 from typing import Optional
 
 import requests
 from django.conf import settings
 from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 
+from frisky.aio import run_in_thread_pool
 from slack.api.models import User, Conversation, Team, Message
 
 
+@lru_cache(maxsize=None)
+def get_slack_session() -> requests.Session:
+    """
+    A process-wide keep-alive session for talking to the Slack api, so that bursts of calls reuse warm connections
+    instead of opening a new TCP+TLS connection for every request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=settings.SLACK_API_POOL_CONNECTIONS,
+                          pool_maxsize=settings.SLACK_API_POOL_SIZE)
+    session.mount('https://', adapter)
+    return session
+
+
 class SlackApiClient(object):
     __access_token: str
     __enable_emergency_log: bool
+    __session: requests.Session
 
-    def __init__(self, access_token, enable_emergency_log=True):
+    def __init__(self, access_token, enable_emergency_log=True, session: Optional[requests.Session] = None):
         self.__access_token = access_token
         self.__enable_emergency_log = enable_emergency_log
+        self.__session = session or get_slack_session()
+
+    @staticmethod
+    def __timeout():
+        return settings.SLACK_API_CONNECT_TIMEOUT, settings.SLACK_API_READ_TIMEOUT
 
     def __headers(self):
         return {'Authorization': f'Bearer {self.__access_token}'}
@@ -22,7 +44,8 @@ class SlackApiClient(object):
         if len(kwargs) > 0:
             method += '?' + '&'.join([f'{key}={value}' for key, value in kwargs.items()])
 
-        response = requests.get(f'https://slack.com/api/{method}', headers=self.__headers()).json()
+        response = self.__session.get(f'https://slack.com/api/{method}', headers=self.__headers(),
+                                     timeout=self.__timeout()).json()
 
         if not response['ok']:
             self.emergency_log(response)
@@ -31,7 +54,8 @@ class SlackApiClient(object):
         return cls.create(response[key])
 
     def __post(self, method: str, **kwargs) -> bool:
-        response = requests.post(f'https://slack.com/api/{method}', json=kwargs, headers=self.__headers())
+        response = self.__session.post(f'https://slack.com/api/{method}', json=kwargs, headers=self.__headers(),
+                                      timeout=self.__timeout())
         return response.status_code == 200
 
     def __api_get_single_message(self, conversation_id, timestamp):
@@ -110,3 +134,32 @@ class SlackApiClient(object):
             self.__post('chat.postMessage',
                         channel=settings.FRISKY_LOGGING_CHANNEL,
                         text=f'```{message}```')
+
+
+@lru_cache(maxsize=128)
+def get_slack_client(access_token: str, enable_emergency_log: bool = True) -> SlackApiClient:
+    """
+    :return: a cached SlackApiClient for the given access token, backed by the shared keep-alive session
+    """
+    return SlackApiClient(access_token, enable_emergency_log=enable_emergency_log)
+
+
+class AsyncSlackApiClient(object):
+    """
+    An awaitable facade over SlackApiClient. Calls run on the event loop's thread pool and share the process-wide
+    keep-alive session, so many in-flight events can wait on Slack without each holding a connection of their own.
+    """
+
+    def __init__(self, client: SlackApiClient):
+        self.client = client
+
+    async def post_image(self, channel: Conversation, image_url: str, alt_text='Image') -> bool:
+        return await run_in_thread_pool(self.client.post_image)(channel, image_url, alt_text)
+
+    async def post_message(self, channel: Conversation, message: str) -> bool:
+        return await run_in_thread_pool(self.client.post_message)(channel, message)
+
+
+@lru_cache(maxsize=128)
+def get_async_slack_client(access_token: str, enable_emergency_log: bool = True) -> AsyncSlackApiClient:
+    return AsyncSlackApiClient(get_slack_client(access_token, enable_emergency_log))
@@ -5,7 +5,7 @@ import pytest
 import responses
 
 from app import settings
-from slack.api.client import SlackApiClient
+from slack.api.client import SlackApiClient, get_slack_client, get_slack_session
 from slack.api.models import Conversation, Message, User, Team
 
 URL = 'https://slack.com/api'
@@ -189,3 +189,24 @@ class TestClient:
             expected = {'channel': settings.FRISKY_LOGGING_CHANNEL, 'text': '```FUCK```'}
             assert 'Authorization' in rm.calls[0].request.headers
             assert json.loads(rm.calls[0].request.body) == expected
+
+
+class TestClientPooling:
+
+    def test_clients_are_cached_per_access_token(self):
+        assert get_slack_client('token-a') is get_slack_client('token-a')
+        assert get_slack_client('token-a') is not get_slack_client('token-b')
+
+    def test_clients_share_a_keep_alive_session(self):
+        session = get_slack_session()
+        assert session is get_slack_session()
+        assert session.get_adapter('https://slack.com/api/').poolmanager.connection_pool_kw['maxsize'] == \
+            settings.SLACK_API_POOL_SIZE
+
+    @pytest.mark.django_db
+    def test_requests_are_sent_with_a_timeout(self):
+        with responses.RequestsMock() as rm:
+            rm.add('POST', f'{URL}/chat.postMessage')
+            SlackApiClient('test-token').post_message(Conversation(id='test'), 'message')
+            assert rm.calls[0].request.req_kwargs['timeout'] == (settings.SLACK_API_CONNECT_TIMEOUT,
+                                                                  settings.SLACK_API_READ_TIMEOUT)
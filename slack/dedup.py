@@ -0,0 +1,103 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from slack.models import ProcessedEvent
+
+
+class EventDeduplicator(object):
+    """
+    Tracks which Slack Events API deliveries have been claimed for processing, so that retries and duplicate
+    deliveries across workers only do the work once.
+    """
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+
+    @staticmethod
+    def key(event_id: str) -> str:
+        return f'slack:event:{event_id}'
+
+    def claim(self, event_id: str) -> bool:
+        """
+        :return: True if this caller should process the event, False if it is a duplicate
+        """
+        raise NotImplementedError()
+
+    def release(self, event_id: str) -> None:
+        """
+        Give up a claim, eg because processing failed and a retry should be allowed to try again
+        """
+        raise NotImplementedError()
+
+
+class NoopEventDeduplicator(EventDeduplicator):
+
+    def claim(self, event_id: str) -> bool:
+        return True
+
+    def release(self, event_id: str) -> None:
+        pass
+
+
+class CacheEventDeduplicator(EventDeduplicator):
+    """
+    Claims events in one of CACHES. A cache that culls entries once it is full, like the database cache with its
+    default MAX_ENTRIES, will forget claims early and let duplicates through, so the cache should be large enough to
+    hold every event seen within the ttl.
+    """
+
+    def __init__(self, ttl: int, alias: str) -> None:
+        super().__init__(ttl)
+        self.alias = alias
+
+    def claim(self, event_id: str) -> bool:
+        return caches[self.alias].add(self.key(event_id), True, timeout=self.ttl)
+
+    def release(self, event_id: str) -> None:
+        caches[self.alias].delete(self.key(event_id))
+
+
+class RedisEventDeduplicator(EventDeduplicator):
+
+    def __init__(self, ttl: int, url: str) -> None:
+        super().__init__(ttl)
+        import redis
+        self.redis = redis.Redis.from_url(url)
+
+    def claim(self, event_id: str) -> bool:
+        return bool(self.redis.set(self.key(event_id), 1, nx=True, ex=self.ttl))
+
+    def release(self, event_id: str) -> None:
+        self.redis.delete(self.key(event_id))
+
+
+class DatabaseEventDeduplicator(EventDeduplicator):
+
+    def claim(self, event_id: str) -> bool:
+        return ProcessedEvent.objects.claim(event_id, self.ttl)
+
+    def release(self, event_id: str) -> None:
+        ProcessedEvent.objects.release(event_id)
+
+
+@lru_cache(maxsize=None)
+def _create_event_deduplicator(backend: str, ttl: int, cache_alias: str) -> EventDeduplicator:
+    if backend == 'none':
+        return NoopEventDeduplicator(ttl)
+    elif backend == 'cache':
+        return CacheEventDeduplicator(ttl, cache_alias)
+    elif backend == 'redis':
+        if settings.REDIS_URL is None:
+            raise ImproperlyConfigured('SLACK_EVENT_DEDUP_BACKEND is redis, but REDIS_URL is undefined')
+        return RedisEventDeduplicator(ttl, settings.REDIS_URL)
+    elif backend == 'database':
+        return DatabaseEventDeduplicator(ttl)
+    raise ImproperlyConfigured(f'Unknown SLACK_EVENT_DEDUP_BACKEND: {backend}')
+
+
+def get_event_deduplicator() -> EventDeduplicator:
+    return _create_event_deduplicator(settings.SLACK_EVENT_DEDUP_BACKEND, settings.SLACK_EVENT_DEDUP_TTL,
+                                      settings.SLACK_EVENT_DEDUP_CACHE)
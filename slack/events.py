@@ -1,11 +1,18 @@
+import logging
 from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Tuple
 
 from slack.errors import UnsupportedSlackEventTypeError
-from slack.processor import EventProperties
+
+logger = logging.getLogger(__name__)
+
+SUBTYPE_BLACKLIST = ['bot_message', 'message_replied']
 
 
 @dataclass
 class SlackEvent(object):
+    __slots__ = ('event_id', 'team_id', 'channel_id', 'user_id', 'event_ts')
+
     event_id: str
     team_id: str
     channel_id: str
@@ -15,6 +22,8 @@ class SlackEvent(object):
 
 @dataclass
 class ReactionAddedEvent(SlackEvent):
+    __slots__ = ('reaction', 'item_user_id', 'item_ts')
+
     reaction: str
     item_user_id: str
     item_ts: str
@@ -22,6 +31,8 @@ class ReactionAddedEvent(SlackEvent):
 
 @dataclass
 class ReactionRemovedEvent(SlackEvent):
+    __slots__ = ('reaction', 'item_user_id', 'item_ts')
+
     reaction: str
     item_user_id: str
     item_ts: str
@@ -29,11 +40,15 @@ class ReactionRemovedEvent(SlackEvent):
 
 @dataclass
 class MessageSentEvent(SlackEvent):
+    __slots__ = ('text',)
+
     text: str
 
 
 @dataclass
 class MessageChangedEvent(SlackEvent):
+    __slots__ = ('text', 'edited_user_id', 'edited_ts', 'previous_text', 'previous_user_id', 'previous_ts')
+
     text: str
     edited_user_id: str
     edited_ts: str
@@ -44,6 +59,8 @@ class MessageChangedEvent(SlackEvent):
 
 @dataclass
 class MessageDeletedEvent(SlackEvent):
+    __slots__ = ('deleted_ts', 'previous_text', 'previous_user_id', 'previous_ts')
+
     deleted_ts: str
     previous_text: str
     previous_user_id: str
@@ -52,85 +69,169 @@ class MessageDeletedEvent(SlackEvent):
 
 @dataclass
 class MessageRepliedEvent(SlackEvent):
+    __slots__ = ('text', 'thread_ts')
+
     user_id: str
     text: str
     thread_ts: str
 
 
-class SlackEventParser(object):
-
-    def parse_event(self, properties: EventProperties, payload: dict) -> SlackEvent:
-        if properties.event_type == 'message':
-            if properties.event_subtype == 'message_sent':
-                return MessageSentEvent(
-                    event_id=properties.event_id,
-                    team_id=properties.team_id,
-                    channel_id=properties.channel_id,
-                    user_id=properties.user_id,
-                    event_ts=payload['event_ts'],
-                    text=payload['text'],
-                )
-            elif properties.event_subtype == 'message_changed':
-                return MessageChangedEvent(
-                    event_id=properties.event_id,
-                    team_id=properties.team_id,
-                    channel_id=properties.channel_id,
-                    user_id=properties.user_id,
-                    event_ts=payload['event_ts'],
-                    text=payload['message']['text'],
-                    edited_user_id=payload['message']['edited']['user'],
-                    edited_ts=payload['message']['edited']['ts'],
-                    previous_text=payload['previous_message']['text'],
-                    previous_user_id=payload['previous_message']['user'],
-                    previous_ts=payload['previous_message']['ts']
-                )
-            elif properties.event_subtype == 'message_deleted':
-                return MessageDeletedEvent(
-                    event_id=properties.event_id,
-                    team_id=properties.team_id,
-                    channel_id=properties.channel_id,
-                    user_id=properties.user_id,
-                    event_ts=payload['event_ts'],
-                    deleted_ts=payload['deleted_ts'],
-                    previous_text=payload['previous_message']['text'],
-                    previous_user_id=payload['previous_message']['user'],
-                    previous_ts=payload['previous_message']['ts'],
-                )
-            elif properties.event_subtype == 'message_replied':
-                return MessageRepliedEvent(
-                    event_id=properties.event_id,
-                    team_id=properties.team_id,
-                    channel_id=properties.channel_id,
-                    user_id=properties.user_id,
-                    event_ts=payload['event_ts'],
-                    text=payload['message']['text'],
-                    thread_ts=payload['message']['thread_ts'],
-                )
+EventBuilder = Callable[[dict, dict], Optional[SlackEvent]]
+
+
+def _build_message_sent(payload: dict, event: dict) -> MessageSentEvent:
+    return MessageSentEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=event['channel'],
+        user_id=event['user'],
+        event_ts=event['event_ts'],
+        text=event['text'],
+    )
+
+
+def _build_message_changed(payload: dict, event: dict) -> Optional[MessageChangedEvent]:
+    message = event['message']
+    previous_message = event['previous_message']
+    # Slack also sends message_changed when it unfurls a link or a bot updates its own message, which has no editor
+    edited = message.get('edited')
+    if edited is None or message.get('user') is None or previous_message.get('user') is None:
+        logger.debug(f'Ignoring {payload.get("event_id")}, the message was not edited by a user')
+        return None
+    return MessageChangedEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=event['channel'],
+        user_id=message['user'],
+        event_ts=event['event_ts'],
+        text=message['text'],
+        edited_user_id=edited['user'],
+        edited_ts=edited['ts'],
+        previous_text=previous_message['text'],
+        previous_user_id=previous_message['user'],
+        previous_ts=previous_message['ts'],
+    )
+
+
+def _build_message_deleted(payload: dict, event: dict) -> Optional[MessageDeletedEvent]:
+    previous_message = event['previous_message']
+    # Messages posted by bots and integrations have a bot_id instead of a user
+    if previous_message.get('user') is None:
+        logger.debug(f'Ignoring {payload.get("event_id")}, the deleted message had no user')
+        return None
+    return MessageDeletedEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=event['channel'],
+        user_id=previous_message['user'],
+        event_ts=event['event_ts'],
+        deleted_ts=event['deleted_ts'],
+        previous_text=previous_message['text'],
+        previous_user_id=previous_message['user'],
+        previous_ts=previous_message['ts'],
+    )
+
+
+def _build_message_replied(payload: dict, event: dict) -> MessageRepliedEvent:
+    message = event['message']
+    return MessageRepliedEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=event['channel'],
+        user_id=message['user'],
+        event_ts=event['event_ts'],
+        text=message['text'],
+        thread_ts=message['thread_ts'],
+    )
+
+
+def _build_reaction_added(payload: dict, event: dict) -> ReactionAddedEvent:
+    item = event['item']
+    return ReactionAddedEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=item['channel'],
+        user_id=event['user'],
+        event_ts=event['event_ts'],
+        reaction=event['reaction'],
+        item_user_id=event['item_user'],
+        item_ts=item['ts'],
+    )
+
+
+def _build_reaction_removed(payload: dict, event: dict) -> ReactionRemovedEvent:
+    item = event['item']
+    return ReactionRemovedEvent(
+        event_id=payload['event_id'],
+        team_id=payload['team_id'],
+        channel_id=item['channel'],
+        user_id=event['user'],
+        event_ts=event['event_ts'],
+        reaction=event['reaction'],
+        item_user_id=event['item_user'],
+        item_ts=item['ts'],
+    )
+
+
+EVENT_BUILDERS: Dict[Tuple[str, Optional[str]], EventBuilder] = {
+    ('message', 'message_sent'): _build_message_sent,
+    ('message', 'message_changed'): _build_message_changed,
+    ('message', 'message_deleted'): _build_message_deleted,
+    ('message', 'message_replied'): _build_message_replied,
+    ('reaction_added', None): _build_reaction_added,
+    ('reaction_removed', None): _build_reaction_removed,
+}
+
+
+class SlackEventDecoder(object):
+    """
+    Decodes an Events API payload into a typed SlackEvent in a single pass, looking up the builder for the event's
+    (type, subtype) pair. Payloads that Frisky ignores are rejected before any other work is done.
+    """
+
+    def __init__(self, subtype_blacklist: Iterable[str] = SUBTYPE_BLACKLIST) -> None:
+        self.subtype_blacklist = frozenset(subtype_blacklist)
+
+    @staticmethod
+    def __get_subtype(event: dict) -> Optional[str]:
+        event_type = event['type']
+        if event_type != 'message':
+            return None
+        subtype = event.get('subtype')
+        if subtype is None:
+            """
+            From the documentation for message_replied:
+
+            Bug alert! This event is missing the subtype field when dispatched over the Events API.
+            Until it is fixed, examine message events' thread_ts value. When present, it's a reply.
+            To be doubly sure, compare a thread_ts to the top-level ts value, when they differ the
+            latter is a reply to the former.
+            """
+            thread_ts = event.get('message', {}).get('thread_ts')
+            if thread_ts is not None:
+                assert event['ts'] != thread_ts
+                subtype = 'message_replied'
             else:
-                # This is an event type we don't handle (yet)
-                raise UnsupportedSlackEventTypeError(event_type=f'message.{properties.event_subtype}')
-        elif properties.event_type == 'reaction_added':
-            return ReactionAddedEvent(
-                event_id=properties.event_id,
-                team_id=properties.team_id,
-                channel_id=properties.channel_id,
-                user_id=properties.user_id,
-                event_ts=payload['event_ts'],
-                reaction=payload['reaction'],
-                item_user_id=payload['item_user'],
-                item_ts=payload['item']['ts'],
-            )
-        elif properties.event_type == 'reaction_removed':
-            return ReactionRemovedEvent(
-                event_id=properties.event_id,
-                team_id=properties.team_id,
-                channel_id=properties.channel_id,
-                user_id=properties.user_id,
-                event_ts=payload['event_ts'],
-                reaction=payload['reaction'],
-                item_user_id=payload['item_user'],
-                item_ts=payload['item']['ts'],
-            )
-        else:
-            # This is an event type we don't handle (yet)
-            raise UnsupportedSlackEventTypeError(properties.event_type)
+                subtype = 'message_sent'
+        return subtype
+
+    def decode(self, payload: dict) -> Optional[SlackEvent]:
+        """
+        Returns the decoded event, or None if the event should be ignored
+        :raises UnsupportedSlackEventTypeError: if the event is of a type we don't handle (yet)
+        """
+        event = payload['event']
+        event_type = event['type']
+        subtype = self.__get_subtype(event)
+        if subtype in self.subtype_blacklist:
+            logger.debug(f'Ignoring {payload.get("event_id")}, subtype was in blacklist')
+            return None
+        if event_type in ('reaction_added', 'reaction_removed') and event.get('item_user') is None:
+            logger.debug(f'Ignoring {payload.get("event_id")}, it had no item_user')
+            return None
+        builder = EVENT_BUILDERS.get((event_type, subtype))
+        if builder is None:
+            if subtype is not None:
+                raise UnsupportedSlackEventTypeError(event_type=f'{event_type}.{subtype}')
+            raise UnsupportedSlackEventTypeError(event_type=event_type)
+        return builder(payload, event)
@@ -0,0 +1,50 @@
+import json
+import timeit
+
+from django.core.management import BaseCommand
+
+from slack import test_data
+from slack.errors import UnsupportedSlackEventTypeError
+from slack.events import SlackEventDecoder
+
+FIXTURES = [
+    'message_sent_payload',
+    'message_changed_payload',
+    'message_deleted_payload',
+    'message_replied_payload',
+    'reaction_event_payload',
+    'reaction_removed_payload',
+    'reaction_added_but_no_item_user_payload',
+    'user_joined_payload',
+]
+
+
+class Command(BaseCommand):
+    help = 'Times SlackEventDecoder.decode over the Events API payloads in slack.test_data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=100000,
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+        )
+
+    def handle(self, *args, **options):
+        decoder = SlackEventDecoder()
+        for name in FIXTURES:
+            payload = json.loads(getattr(test_data, name))
+
+            def decode():
+                try:
+                    decoder.decode(payload)
+                except UnsupportedSlackEventTypeError:
+                    pass
+
+            timings = timeit.repeat(decode, number=options['number'], repeat=options['repeat'])
+            best = min(timings) / options['number']
+            self.stdout.write(f'{name:<45} {best * 1e9:>10.0f} ns/decode')
@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import BaseCache, cache, caches
+
+from slack.api.models import Message
+from slack.events import SlackEvent, MessageSentEvent, MessageChangedEvent, MessageDeletedEvent
+
+
+class MessageStore(object):
+    """
+    Keeps the text of recent messages, fed by the message events Slack already sends us, so that reactions can find
+    the text of the message they were added to without a round trip to conversations.history
+    """
+
+    def __init__(self, store: BaseCache, ttl: int) -> None:
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(team_id: str, channel_id: str, ts: str) -> str:
+        return f'slack-message-text:{team_id}:{channel_id}:{ts}'
+
+    def get(self, team_id: str, channel_id: str, ts: str) -> Optional[str]:
+        return self.store.get(self.key(team_id, channel_id, ts))
+
+    def set(self, team_id: str, channel_id: str, ts: str, text: str) -> None:
+        self.store.set(self.key(team_id, channel_id, ts), text, timeout=self.ttl)
+
+    def delete(self, team_id: str, channel_id: str, ts: str) -> None:
+        self.store.delete(self.key(team_id, channel_id, ts))
+        # The api client keeps its own copy of messages it has looked up, which is now out of date
+        cache.delete(Message.create_key(channel_id, ts))
+
+    def record(self, event: SlackEvent) -> None:
+        if isinstance(event, MessageSentEvent):
+            if len(event.text) > 0:
+                self.set(event.team_id, event.channel_id, event.event_ts, event.text)
+        elif isinstance(event, MessageChangedEvent):
+            self.delete(event.team_id, event.channel_id, event.previous_ts)
+            if len(event.text) > 0:
+                self.set(event.team_id, event.channel_id, event.previous_ts, event.text)
+        elif isinstance(event, MessageDeletedEvent):
+            self.delete(event.team_id, event.channel_id, event.deleted_ts)
+
+
+@lru_cache(maxsize=None)
+def get_message_store() -> MessageStore:
+    return MessageStore(caches[settings.SLACK_MESSAGE_STORE_CACHE], settings.SLACK_MESSAGE_STORE_TTL)
@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.db import models, IntegrityError, transaction
+from django.utils import timezone
+
+
+# Expired events are purged at most once every this many seconds, by whichever claim comes along next
+PURGE_INTERVAL = 60
+
+_last_purge = 0.0
+
+
+class ProcessedEventManager(models.Manager):
+    def purge(self, ttl: int) -> int:
+        """
+        Delete every event claimed more than ttl seconds ago
+        :return: the number of events deleted
+        """
+        deleted, _ = self.get_queryset().filter(created__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+        return deleted
+
+    def __purge_if_due(self, ttl: int) -> None:
+        global _last_purge
+        now = time.monotonic()
+        if now - _last_purge >= PURGE_INTERVAL:
+            _last_purge = now
+            self.purge(ttl)
+
+    def __create(self, event_id: str) -> bool:
+        try:
+            with transaction.atomic():
+                self.create(event_id=event_id)
+        except IntegrityError:
+            return False
+        return True
+
+    def claim(self, event_id: str, ttl: int) -> bool:
+        """
+        Atomically record that event_id is being processed
+        :return: True if the claim was made, False if the event was already claimed within the last ttl seconds
+        """
+        self.__purge_if_due(ttl)
+        if self.__create(event_id):
+            return True
+        # The earlier claim may have expired since the last purge
+        expired = self.get_queryset().filter(event_id=event_id, created__lt=timezone.now() - timedelta(seconds=ttl))
+        deleted, _ = expired.delete()
+        return deleted > 0 and self.__create(event_id)
+
+    def release(self, event_id: str) -> None:
+        self.get_queryset().filter(event_id=event_id).delete()
+
+
+class ProcessedEvent(models.Model):
+    event_id = models.CharField(max_length=50, unique=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = ProcessedEventManager()
+
+    def __str__(self):
+        return f'Processed Slack Event {self.event_id}'
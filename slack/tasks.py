@@ -1,18 +1,19 @@
 import logging
+from typing import Optional
 
 from celery import shared_task
 from django.conf import settings
 
+from frisky.aio import run_in_thread_pool
+from frisky.bot import get_frisky
 from frisky.models import Workspace, Channel, Member
-from slack.events import SlackEventParser
-from slack.processor import SlackEventProcessor, EventProperties
+from slack.dedup import get_event_deduplicator
+from slack.events import SlackEvent, SlackEventDecoder, MessageChangedEvent, MessageDeletedEvent, MessageSentEvent
+from slack.messages import get_message_store
 from slack.wrapper import SlackWrapper
 
 logger = logging.getLogger(__name__)
 
-SUBTYPE_BLACKLIST = ['bot_message', 'message_changed', 'message_deleted', 'message_replied']
-
-
 def process_from_cli(workspace_name, channel_name, username, message):
     if not message.startswith(settings.FRISKY_PREFIX):
         message = f'{settings.FRISKY_PREFIX}{message}'
@@ -23,27 +24,81 @@ def process_from_cli(workspace_name, channel_name, username, message):
     wrapper.handle_cli(message)
 
 
-@shared_task
-def ingest_from_slack_events_api(payload: dict):
-    # First, parse out our common event properties
-    processor = SlackEventProcessor()
-    properties: EventProperties = processor.parse_event_properties(payload)
+def is_command(text: str) -> bool:
+    return get_frisky().is_command(SlackWrapper.normalize_quotes(text))
 
-    if properties.event_subtype in SUBTYPE_BLACKLIST:
-        return logger.debug(f'Ignoring {properties.event_id}, subtype was in blacklist')
-    elif properties.event_type in ('reaction_added', 'reaction_removed'):
-        if payload['event'].get('item_user', None) is None:
-            return logger.debug(f'Ignoring {properties.event_id}, it had no item_user')
 
+def _claim(payload: dict) -> Optional[SlackEvent]:
+    """
+    Decode the payload and claim the event for processing
+    :return: the event, or None if it is ignored or has already been processed
+    """
+    # First, decode the payload, this returns None for events we ignore
+    event = SlackEventDecoder().decode(payload)
+    if event is None:
+        return None
+
+    # Slack retries deliveries it thinks have failed, and may deliver an event to more than one worker
+    if not get_event_deduplicator().claim(event.event_id):
+        logger.debug(f'Ignoring {event.event_id}, it has already been processed')
+        return None
+    return event
+
+
+def _prepare(event: SlackEvent) -> Optional[SlackWrapper]:
+    """
+    Look up everything needed to handle a claimed event
+    :return: the wrapper to handle it with, or None if there is nothing more to do
+    """
     # Now, let's grab our rich Workspace objects
-    workspace = Workspace.objects.get_or_fetch_by_kind_and_id(Workspace.Kind.SLACK, properties.team_id)
-    channel = Channel.objects.get_or_fetch_by_workspace_and_id(workspace, properties.channel_id)
-    member = Member.objects.get_or_fetch_by_workspace_and_id(workspace, properties.user_id)
+    workspace = Workspace.objects.get_or_fetch_by_kind_and_id(Workspace.Kind.SLACK, event.team_id)
+    channel = Channel.objects.get_or_fetch_by_workspace_and_id(workspace, event.channel_id)
+
+    # We don't keep message contents for private channels
+    if not channel.is_private:
+        get_message_store().record(event)
+    if isinstance(event, (MessageChangedEvent, MessageDeletedEvent)):
+        # Edits and deletes are only used to keep the message store up to date
+        return None
+    if isinstance(event, MessageSentEvent) and not is_command(event.text):
+        # Skip looking up the sender, and resolving mentions, for messages that no plugin would answer
+        return None
+
+    member = Member.objects.get_or_fetch_by_workspace_and_id(workspace, event.user_id)
+    return SlackWrapper(workspace, channel, member)
+
+
+def _release(event: SlackEvent) -> None:
+    # Let a retry from Slack have another go at it
+    get_event_deduplicator().release(event.event_id)
+
+
+@shared_task
+def ingest_from_slack_events_api(payload: dict):
+    event = _claim(payload)
+    if event is None:
+        return
+    try:
+        wrapper = _prepare(event)
+        if wrapper is not None:
+            wrapper.handle_event(event)
+    except Exception:
+        _release(event)
+        raise
 
-    parser = SlackEventParser()
-    event = parser.parse_event(properties, payload['event'])
 
-    # Now, create the wrapper instance
-    wrapper = SlackWrapper(workspace, channel, member)
-    # And process the event
-    wrapper.handle_event(event)
+async def ingest_from_slack_events_api_async(payload: dict):
+    """
+    The async equivalent of ingest_from_slack_events_api, for use from the async events view. Only the event handling
+    itself is async, the lookups before it are the same as the sync version's and run on the thread pool.
+    """
+    event = await run_in_thread_pool(_claim)(payload)
+    if event is None:
+        return
+    try:
+        wrapper = await run_in_thread_pool(_prepare)(event)
+        if wrapper is not None:
+            await wrapper.ahandle_event(event)
+    except Exception:
+        await run_in_thread_pool(_release)(event)
+        raise
@@ -1,13 +1,19 @@
+import io
 import json
+import threading
+from datetime import timedelta
 from typing import Callable
 from unittest import mock
 from unittest.mock import MagicMock, PropertyMock, patch
 
 import responses
+from django.core.cache import caches
 from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
 from parameterized import parameterized
 
+from frisky.bot import get_frisky
 from frisky.events import ReactionEvent, MessageEvent
 from frisky.models import Member, Channel, Workspace
 from frisky.responses import Image
@@ -16,10 +22,11 @@ from .api.models import ReactionAdded, ReactionItem, MessageSent
 from .api.tests import URL
 from .api.tests import USER_OK
 from .errors import UnsupportedSlackEventTypeError
-from .events import SlackEventParser, MessageSentEvent, MessageChangedEvent, MessageDeletedEvent, MessageRepliedEvent, \
+from .messages import get_message_store
+from .models import ProcessedEvent
+from .events import SlackEventDecoder, MessageSentEvent, MessageChangedEvent, MessageDeletedEvent, MessageRepliedEvent, \
     ReactionAddedEvent, ReactionRemovedEvent, SlackEvent
-from .processor import SlackEventProcessor, EventProperties
-from .tasks import ingest_from_slack_events_api
+from .tasks import ingest_from_slack_events_api, ingest_from_slack_events_api_async
 from .test_data import *
 from .wrapper import SlackWrapper
 
@@ -168,84 +175,94 @@ class SlackApiModelsTestCase(TestCase):
         self.assertTrue(convo.is_im)
 
 
-class SlackEventProcessorTestCase(TestCase):
+class SlackEventDecoderTestCase(TestCase):
 
     def setUp(self) -> None:
-        self.processor = SlackEventProcessor()
+        self.decoder = SlackEventDecoder()
 
     @parameterized.expand([
-        ('reaction_added', None, reaction_added_but_no_item_user_payload),
-        ('message', 'message_sent', message_sent_payload),
-        ('reaction_added', None, reaction_event_payload),
-        ('message', 'message_changed', message_changed_payload),
-        ('message', 'message_deleted', message_deleted_payload),
-        ('message', 'message_replied', message_replied_payload),
+        (message_sent_payload, MessageSentEvent),
+        (reaction_event_payload, ReactionAddedEvent),
+        (reaction_removed_payload, ReactionRemovedEvent),
     ])
-    def test_parsing_event_properties(self, event_type, event_subtype, payload_str):
-        expected = EventProperties(
-            event_id='Ev0XXXXXXX',
-            team_id='TXXXXXXXX',
-            channel_id='C0XXXXXXX',
-            user_id='U0XXXXXXX',
-            event_type=event_type,
-            event_subtype=event_subtype,
-        )
-
+    def test_decoding_events(self, payload_str, expected_type):
         payload = json.loads(payload_str)
-        actual = self.processor.parse_event_properties(payload)
+        event = self.decoder.decode(payload)
 
-        self.assertEqual(expected, actual)
+        self.assertIsInstance(event, expected_type)
+        self.assertEqual('Ev0XXXXXXX', event.event_id)
+        self.assertEqual('TXXXXXXXX', event.team_id)
+        self.assertEqual('C0XXXXXXX', event.channel_id)
+        self.assertEqual('U0XXXXXXX', event.user_id)
 
     @parameterized.expand([
-        ('message.channel_join', user_joined_payload),
-        ('unsupported_event_type', unsupported_payload),
+        (message_changed_payload, MessageChangedEvent),
+        (message_deleted_payload, MessageDeletedEvent),
+        (message_replied_payload, MessageRepliedEvent),
     ])
-    def test_parsing_unsupported_events(self, event_type, event_payload):
-        payload = json.loads(event_payload)
-        with self.assertRaises(UnsupportedSlackEventTypeError) as cm:
-            self.processor.parse_event_properties(payload)
-            self.assertEqual(event_type, cm.exception.event_type)
-
+    def test_decoding_message_subtypes_when_not_blacklisted(self, payload_str, expected_type):
+        decoder = SlackEventDecoder(subtype_blacklist=[])
+        payload = json.loads(payload_str)
+        event = decoder.decode(payload)
 
-class SlackEventParserTestCase(TestCase):
-    def setUp(self) -> None:
-        self.parser = SlackEventParser()
+        self.assertIsInstance(event, expected_type)
+        self.assertEqual('Ev0XXXXXXX', event.event_id)
+        self.assertEqual('TXXXXXXXX', event.team_id)
+        self.assertEqual('C0XXXXXXX', event.channel_id)
+        self.assertEqual('U0XXXXXXX', event.user_id)
 
     @parameterized.expand([
-        (message_sent_payload, 'message', 'message_sent', MessageSentEvent),
-        (message_changed_payload, 'message', 'message_changed', MessageChangedEvent),
-        (message_deleted_payload, 'message', 'message_deleted', MessageDeletedEvent),
-        (message_replied_payload, 'message', 'message_replied', MessageRepliedEvent),
-        (reaction_event_payload, 'reaction_added', None, ReactionAddedEvent),
-        (reaction_removed_payload, 'reaction_removed', None, ReactionRemovedEvent),
+        (message_replied_payload,),
+        (reaction_added_but_no_item_user_payload,),
     ])
-    def test_parsing_message_sent(self, payload_str, event_type, event_subtype, expected_type):
+    def test_ignored_events_decode_to_none(self, payload_str):
         payload = json.loads(payload_str)
-        event_payload = payload['event']
-
-        properties = MagicMock()
-        type(properties).event_type = PropertyMock(return_value=event_type)
-        type(properties).event_subtype = PropertyMock(return_value=event_subtype)
-
-        event = self.parser.parse_event(properties, event_payload)
-
-        self.assertIsInstance(event, expected_type)
-        self.assertEqual(properties.event_id, event.event_id)
-        self.assertEqual(properties.team_id, event.team_id)
-        self.assertEqual(properties.channel_id, event.channel_id)
-        self.assertEqual(properties.user_id, event.user_id)
+        self.assertIsNone(self.decoder.decode(payload))
+
+    def test_unfurled_links_decode_to_none(self):
+        decoder = SlackEventDecoder(subtype_blacklist=[])
+        payload = json.loads(message_changed_payload)
+        del payload['event']['message']['edited']
+        self.assertIsNone(decoder.decode(payload))
+
+    def test_changes_to_bot_messages_decode_to_none(self):
+        decoder = SlackEventDecoder(subtype_blacklist=[])
+        payload = json.loads(message_changed_payload)
+        del payload['event']['message']['user']
+        del payload['event']['previous_message']['user']
+        payload['event']['message']['bot_id'] = 'B0XXXXXXX'
+        self.assertIsNone(decoder.decode(payload))
+
+    def test_deleted_bot_messages_decode_to_none(self):
+        decoder = SlackEventDecoder(subtype_blacklist=[])
+        payload = json.loads(message_deleted_payload)
+        del payload['event']['previous_message']['user']
+        payload['event']['previous_message']['bot_id'] = 'B0XXXXXXX'
+        self.assertIsNone(decoder.decode(payload))
+
+    def test_blacklisted_subtypes_are_rejected_before_decoding(self):
+        payload = {'event_id': 'Ev0XXXXXXX', 'event': {'type': 'message', 'subtype': 'bot_message'}}
+        self.assertIsNone(self.decoder.decode(payload))
 
     @parameterized.expand([
-        ('message', 'user_joined'),
-        ('asdf', None),
+        ('message.channel_join', user_joined_payload),
+        ('unsupported_event_type', unsupported_payload),
     ])
-    def test_unsupported_event_parsing(self, event_type, event_subtype):
-        properties = MagicMock()
-        type(properties).event_type = PropertyMock(return_value=event_type)
-        type(properties).event_subtype = PropertyMock(return_value=event_subtype)
+    def test_decoding_unsupported_events(self, event_type, event_payload):
+        payload = json.loads(event_payload)
+        with self.assertRaises(UnsupportedSlackEventTypeError) as cm:
+            self.decoder.decode(payload)
+        self.assertEqual(event_type, cm.exception.event_type)
 
-        with self.assertRaises(UnsupportedSlackEventTypeError):
-            self.parser.parse_event(properties, {})
+    def test_decoded_events_do_not_have_an_instance_dict(self):
+        event = self.decoder.decode(json.loads(message_sent_payload))
+        self.assertFalse(hasattr(event, '__dict__'))
+
+    def test_benchmark_command_times_every_fixture(self):
+        out = io.StringIO()
+        call_command('benchmark_event_decoder', '--number', '1', '--repeat', '1', stdout=out)
+        self.assertIn('message_sent_payload', out.getvalue())
+        self.assertIn('ns/decode', out.getvalue())
 
 
 class SlackEventProcessingTestCase(TestCase):
@@ -261,6 +278,7 @@ class SlackEventProcessingTestCase(TestCase):
                                            real_name='Second User')
 
     @responses.activate
+    @patch('slack.tasks.is_command', new=lambda text: True)
     @patch('slack.wrapper.SlackWrapper.handle_event')
     def test_processing_message_event(self, handle_event):
         expected = MessageSentEvent(event_id='Ev0XXXXXXX', team_id='TXXXXXXXX', channel_id='C0XXXXXXX',
@@ -281,6 +299,75 @@ class SlackEventProcessingTestCase(TestCase):
 
         handle_event.assert_called_once_with(expected)
 
+    @responses.activate
+    @patch('slack.tasks.is_command', new=lambda text: True)
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_processing_a_duplicate_delivery(self, handle_event):
+        event = json.loads(message_sent_payload)
+        ingest_from_slack_events_api(event)
+        ingest_from_slack_events_api(event)
+
+        handle_event.assert_called_once()
+
+    @responses.activate
+    @patch('slack.tasks.is_command', new=lambda text: True)
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_processing_a_duplicate_delivery_with_the_database_backend(self, handle_event):
+        event = json.loads(message_sent_payload)
+        with self.settings(SLACK_EVENT_DEDUP_BACKEND='database'):
+            ingest_from_slack_events_api(event)
+            ingest_from_slack_events_api(event)
+
+        handle_event.assert_called_once()
+        self.assertTrue(ProcessedEvent.objects.filter(event_id='Ev0XXXXXXX').exists())
+
+    def test_claiming_an_event_purges_expired_events(self):
+        ProcessedEvent.objects.create(event_id='Ev0OLD')
+        ProcessedEvent.objects.filter(event_id='Ev0OLD').update(created=timezone.now() - timedelta(hours=2))
+        with patch('slack.models._last_purge', 0.0):
+            self.assertTrue(ProcessedEvent.objects.claim('Ev0NEW', 3600))
+
+        self.assertFalse(ProcessedEvent.objects.filter(event_id='Ev0OLD').exists())
+
+    def test_expired_claims_can_be_claimed_again_before_a_purge(self):
+        ProcessedEvent.objects.create(event_id='Ev0OLD')
+        ProcessedEvent.objects.filter(event_id='Ev0OLD').update(created=timezone.now() - timedelta(hours=2))
+        with patch('slack.models._last_purge', float('inf')):
+            self.assertTrue(ProcessedEvent.objects.claim('Ev0OLD', 3600))
+            self.assertFalse(ProcessedEvent.objects.claim('Ev0OLD', 3600))
+
+    @responses.activate
+    @patch('slack.tasks.is_command', new=lambda text: True)
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_failed_processing_can_be_retried(self, handle_event):
+        handle_event.side_effect = [RuntimeError('whoopsie'), None]
+        event = json.loads(message_sent_payload)
+        with self.assertRaises(RuntimeError):
+            ingest_from_slack_events_api(event)
+        ingest_from_slack_events_api(event)
+
+        self.assertEqual(2, handle_event.call_count)
+
+    @patch('slack.tasks._prepare')
+    async def test_async_ingest_shares_the_sync_lookups(self, prepare):
+        prepare.return_value.ahandle_event = mock.AsyncMock()
+        with self.settings(SLACK_EVENT_DEDUP_BACKEND='none'):
+            await ingest_from_slack_events_api_async(json.loads(message_sent_payload))
+
+        event = prepare.call_args.args[0]
+        self.assertIsInstance(event, MessageSentEvent)
+        prepare.return_value.ahandle_event.assert_awaited_once_with(event)
+
+    @responses.activate
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    @patch('frisky.models.Member.objects.get_or_fetch_by_workspace_and_id')
+    def test_chatter_is_dropped_before_looking_up_the_sender(self, get_member, handle_event):
+        event = json.loads(message_sent_payload)
+        ingest_from_slack_events_api(event)
+
+        get_member.assert_not_called()
+        handle_event.assert_not_called()
+
     @responses.activate
     @patch('slack.wrapper.SlackWrapper.handle_event')
     def test_processing_user_joined(self, handle_event):
@@ -323,6 +410,72 @@ class SlackEventProcessingTestCase(TestCase):
         handle_message.assert_not_called()
 
 
+class MessageStoreTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.workspace = Workspace.objects.create(kind=Workspace.Kind.SLACK, team_id='TXXXXXXXX', name='Testing',
+                                                  domain='testing', access_token='xoxo-my_secret_token')
+        self.channel = Channel.objects.create(workspace=self.workspace, channel_id='C0XXXXXXX', name='general',
+                                              is_channel=True, is_group=False, is_private=False, is_im=False)
+        self.user = Member.objects.create(workspace=self.workspace, user_id='U0XXXXXXX', name='testuser',
+                                          real_name='Test User')
+        self.store = get_message_store()
+
+    def test_messages_are_not_stored_in_the_default_cache(self):
+        self.assertIsNot(caches['default'], self.store.store)
+
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_sent_messages_are_stored(self, handle_event):
+        ingest_from_slack_events_api(json.loads(message_sent_payload))
+
+        self.assertEqual('Live long and prospect.', self.store.get('TXXXXXXXX', 'C0XXXXXXX', '1355517523.XXXXXX'))
+
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_edited_messages_are_updated(self, handle_event):
+        self.store.set('TXXXXXXXX', 'C0XXXXXXX', '1622000000.002500', 'ping ping')
+
+        ingest_from_slack_events_api(json.loads(message_changed_payload))
+
+        self.assertEqual('nice', self.store.get('TXXXXXXXX', 'C0XXXXXXX', '1622000000.002500'))
+        handle_event.assert_not_called()
+
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_deleted_messages_are_removed(self, handle_event):
+        self.store.set('TXXXXXXXX', 'C0XXXXXXX', '1622000000.002500', 'nice')
+
+        ingest_from_slack_events_api(json.loads(message_deleted_payload))
+
+        self.assertIsNone(self.store.get('TXXXXXXXX', 'C0XXXXXXX', '1622000000.002500'))
+        handle_event.assert_not_called()
+
+    @patch('slack.wrapper.SlackWrapper.handle_event')
+    def test_messages_in_private_channels_are_not_stored(self, handle_event):
+        self.channel.is_private = True
+        self.channel.save()
+
+        ingest_from_slack_events_api(json.loads(message_sent_payload))
+
+        self.assertIsNone(self.store.get('TXXXXXXXX', 'C0XXXXXXX', '1355517523.XXXXXX'))
+
+    @responses.activate
+    def test_reactions_read_stored_messages_without_calling_the_api(self):
+        self.store.set('TXXXXXXXX', 'C0XXXXXXX', '123', 'stored text')
+        wrapper = SlackWrapper(self.workspace, self.channel, self.user)
+
+        self.assertEqual('stored text', wrapper.get_message_text('123'))
+        self.assertEqual(0, len(responses.calls))
+
+    @responses.activate
+    def test_reactions_fall_back_to_the_api_and_store_the_result(self):
+        responses.add('GET', f'{URL}/conversations.history?channel=C0XXXXXXX&oldest=123&latest=123'
+                             '&inclusive=true&limit=1', message)
+        wrapper = SlackWrapper(self.workspace, self.channel, self.user)
+
+        expected = 'I find you punny and would like to smell your nose letter'
+        self.assertEqual(expected, wrapper.get_message_text('123'))
+        self.assertEqual(expected, self.store.get('TXXXXXXXX', 'C0XXXXXXX', '123'))
+
+
 class SlackWrapperTestCase(TestCase):
 
     def setUp(self) -> None:
@@ -347,6 +500,51 @@ class SlackWrapperTestCase(TestCase):
         result = self.wrapper.replace_usernames('<@W012A3CDE> is a jerk')
         self.assertEqual('spengler is a jerk', result)
 
+    def test_username_substitution_resolves_all_mentions_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = self.wrapper.replace_usernames('<@W012A3CDE> and <@W012A3CDF> and <@W012A3CDE> again')
+        self.assertEqual('spengler and spangles and spengler again', result)
+        self.assertEqual(self.second_user, self.wrapper.users['W012A3CDF'])
+
+    @responses.activate
+    def test_username_substitution_fetches_unknown_members(self):
+        responses.add('GET', f'{URL}/users.info?user=W0NEWUSER', body=USER_OK)
+        result = self.wrapper.replace_usernames('<@W0NEWUSER> meet <@W012A3CDF>')
+        self.assertEqual('spengler meet spangles', result)
+        self.assertTrue(Member.objects.filter(workspace=self.workspace, user_id='W0NEWUSER').exists())
+
+    @responses.activate
+    def test_username_substitution_keeps_members_inserted_concurrently(self):
+        def insert_while_fetching(request):
+            # Another worker inserts the member while we are fetching it from the api
+            Member.objects.create(workspace=self.workspace, user_id='W0NEWUSER', name='winner', real_name='Winner')
+            return 200, {}, USER_OK
+
+        responses.add_callback('GET', f'{URL}/users.info', callback=insert_while_fetching)
+        result = self.wrapper.replace_usernames('<@W0NEWUSER> meet <@W012A3CDF>')
+        self.assertEqual('winner meet spangles', result)
+        self.assertEqual(1, Member.objects.filter(workspace=self.workspace, user_id='W0NEWUSER').count())
+
+    @responses.activate
+    async def test_async_handle_event_replies_through_the_async_client(self):
+        responses.add(responses.POST, f'{URL}/chat.postMessage')
+        event = MessageSentEvent(event_id="E123", team_id=self.workspace.team_id, channel_id=self.channel.channel_id,
+                                 user_id=self.user.user_id, event_ts="12345.67890", text="?ping")
+
+        await self.wrapper.ahandle_event(event)
+
+        self.assertEqual(b'{"channel": "123", "text": "pong"}', responses.calls[0].request.body)
+
+    async def test_async_handle_event_without_prefix_does_not_get_sent_to_frisky(self):
+        event = MessageSentEvent(event_id="E123", team_id=self.workspace.team_id, channel_id=self.channel.channel_id,
+                                 user_id=self.user.user_id, event_ts="12345.67890", text="Hello, World")
+        mock_frisky = MagicMock(wraps=get_frisky())
+        self.wrapper.frisky = mock_frisky
+
+        await self.wrapper.ahandle_event(event)
+
+        mock_frisky.ahandle_message.assert_not_called()
+
     def test_handle_message(self):
         expected = MessageEvent(
             workspace=self.workspace,
@@ -368,6 +566,8 @@ class SlackWrapperTestCase(TestCase):
 
         try:
             patcher.start()
+            # ?I isn't a command, but let it through to check the event that gets built
+            self.wrapper.is_command = lambda text: True
             self.wrapper.handle_message(MessageSent(
                 channel='123',
                 user='W012A3CDE',
@@ -535,7 +735,7 @@ class SlackWrapperTestCase(TestCase):
     def test_handle_message_without_prefix_does_not_get_sent_to_frisky(self):
         event = MessageSentEvent(event_id="E123", team_id=self.workspace.team_id, channel_id=self.channel.channel_id,
                                  user_id=self.user.user_id, event_ts="12345.67890", text="Hello, World")
-        mock_frisky = MagicMock()
+        mock_frisky = MagicMock(wraps=get_frisky())
         self.wrapper.frisky = mock_frisky
         mock_handle_message = MagicMock()
         mock_frisky.handle_message = mock_handle_message
@@ -554,7 +754,7 @@ class SlackWrapperTestCase(TestCase):
     @responses.activate
     def test_handle_message_called_directly_without_prefix_does_not_get_sent_to_frisky(self):
         event = MessageSent("", "", "Hi There", "", "", "")
-        mock_frisky = MagicMock()
+        mock_frisky = MagicMock(wraps=get_frisky())
         self.wrapper.frisky = mock_frisky
         mock_handle_message = MagicMock()
         mock_frisky.handle_message = mock_handle_message
@@ -728,6 +928,78 @@ class SlackViewsTestCase(TestCase):
         self.assertEqual(200, response.status_code)
         process_slack_event.assert_called_once_with(payload_dict)
 
+    @patch('slack.views.get_worker_pool')
+    def test_message_payload_with_worker_pool_submits_to_the_pool(self, get_worker_pool):
+        payload_dict = json.loads(event_payload)
+        get_worker_pool.return_value.submit.return_value = True
+        with self.settings(ENABLE_CELERY_QUEUE=False, ENABLE_WORKER_POOL=True):
+            response = self.client.post(
+                self.EVENTS_URL,
+                data=event_payload,
+                content_type='application/json',
+            )
+        self.assertEqual(200, response.status_code)
+        get_worker_pool.return_value.submit.assert_called_once_with(ingest_from_slack_events_api, payload_dict)
+
+    @patch('slack.views.ingest_from_slack_events_api')
+    @patch('slack.views.get_worker_pool')
+    def test_message_payload_with_full_worker_pool_is_processed_after_response(self, get_worker_pool,
+                                                                               process_slack_event):
+        payload_dict = json.loads(event_payload)
+        get_worker_pool.return_value.submit.return_value = False
+        with self.settings(ENABLE_CELERY_QUEUE=False, ENABLE_WORKER_POOL=True):
+            response = self.client.post(
+                self.EVENTS_URL,
+                data=event_payload,
+                content_type='application/json',
+            )
+        self.assertEqual(200, response.status_code)
+        process_slack_event.assert_called_once_with(payload_dict)
+
+    @patch('slack.views.ingest_from_slack_events_api_async', new_callable=mock.AsyncMock)
+    async def test_message_payload_to_async_view_is_processed_in_the_background(self, process_slack_event):
+        payload_dict = json.loads(event_payload)
+        processed = threading.Event()
+        process_slack_event.side_effect = lambda payload: processed.set()
+        response = await self.async_client.post(
+            f'{self.EVENTS_URL}async/',
+            data=event_payload,
+            content_type='application/json',
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(processed.wait(5))
+        process_slack_event.assert_awaited_once_with(payload_dict)
+
+    @patch('slack.views.ingest_from_slack_events_api_async', new_callable=mock.AsyncMock)
+    def test_message_payload_to_async_view_is_processed_when_served_over_wsgi(self, process_slack_event):
+        processed = threading.Event()
+        process_slack_event.side_effect = lambda payload: processed.set()
+        response = self.client.post(
+            f'{self.EVENTS_URL}async/',
+            data=event_payload,
+            content_type='application/json',
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(processed.wait(5))
+
+    async def test_async_view_only_accepts_posts(self):
+        response = await self.async_client.get(f'{self.EVENTS_URL}async/')
+        self.assertEqual(405, response.status_code)
+
+    @responses.activate
+    @patch('slack.views.ingest_from_slack_events_api')
+    def test_retried_payload_is_accepted(self, process_slack_event):
+        payload_dict = json.loads(event_payload)
+        with self.settings(ENABLE_CELERY_QUEUE=False):
+            response = self.client.post(
+                self.EVENTS_URL,
+                data=event_payload,
+                content_type='application/json',
+                HTTP_X_SLACK_RETRY_NUM='1',
+            )
+        self.assertEqual(200, response.status_code)
+        process_slack_event.assert_called_once_with(payload_dict)
+
     @responses.activate
     def test_message_payload_without_celery_calls_into_processor(self):
         responses.add(responses.GET, 'https://slack.com/api/team.info?team=TXXXXXXXX', slack_team_ok)
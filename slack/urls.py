@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .views import SlackEvent
+from .views import SlackEvent, slack_events_async
 
 urlpatterns = [
     path('events/', SlackEvent.as_view()),
+    path('events/async/', slack_events_async),
 ]
@@ -3,12 +3,14 @@ import hmac
 import json
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotAllowed
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
+from frisky.aio import run_in_background
 from frisky.friskyhttp import PostProcessingResponse
-from slack.tasks import ingest_from_slack_events_api
+from frisky.workers import get_worker_pool
+from slack.tasks import ingest_from_slack_events_api, ingest_from_slack_events_api_async
 
 
 class SlackEvent(View):
@@ -26,12 +28,12 @@ class SlackEvent(View):
                 return HttpResponse(form_data['challenge'])
             else:
                 return HttpResponse(status=404)
-        elif 'X-Slack-Retry-Num' in request.headers:
-            return HttpResponse(status=200)
         elif form_data['type'] == 'event_callback':
             if settings.ENABLE_CELERY_QUEUE:
                 ingest_from_slack_events_api.delay(form_data)
                 return HttpResponse(status=200)
+            elif settings.ENABLE_WORKER_POOL and get_worker_pool().submit(ingest_from_slack_events_api, form_data):
+                return HttpResponse(status=200)
             else:
                 return PostProcessingResponse(
                     status=200,
@@ -55,3 +57,28 @@ class SlackEvent(View):
             return True
         else:
             return False
+
+
+async def slack_events_async(request):
+    """
+    An async version of the SlackEvent view. The event is processed on a long-lived background event loop after the
+    response is sent, so a single process can have many events in flight while they wait on Slack or third-party apis,
+    whether Frisky is served through app.asgi or app.wsgi.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    form_data = json.loads(request.body.decode())
+    if form_data['type'] == 'url_verification':
+        if SlackEvent.verify_slack_request(request):
+            return HttpResponse(form_data['challenge'])
+        else:
+            return HttpResponse(status=404)
+    elif form_data['type'] == 'event_callback':
+        run_in_background(ingest_from_slack_events_api_async(form_data))
+        return HttpResponse(status=200)
+    else:
+        return HttpResponse(status=404)
+
+
+# csrf_exempt() would wrap this in a synchronous function, hiding that the view is async from Django
+slack_events_async.csrf_exempt = True
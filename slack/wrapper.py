@@ -2,15 +2,16 @@ import logging
 import re
 from typing import Optional
 
-from django.conf import settings
 
-from frisky.bot import Frisky
+from frisky.aio import run_in_thread_pool
+from frisky.bot import get_frisky
 from frisky.events import MessageEvent, ReactionEvent
 from frisky.models import Workspace, Channel, Member
 from frisky.responses import FriskyResponse, Image
-from slack.api.client import SlackApiClient
+from slack.api.client import get_slack_client, get_async_slack_client
 from slack.api.models import Conversation, ReactionAdded, MessageSent
 from slack.events import SlackEvent, ReactionAddedEvent, ReactionRemovedEvent, MessageSentEvent
+from slack.messages import get_message_store
 
 logger = logging.getLogger(__name__)
 
@@ -19,41 +20,52 @@ class SlackWrapper:
     USER_ID_PATTERN = re.compile(r'<@(?P<user_id>\w+)>')
 
     def __init__(self, workspace: Workspace, channel: Channel, sender: Member):
-        self.frisky = Frisky(
-            name=settings.FRISKY_NAME,
-            prefix=settings.FRISKY_PREFIX,
-            ignored_channels=settings.FRISKY_IGNORED_CHANNELS,
-        )
+        self.frisky = get_frisky()
         self.workspace = workspace
         self.channel = channel
         self.sender = sender
         self.users = {
             sender.user_id: sender,
         }
-        self.slack_api_client = SlackApiClient(self.workspace.access_token)
+        self.slack_api_client = get_slack_client(self.workspace.access_token)
+        self.async_slack_api_client = get_async_slack_client(self.workspace.access_token)
 
     def replace_usernames(self, input_string) -> str:
-        updated_string: str = input_string
-        for user_id in re.findall(self.USER_ID_PATTERN, input_string):
-            user = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, user_id)
-            updated_string = updated_string.replace(f'<@{user_id}>', user.name)
-            self.users[user_id] = user
-        return updated_string
+        user_ids = self.USER_ID_PATTERN.findall(input_string)
+        if len(user_ids) == 0:
+            return input_string
+        users = Member.objects.get_or_fetch_many_by_workspace_and_ids(self.workspace, user_ids)
+        self.users.update(users)
+        return self.USER_ID_PATTERN.sub(lambda match: users[match.group('user_id')].name, input_string)
+
+    @staticmethod
+    def normalize_quotes(text: str) -> str:
+        return text.replace('“', '"').replace('”', '"')
 
     def clean_message_text(self, text: Optional[str]) -> Optional[str]:
         if text is None:
             return None
-        text = text.replace('“', '"').replace('”', '"')
+        text = self.normalize_quotes(text)
         text = self.replace_usernames(text)
         return text
 
+    def is_command(self, text: str) -> bool:
+        return self.frisky.is_command(self.normalize_quotes(text))
+
     def reply(self, response: FriskyResponse) -> bool:
-        slack_api_client = SlackApiClient(self.workspace.access_token)
         if isinstance(response, str):
-            return slack_api_client.post_message(Conversation(id=self.channel.channel_id), response)
+            return self.slack_api_client.post_message(Conversation(id=self.channel.channel_id), response)
+        if isinstance(response, Image):
+            return self.slack_api_client.post_image(Conversation(id=self.channel.channel_id), response.url,
+                                                    response.alt_text)
+        return False
+
+    async def areply(self, response: FriskyResponse) -> bool:
+        if isinstance(response, str):
+            return await self.async_slack_api_client.post_message(Conversation(id=self.channel.channel_id), response)
         if isinstance(response, Image):
-            return slack_api_client.post_image(Conversation(id=self.channel.channel_id), response.url,
-                                               response.alt_text)
+            return await self.async_slack_api_client.post_image(Conversation(id=self.channel.channel_id),
+                                                                response.url, response.alt_text)
         return False
 
     def construct_frisky_message_event(self, message_text, override_sender: Optional[Member] = None) -> MessageEvent:
@@ -74,24 +86,7 @@ class SlackWrapper:
         receiving_user = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, event.item_user)
         was_added = event.type == 'reaction_added'
 
-        if self.channel.is_private:
-            # We don't grab message contents for private channels
-            message_text = None
-        else:
-            message = self.slack_api_client.get_message(self.channel.channel_id, event.item.ts)
-            if message is not None:
-                if len(message.text) > 0:
-                    # Message contains text
-                    message_text = message.text
-                elif message.files is not None and len(message.files) > 0:
-                    # Message has no text, but it does have attachments. Maybe revisit this
-                    message_text = message.files[0].permalink
-                else:
-                    # Somehow we have a message, but no text or attachments. Weird.
-                    message_text = None
-            else:
-                # Unable to find message from the api, leave it blank
-                message_text = None
+        message_text = self.get_message_text(event.item.ts)
 
         return ReactionEvent(
             workspace=self.workspace,
@@ -108,16 +103,24 @@ class SlackWrapper:
         )
 
     def get_message_text(self, timestamp) -> Optional[str]:
-        if not self.channel.is_private:
-            message = self.slack_api_client.get_message(self.channel.channel_id, timestamp)
-            if message is not None:
-                if len(message.text) > 0:
-                    # Message contains text
-                    return message.text
-                elif message.files is not None and len(message.files) > 0:
-                    # Message has no text, but it does have attachments. Maybe revisit this
-                    return message.files[0].permalink
-        return None
+        if self.channel.is_private:
+            # We don't grab message contents for private channels
+            return None
+        message_store = get_message_store()
+        message_text = message_store.get(self.workspace.team_id, self.channel.channel_id, timestamp)
+        if message_text is not None:
+            return message_text
+        message = self.slack_api_client.get_message(self.channel.channel_id, timestamp)
+        if message is not None:
+            if len(message.text) > 0:
+                # Message contains text
+                message_text = message.text
+            elif message.files is not None and len(message.files) > 0:
+                # Message has no text, but it does have attachments. Maybe revisit this
+                message_text = message.files[0].permalink
+        if message_text is not None:
+            message_store.set(self.workspace.team_id, self.channel.channel_id, timestamp, message_text)
+        return message_text
 
     def create_frisky_reaction_added_event(self, event: ReactionAddedEvent) -> ReactionEvent:
         item_user = Member.objects.get_or_fetch_by_workspace_and_id(self.workspace, event.item_user_id)
@@ -158,7 +161,7 @@ class SlackWrapper:
         )
 
     def handle_message(self, event: MessageSent):
-        if not event.text.startswith(settings.FRISKY_PREFIX):
+        if not self.is_command(event.text):
             return
         self.frisky.handle_message(
             self.construct_frisky_message_event(event.text),
@@ -173,10 +176,9 @@ class SlackWrapper:
 
     def handle_cli(self, command):
         event = self.construct_frisky_message_event(command)
-        slack_api_client = SlackApiClient(self.workspace.access_token)
         for reply in self.frisky.handle_message_synchronously(event):
             if reply is not None:
-                slack_api_client.post_message(Conversation(id=self.channel.channel_id), reply)
+                self.slack_api_client.post_message(Conversation(id=self.channel.channel_id), reply)
 
     def handle_raw(self, text):
         message = self.construct_frisky_message_event(text)
@@ -194,7 +196,7 @@ class SlackWrapper:
                 reply_channel=lambda response: self.reply(response)
             )
         elif isinstance(event, MessageSentEvent):
-            if not event.text.startswith(settings.FRISKY_PREFIX):
+            if not self.is_command(event.text):
                 return
             self.frisky.handle_message(
                 self.construct_frisky_message_event(event.text),
@@ -202,3 +204,22 @@ class SlackWrapper:
             )
         else:
             logger.warning(f"Asked to handle an unsupported event type: {type(event)}")
+
+    async def ahandle_event(self, event: SlackEvent):
+        """
+        The async equivalent of handle_event. Building the Frisky event touches the database and the Slack api, so it
+        runs on a thread pool, as do the plugins themselves.
+        """
+        if isinstance(event, ReactionAddedEvent):
+            reaction = await run_in_thread_pool(self.create_frisky_reaction_added_event)(event)
+            await self.frisky.ahandle_reaction(reaction, reply_channel=self.areply)
+        elif isinstance(event, ReactionRemovedEvent):
+            reaction = await run_in_thread_pool(self.create_frisky_reaction_removed_event)(event)
+            await self.frisky.ahandle_reaction(reaction, reply_channel=self.areply)
+        elif isinstance(event, MessageSentEvent):
+            if not await run_in_thread_pool(self.is_command)(event.text):
+                return
+            message = await run_in_thread_pool(self.construct_frisky_message_event)(event.text)
+            await self.frisky.ahandle_message(message, reply_channel=self.areply)
+        else:
+            logger.warning(f"Asked to handle an unsupported event type: {type(event)}")
@@ -1,4 +1,8 @@
-from django.db import models
+from decimal import Decimal
+from typing import Optional
+
+from django.db import models, transaction
+from django.db.models import F
 
 
 class StonkGame(models.Model):
@@ -9,11 +13,52 @@ class StonkGame(models.Model):
         return f'StonkGame in #{self.channel_name}'
 
 
+class StonkPlayerManager(models.Manager):
+    """
+    Trades run in one transaction each, and start with a conditional UPDATE of the player's row. That row stays locked
+    until the trade commits, so concurrent trades by the same player run one after another and can never overdraw the
+    balance or sell shares that are no longer held.
+    """
+
+    def __balance(self, player_id: int) -> Decimal:
+        return self.filter(id=player_id).values_list('balance', flat=True).get()
+
+    def buy(self, player_id: int, symbol: str, amount: int, price: Decimal) -> Optional[Decimal]:
+        """
+        Exchange price from the player's balance for amount shares of symbol
+        :return: the player's new balance, or None if they can't afford it
+        """
+        with transaction.atomic(using=self.db):
+            if self.filter(id=player_id, balance__gte=price).update(balance=F('balance') - price) == 0:
+                return None
+            holdings = StonkHolding.objects.using(self.db).filter(player_id=player_id, symbol=symbol)
+            if holdings.update(amount=F('amount') + amount) == 0:
+                StonkHolding.objects.using(self.db).create(player_id=player_id, symbol=symbol, amount=amount)
+            return self.__balance(player_id)
+
+    def sell(self, player_id: int, symbol: str, amount: int, price: Decimal) -> Optional[Decimal]:
+        """
+        Exchange amount shares of symbol for price, removing the holding once it is empty
+        :return: the player's new balance, or None if they don't have enough shares
+        """
+        with transaction.atomic(using=self.db):
+            # The player's row is locked first, as in buy(), so that concurrent trades can't deadlock
+            self.filter(id=player_id).update(balance=F('balance') + price)
+            holdings = StonkHolding.objects.using(self.db).filter(player_id=player_id, symbol=symbol)
+            if holdings.filter(amount__gte=amount).update(amount=F('amount') - amount) == 0:
+                transaction.set_rollback(True, using=self.db)
+                return None
+            holdings.filter(amount=0).delete()
+            return self.__balance(player_id)
+
+
 class StonkPlayer(models.Model):
     game = models.ForeignKey(StonkGame, related_name='players', on_delete=models.CASCADE)
     username = models.CharField(max_length=50)
     balance = models.DecimalField(max_digits=19, decimal_places=2)
 
+    objects = StonkPlayerManager()
+
     def __str__(self):
         return f'StonkPlayer @{self.username} in #{self.game.channel_name} with ${self.balance}'
 
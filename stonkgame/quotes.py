@@ -0,0 +1,120 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from frisky.cache import IdentityCache
+
+logger = logging.getLogger(__name__)
+
+CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=1d&includePrePost=false&interval=2m'
+
+quote_cache = IdentityCache(settings.STOCK_QUOTE_CACHE_SIZE, settings.STOCK_QUOTE_CACHE_TTL)
+
+
+class Quote(object):
+    __slots__ = ('symbol', 'currency', 'previous_close', 'last_trade')
+
+    def __init__(self, symbol: str, currency: str, previous_close: float, last_trade: Optional[float]) -> None:
+        self.symbol = symbol
+        self.currency = currency
+        self.previous_close = previous_close
+        self.last_trade = last_trade
+
+    @property
+    def market_open(self) -> bool:
+        return self.last_trade is not None
+
+    @property
+    def price(self) -> Decimal:
+        """
+        :return: the last trade, or the last close while the market is closed, to the cent
+        """
+        return round(Decimal(self.last_trade if self.market_open else self.previous_close), 2)
+
+    @classmethod
+    def from_chart(cls, symbol: str, json: dict) -> 'Quote':
+        result = json['chart']['result'][0]
+        trades = result['indicators']['quote'][0]['close']
+        return cls(
+            symbol,
+            result['meta']['currency'],
+            result['meta']['previousClose'],
+            trades[-1] if len(trades) else None,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_quote_session() -> requests.Session:
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=settings.STOCK_QUOTE_POOL_SIZE))
+    return session
+
+
+class QuoteService(object):
+    """
+    Looks up stock quotes from the Yahoo chart api. Quotes are cached per symbol for a short time, and a batch of
+    symbols is fetched concurrently over one pooled session, so a portfolio costs about as much as its slowest quote.
+    """
+
+    def __init__(self, session: requests.Session, cache: IdentityCache, max_workers: int) -> None:
+        self.session = session
+        self.cache = cache
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stock-quote')
+
+    @staticmethod
+    def __timeout():
+        return settings.STOCK_QUOTE_CONNECT_TIMEOUT, settings.STOCK_QUOTE_READ_TIMEOUT
+
+    def __fetch(self, symbol: str) -> Optional[Quote]:
+        try:
+            response = self.session.get(CHART_URL.format(symbol=symbol), timeout=self.__timeout())
+            if response.status_code != 200:
+                return None
+            quote = Quote.from_chart(symbol, response.json())
+        except (requests.RequestException, ValueError, LookupError, TypeError) as err:
+            logger.warning(f'Unable to fetch a quote for {symbol}', exc_info=err)
+            return None
+        self.cache.set(symbol, quote)
+        return quote
+
+    def get_quote(self, symbol: str) -> Optional[Quote]:
+        """
+        :return: the quote for symbol, or None if there isn't one
+        """
+        symbol = symbol.upper()
+        quote = self.cache.get(symbol)
+        if quote is None:
+            quote = self.__fetch(symbol)
+        return quote
+
+    def get_quotes(self, symbols: Iterable[str]) -> Dict[str, Quote]:
+        """
+        :return: the quotes for each of symbols, keyed by upper case symbol, leaving out any symbol without a quote
+        """
+        quotes = {}
+        missing = []
+        for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+            quote = self.cache.get(symbol)
+            if quote is None:
+                missing.append(symbol)
+            else:
+                quotes[symbol] = quote
+        if len(missing) == 1:
+            fetched = [self.__fetch(missing[0])]
+        else:
+            fetched = self.__executor.map(self.__fetch, missing)
+        for symbol, quote in zip(missing, fetched):
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
+
+
+@lru_cache(maxsize=None)
+def get_quote_service() -> QuoteService:
+    return QuoteService(get_quote_session(), quote_cache, settings.STOCK_QUOTE_POOL_SIZE)
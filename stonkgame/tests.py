@@ -1,3 +1,123 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import requests
+import responses
 from django.test import TestCase
 
-# Create your tests here.
+from frisky.cache import IdentityCache
+from stonkgame.models import StonkGame, StonkHolding, StonkPlayer
+from stonkgame.quotes import QuoteService, get_quote_session
+
+GME = 'https://query1.finance.yahoo.com/v8/finance/chart/GME'
+TSLA = 'https://query1.finance.yahoo.com/v8/finance/chart/TSLA'
+BB = 'https://query1.finance.yahoo.com/v8/finance/chart/BB'
+
+
+def chart(previous_close, *trades):
+    return {
+        'chart': {
+            'result': [{
+                'meta': {'currency': 'USD', 'previousClose': previous_close},
+                'indicators': {'quote': [{'close': list(trades)}]},
+            }]
+        }
+    }
+
+
+class QuoteServiceTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.service = QuoteService(get_quote_session(), IdentityCache(16, 60), 4)
+
+    def test_quote_while_the_market_is_open(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, json=chart(42.0, 400.0, 420.69))
+            quote = self.service.get_quote('gme')
+        self.assertEqual('GME', quote.symbol)
+        self.assertEqual('USD', quote.currency)
+        self.assertTrue(quote.market_open)
+        self.assertEqual(Decimal('420.69'), quote.price)
+
+    def test_quote_while_the_market_is_closed(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, json=chart(42.0))
+            quote = self.service.get_quote('GME')
+        self.assertFalse(quote.market_open)
+        self.assertEqual(Decimal('42.00'), quote.price)
+
+    def test_quotes_are_cached(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, json=chart(42.0, 420.69))
+            self.service.get_quote('GME')
+            quote = self.service.get_quote('gme')
+            self.assertEqual(1, len(rm.calls))
+        self.assertEqual(Decimal('420.69'), quote.price)
+
+    def test_unknown_symbols_have_no_quote(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, status=404)
+            self.assertIsNone(self.service.get_quote('GME'))
+
+    def test_failed_requests_have_no_quote(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, body=requests.ConnectTimeout())
+            self.assertIsNone(self.service.get_quote('GME'))
+
+    def test_requests_are_sent_with_a_timeout(self):
+        with patch.object(self.service.session, 'get') as get:
+            get.return_value.status_code = 404
+            self.service.get_quote('GME')
+        self.assertIsNotNone(get.call_args.kwargs['timeout'])
+
+    def test_fetching_many_quotes_at_once(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', GME, json=chart(42.0, 420.69))
+            rm.add('GET', TSLA, json=chart(42.0, 69.69))
+            rm.add('GET', BB, status=404)
+            self.service.get_quote('GME')
+            quotes = self.service.get_quotes(['GME', 'tsla', 'TSLA', 'BB'])
+            self.assertEqual(3, len(rm.calls))
+        self.assertEqual({'GME', 'TSLA'}, quotes.keys())
+        self.assertEqual(Decimal('69.69'), quotes['TSLA'].price)
+
+
+class StonkPlayerManagerTestCase(TestCase):
+
+    def setUp(self) -> None:
+        game = StonkGame.objects.create(channel_name='testing', starting_balance='100.00')
+        self.player = game.players.create(username='player', balance='100.00')
+
+    def balance(self) -> Decimal:
+        return StonkPlayer.objects.get(id=self.player.id).balance
+
+    def test_buying_adds_to_a_holding(self):
+        self.player.holdings.create(symbol='GME', amount=1)
+        self.assertEqual(Decimal('60.00'), StonkPlayer.objects.buy(self.player.id, 'GME', 2, Decimal('40.00')))
+        self.assertEqual(3, self.player.holdings.get(symbol='GME').amount)
+
+    def test_buying_without_enough_cash_changes_nothing(self):
+        self.assertIsNone(StonkPlayer.objects.buy(self.player.id, 'GME', 1, Decimal('100.01')))
+        self.assertEqual(Decimal('100.00'), self.balance())
+        self.assertFalse(StonkHolding.objects.exists())
+
+    def test_buying_with_exactly_enough_cash(self):
+        self.assertEqual(Decimal('0.00'), StonkPlayer.objects.buy(self.player.id, 'GME', 1, Decimal('100.00')))
+        self.assertEqual(1, self.player.holdings.get(symbol='GME').amount)
+
+    def test_selling_part_of_a_holding(self):
+        self.player.holdings.create(symbol='GME', amount=3)
+        self.assertEqual(Decimal('150.00'), StonkPlayer.objects.sell(self.player.id, 'GME', 2, Decimal('50.00')))
+        self.assertEqual(1, self.player.holdings.get(symbol='GME').amount)
+
+    def test_selling_all_of_a_holding_removes_it(self):
+        self.player.holdings.create(symbol='GME', amount=2)
+        self.assertEqual(Decimal('150.00'), StonkPlayer.objects.sell(self.player.id, 'GME', 2, Decimal('50.00')))
+        self.assertFalse(StonkHolding.objects.exists())
+
+    def test_selling_shares_you_do_not_have_changes_nothing(self):
+        self.player.holdings.create(symbol='GME', amount=1)
+        self.assertIsNone(StonkPlayer.objects.sell(self.player.id, 'GME', 2, Decimal('50.00')))
+        self.assertIsNone(StonkPlayer.objects.sell(self.player.id, 'TSLA', 1, Decimal('50.00')))
+        self.assertEqual(Decimal('100.00'), self.balance())
+        self.assertEqual(1, self.player.holdings.get(symbol='GME').amount)
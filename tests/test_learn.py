@@ -1,5 +1,6 @@
 from unittest import mock
 
+from frisky.bot import get_frisky
 from frisky.test import FriskyTestCase
 from learns.models import Learn
 from plugins.learn import LearnPlugin
@@ -25,6 +26,22 @@ class LearnTestCase(FriskyTestCase):
         self.send_message('?learn error Finally some good fucking coverage')
         self.assertEqual(self.send_message('?notinthere'), 'Finally some good fucking coverage')
 
+    def test_only_messages_a_plugin_would_answer_are_commands(self):
+        frisky = get_frisky()
+        self.assertFalse(frisky.is_command('hello'))
+        self.assertTrue(frisky.is_command('?learn'))
+        self.assertFalse(frisky.is_command('?notinthere'))
+        self.assertFalse(frisky.is_command('?notinthere some words'))
+        self.assertTrue(frisky.is_command('?notinthere 2'))
+        self.assertTrue(frisky.is_command('?<@W012A3CDE>'))
+        self.send_message('?learn NotInThere now it is')
+        self.assertTrue(frisky.is_command('?notinthere'))
+
+    def test_unknown_labels_are_commands_once_there_are_errors(self):
+        self.assertFalse(get_frisky().is_command('?notinthere'))
+        self.send_message('?learn error Finally some good fucking coverage')
+        self.assertTrue(get_frisky().is_command('?notinthere'))
+
     def test_dont_hurt_me(self):
         self.assertEqual(self.send_message('?learn thing ?test'), "DON'T HURT ME AGAIN")
 
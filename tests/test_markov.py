@@ -1,4 +1,8 @@
+from django.test import TestCase
+
 from frisky.test import FriskyTestCase
+from learns.markov import combine, get_markov_model, make_sentence
+from learns.models import Learn, MarkovModel, markov_cache
 
 
 class MarkovTestCase(FriskyTestCase):
@@ -38,3 +42,65 @@ class MarkovTestCase(FriskyTestCase):
         self.send_message('?learn lorem Proin nulla leo, facilisis et lectus id, mattis sollicitudin dui')
         self.send_message('?learn lorem Nullam id porttitor metus')
         self.send_message('?markov')
+
+
+class MarkovModelTestCase(TestCase):
+
+    def setUp(self) -> None:
+        Learn.objects.add('lorem', 'Lorem ipsum dolor sit amet')
+        Learn.objects.add('lorem', 'Donec tristique fermentum leo non vulputate')
+        Learn.objects.add('ipsum', 'Nunc ut tellus vitae lorem molestie convallis')
+
+    def test_models_are_cached_and_only_fetch_new_learns(self):
+        get_markov_model('lorem')
+        with self.assertNumQueries(1):
+            model = get_markov_model('LOREM')
+        self.assertEqual(2, len(model.sentences))
+
+    def test_new_learns_are_folded_in_incrementally(self):
+        model = get_markov_model('lorem')
+        Learn.objects.add('lorem', 'Aliquam in scelerisque risus')
+        learn = Learn.objects.get(content='Aliquam in scelerisque risus')
+
+        self.assertIs(model, get_markov_model('lorem'))
+        self.assertEqual(3, len(model.sentences))
+        self.assertEqual(learn.id, model.through_id)
+
+    def test_models_are_saved_and_reloaded(self):
+        with self.settings(MARKOV_SAVE_INTERVAL=1):
+            built = get_markov_model('lorem')
+        saved = MarkovModel.objects.get(label='lorem')
+        self.assertEqual(built.through_id, saved.through_id)
+
+        markov_cache.clear()
+        loaded = get_markov_model('lorem')
+        self.assertIsNot(built, loaded)
+        self.assertEqual(built.sentences, loaded.sentences)
+        self.assertEqual(built.chain, loaded.chain)
+
+    def test_deleting_a_learn_discards_saved_models(self):
+        with self.settings(MARKOV_SAVE_INTERVAL=1):
+            get_markov_model('lorem')
+            get_markov_model()
+        Learn.objects.filter(content='Lorem ipsum dolor sit amet').delete()
+
+        self.assertFalse(MarkovModel.objects.exists())
+        self.assertEqual(1, len(get_markov_model('lorem').sentences))
+
+    def test_relabelling_a_learn_discards_the_old_labels_models(self):
+        with self.settings(MARKOV_SAVE_INTERVAL=1):
+            get_markov_model('lorem')
+        learn = Learn.objects.get(content='Lorem ipsum dolor sit amet')
+        learn.label = 'ipsum'
+        learn.save()
+
+        self.assertFalse(MarkovModel.objects.filter(label='lorem').exists())
+        self.assertEqual(['Donec tristique fermentum leo non vulputate'],
+                         [' '.join(words) for words in get_markov_model('lorem').sentences])
+
+    def test_labels_are_combined_on_demand(self):
+        combined = combine([get_markov_model('lorem'), get_markov_model('ipsum')])
+        self.assertEqual(3, len(combined.parsed_sentences))
+
+    def test_no_learns_makes_no_sentence(self):
+        self.assertIsNone(make_sentence(['nothing']))
@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from frisky.bot import Frisky
+from frisky.bot import Frisky, get_frisky, get_plugin_registry
 from plugins.ping import PingPlugin
 
 
@@ -9,3 +9,25 @@ class PluginLoaderTestCase(TestCase):
         frisky = Frisky('frisky')
         ping = frisky.get_plugins_for_command('ping')[0]
         self.assertIsInstance(ping, PingPlugin)
+
+    def test_registry_is_shared_between_instances(self):
+        first = Frisky('frisky')
+        second = Frisky('other', prefix='!')
+        self.assertIs(first.registry, second.registry)
+        self.assertIs(get_plugin_registry(), first.registry)
+
+    def test_dispatch_tables_are_frozen(self):
+        registry = get_plugin_registry()
+        with self.assertRaises(TypeError):
+            registry.message_handlers['ping'] = ()
+        self.assertIsInstance(registry.message_handlers['ping'], tuple)
+
+    def test_get_frisky_returns_a_singleton(self):
+        self.assertIs(get_frisky(), get_frisky())
+
+    def test_get_frisky_follows_settings(self):
+        with self.settings(FRISKY_PREFIX='!'):
+            frisky = get_frisky()
+        self.assertEqual('!', frisky.prefix)
+        self.assertIsNot(frisky, get_frisky())
+        self.assertIs(frisky.registry, get_frisky().registry)
@@ -1,6 +1,12 @@
-from unittest import mock
+from collections import Counter
+from itertools import product
+from unittest import TestCase, mock
 
 from frisky.test import FriskyTestCase
+from plugins.roll.die_roll import DieRoll
+from plugins.roll.distribution import dice_sum
+from plugins.roll.expression import Dice, DiceExpression, DiceExpressionError, parse_expression
+from plugins.roll.sampling import BATCH_SIZE, bulk_roll
 
 
 class RollTestCase(FriskyTestCase):
@@ -49,6 +55,10 @@ class RollTestCase(FriskyTestCase):
 
     def test_big_numbers(self):
         self.assertRegex(self.send_message('?roll 1000000d10000'),
+                         '^dummyuser rolled [0-9]+ on [0-9]+d[0-9]+ with a chance of [0-9.e-]+%ish$')
+
+    def test_bigger_numbers(self):
+        self.assertRegex(self.send_message('?roll 10000000d10000'),
                          '^dummyuser rolled [0-9]+ USING MATH on [0-9]+d[0-9]+ with a chance of [0-9.e-]+%ish$')
 
     def test_bad_big_numbers(self):
@@ -68,12 +78,12 @@ class RollTestCase(FriskyTestCase):
         patcher.stop()
         self.assertEqual('dummyuser rolled 41 on 2d20+1', result)
 
-    def test_reasonable_estimation(self):
+    def test_exact_odds_for_many_dice(self):
         patcher = mock.patch(target='plugins.roll.die_roll.randint', new=lambda *a, **k: 4)
         patcher.start()
         result = self.send_message('?roll 10d6')
         patcher.stop()
-        self.assertEqual('dummyuser rolled 40 on 10d6 with a chance of 4.81%ish', result)
+        self.assertEqual('dummyuser rolled 40 on 10d6 with a chance of 4.85%', result)
 
     def test_slowest_possible(self):
         patcher = mock.patch(target='plugins.roll.die_roll.randint', new=lambda *a, **k: 50)
@@ -88,8 +98,15 @@ class RollTestCase(FriskyTestCase):
         patcher.start()
         result = self.send_message('?roll 100d100')
         patcher.stop()
-        # I mean, this is wrong - the estimator gets bad values close to the extremes
-        self.assertEqual('dummyuser rolled CRITICAL 10000 on 100d100 with a chance of 0%ish', result)
+        # The odds are exact, they're just too small to show
+        self.assertEqual('dummyuser rolled CRITICAL 10000 on 100d100 with a chance of 0%', result)
+
+    def test_estimation_past_the_exact_limit(self):
+        patcher = mock.patch(target='plugins.roll.die_roll.randint', new=lambda *a, **k: 3)
+        patcher.start()
+        result = self.send_message('?roll 1000d6')
+        patcher.stop()
+        self.assertRegex(result, '^dummyuser rolled 3000 on 1000d6 with a chance of [0-9.]+%ish$')
 
 
     def test_critical_fail(self):
@@ -103,6 +120,127 @@ class RollTestCase(FriskyTestCase):
         result = self.send_message('?roll 0d10')
         self.assertEqual('dummyuser rolled CRITICAL 0 on 0d10 with a chance of 100%', result)
 
+    def test_keep_highest(self):
+        rolls = iter([1, 5, 3, 6])
+        with mock.patch('plugins.roll.expression.randint', new=lambda *a, **k: next(rolls)):
+            result = self.send_message('?roll 4d6kh3')
+        self.assertEqual('dummyuser rolled 14 on 4d6kh3', result)
+
+    def test_compound_rolls(self):
+        with mock.patch('plugins.roll.die_roll.randint', new=lambda a, b: b):
+            result = self.send_message('?roll 2d20+1d4+3 1d6')
+        self.assertEqual('dummyuser rolled 47 on 2d20+1d4+3, CRITICAL 6 on 1d6 with a chance of 16.67% '
+                         'for a total of 53', result)
+
+    def test_repeated_rolls(self):
+        with mock.patch('plugins.roll.die_roll.randint', new=lambda *a, **k: 3):
+            result = self.send_message('?roll 6x 4d6')
+        self.assertEqual('dummyuser rolled 12, 12, 12, 12, 12, 12 on 6x4d6', result)
+
+    def test_dice_are_budgeted_across_the_whole_message(self):
+        result = self.send_message('?roll 600000d6 600000d6')
+        self.assertEqual('Damn it Jim, stop trying to break things.', result)
+
     def test_damnit_jim(self):
         result = self.send_message('?roll 999999999999999999999999999999999999999999d9999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999')
         self.assertEqual('Damn it Jim, stop trying to break things.', result)
+
+
+class DiceSumTestCase(TestCase):
+
+    def test_matches_every_possible_roll(self):
+        for dice, sides in [(1, 6), (2, 6), (3, 4), (4, 5)]:
+            counts = Counter(sum(roll) for roll in product(range(1, sides + 1), repeat=dice))
+            distribution = dice_sum(dice, sides)
+            for r in range(dice - 1, dice * sides + 2):
+                self.assertEqual(counts[r], distribution.ways(r))
+                self.assertEqual(sum(counts[i] for i in counts if i <= r), distribution.ways_at_most(r))
+
+    def test_cdf(self):
+        distribution = dice_sum(2, 6)
+        self.assertEqual(0.0, distribution.cdf(1.5))
+        self.assertAlmostEqual(1 / 36, distribution.cdf(2.9))
+        self.assertAlmostEqual(0.5833333333, distribution.cdf(7))
+        self.assertEqual(1.0, distribution.cdf(12))
+
+    def test_hundreds_of_dice(self):
+        distribution = dice_sum(300, 6)
+        self.assertEqual(1 / 6 ** 300, distribution.probability_eq(300))
+        self.assertEqual(300 / 6 ** 300, distribution.probability_eq(301))
+        self.assertEqual(1 / 6 ** 300, distribution.probability_eq(1800))
+        self.assertEqual(distribution.ways(900), distribution.ways(300 * 7 - 900))
+        # The sum is symmetric about its mean, 1050
+        self.assertAlmostEqual(0.5, distribution.cdf(1050) - distribution.probability_eq(1050) / 2)
+
+    def test_huge_dice_are_estimated(self):
+        self.assertTrue(DieRoll(dice=500, sides=200).has_exact_odds())
+        self.assertFalse(DieRoll(dice=500, sides=201).has_exact_odds())
+        self.assertFalse(DieRoll(dice=2, sides=10 ** 50).has_exact_odds())
+
+    def test_distributions_are_cached(self):
+        self.assertIs(dice_sum(10, 6), dice_sum(10, 6))
+
+
+class BulkRollTestCase(TestCase):
+
+    def test_rolls_every_die(self):
+        with mock.patch('plugins.roll.sampling.choices', new=lambda faces, k: [faces[-1]] * k):
+            self.assertEqual(6 * (BATCH_SIZE * 2 + 5), bulk_roll(BATCH_SIZE * 2 + 5, 6))
+
+    def test_totals_are_in_range(self):
+        for dice, sides in [(1, 1), (1, 6), (1001, 2), (BATCH_SIZE + 1, 20)]:
+            total = bulk_roll(dice, sides)
+            self.assertGreaterEqual(total, dice)
+            self.assertLessEqual(total, dice * sides)
+
+    def test_large_rolls_are_rolled_in_bulk(self):
+        roll = DieRoll(dice=5000, sides=6, modifier=3)
+        with mock.patch('plugins.roll.die_roll.bulk_roll', return_value=17500) as bulk:
+            result = roll.roll()
+        bulk.assert_called_once_with(5000, 6)
+        self.assertEqual(17503, result.result)
+        self.assertFalse(result.used_probability)
+
+
+class DiceExpressionTestCase(TestCase):
+
+    def test_parsing(self):
+        self.assertEqual(DiceExpression(terms=((1, Dice(2, 20)), (1, Dice(1, 4)), (1, 3))),
+                         parse_expression('2d20+1d4+3'))
+        self.assertEqual(DiceExpression(terms=((1, Dice(4, 6, keep='h', kept=3)),), repeat=6, stats=False),
+                         parse_expression('6x4d6kh3q'))
+        self.assertEqual(DiceExpression(terms=((1, Dice(4, 6, keep='l', kept=1)), (-1, Dice(1, 6, explode=True)))),
+                         parse_expression('4D6kl1-d6!'))
+        self.assertEqual(Dice(4, 6, keep='h', kept=3), parse_expression('4d6k3').terms[0][1])
+
+    def test_parsed_expressions_are_cached(self):
+        self.assertIs(parse_expression('3d8+2'), parse_expression('3d8+2'))
+
+    def test_invalid_expressions(self):
+        for text in ['potato', '5', 'd', '1d6+', '1d6x', '11000d-10000', '3d0', '2d1!', '0x1d6', '101x1d6',
+                     '2000d6kh1', '10000000d6+1d4', '10x1000000d6', '2x500001d6', '1000000d6+1d6',
+                     '+'.join(['1d6'] * 21)]:
+            with self.assertRaises(DiceExpressionError, msg=text):
+                parse_expression(text)
+
+    def test_rolled_dice_count_every_repeat_and_term(self):
+        self.assertEqual(60, parse_expression('6x4d6+6d8').rolled_dice)
+        self.assertEqual(1000000, parse_expression('1000000d6').rolled_dice)
+        self.assertEqual(0, parse_expression('10000000d6').rolled_dice)
+        self.assertEqual(1000000, parse_expression('2x500000d6').rolled_dice)
+
+    def test_plain_rolls_are_die_rolls(self):
+        self.assertEqual(DieRoll(dice=2, sides=20, modifier=-2), parse_expression('2d20+1-3').as_die_roll())
+        self.assertIsNone(parse_expression('4d6kh3').as_die_roll())
+        self.assertIsNone(parse_expression('2x1d6').as_die_roll())
+        self.assertIsNone(parse_expression('1d6+1d4').as_die_roll())
+
+    def test_exploding_dice(self):
+        rolls = iter([6, 6, 2, 3])
+        with mock.patch('plugins.roll.expression.randint', new=lambda *a, **k: next(rolls)):
+            self.assertEqual([14, 3], parse_expression('2d6!').terms[0][1].roll_each())
+
+    def test_keep_lowest(self):
+        rolls = iter([4, 1, 6])
+        with mock.patch('plugins.roll.expression.randint', new=lambda *a, **k: next(rolls)):
+            self.assertEqual([1], parse_expression('3d6kl1').evaluate())
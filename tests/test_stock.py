@@ -97,6 +97,20 @@ class StockTestCase(FriskyTestCase):
             reply = self.send_message('?stock TEST')
             self.assertEqual(reply, ':chart_with_downwards_trend:  TEST last traded at $13.37 (-$28.63 -68.17%)')
 
+    def test_quotes_are_cached_between_messages(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', StockTestCase.URL, body=positive_change)
+            self.send_message('?stock TEST')
+            reply = self.send_message('?stonk TEST')
+            self.assertEqual(1, len(rm.calls))
+        self.assertEqual(reply, ':chart_with_upwards_trend:  TEST last traded at $69.69 ($27.69 65.93%)')
+
+    def test_unknown_symbol(self):
+        with responses.RequestsMock() as rm:
+            rm.add('GET', StockTestCase.URL, status=404)
+            reply = self.send_message('?stock TEST')
+        self.assertIsNone(reply)
+
     def test_no_args_returns_the_help_text(self):
         reply = self.send_message('?stock')
         self.assertEqual(reply, 'Usage: ?stock $SYMBOL')
@@ -1,10 +1,14 @@
 from decimal import Decimal
+from unittest.mock import patch
 
 import responses
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from frisky.responses import Image
 from frisky.test import FriskyTestCase
 from plugins.stonkgame import StonkGamePlugin
+from stonkgame.quotes import Quote
 from stonkgame.models import StonkGame, StonkHolding, StonkPlayer
 from .test_stock import positive_change, market_closed, negative_change
 
@@ -266,6 +270,19 @@ class StonkGameTestCase(FriskyTestCase):
             result = self.send_message('?sg portfolio', user='player')
         self.assertEqual(portfolio, result)
 
+    def test_portfolio_with_an_unknown_stock(self):
+        game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
+        player = game.players.create(username='player', balance='1000.00')
+        player.holdings.create(symbol='GME', amount=1)
+        player.holdings.create(symbol='BB', amount=4)
+        gme = 'https://query1.finance.yahoo.com/v8/finance/chart/GME'
+        bb = 'https://query1.finance.yahoo.com/v8/finance/chart/BB'
+        with responses.RequestsMock() as rm:
+            rm.add('GET', gme, body=stock_response)
+            rm.add('GET', bb, status=404)
+            result = self.send_message('?sg portfolio', user='player')
+        self.assertEqual("I don't have any information for BB", result)
+
     def test_api_error(self):
         game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
         game.players.create(username='player', balance='1000.00')
@@ -350,6 +367,53 @@ class StonkGameTestCase(FriskyTestCase):
             result = self.send_message('?sg leaderboard')
         self.assertEqual(leaderboard, result)
 
+    def test_leaderboard_queries_do_not_grow_with_players(self):
+        game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
+        for i in range(5):
+            player = game.players.create(username=f'player{i}', balance='100.00')
+            player.holdings.create(symbol='GME', amount=i)
+            player.holdings.create(symbol='TSLA', amount=1)
+        gme = 'https://query1.finance.yahoo.com/v8/finance/chart/GME'
+        tsla = 'https://query1.finance.yahoo.com/v8/finance/chart/TSLA'
+        with responses.RequestsMock() as rm, CaptureQueriesContext(connection) as queries:
+            rm.add('GET', gme, body=stock_response)
+            rm.add('GET', tsla, body=positive_change)
+            result = self.send_message('?sg leaderboard')
+            self.assertEqual(2, len(rm.calls))
+        stonk_queries = [query for query in queries.captured_queries if 'stonkgame_' in query['sql']]
+        self.assertEqual(3, len(stonk_queries))
+        self.assertTrue(result.startswith('Leaderboard for the #testing game:\nplayer4, with $1852.45'))
+
+    def test_portfolio_queries_do_not_grow_with_holdings(self):
+        game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
+        player = game.players.create(username='player', balance='1000.00')
+        for symbol in ('GME', 'TSLA', 'BB'):
+            player.holdings.create(symbol=symbol, amount=1)
+        with patch('plugins.stonkgame.get_quote_service') as get_quote_service, \
+                CaptureQueriesContext(connection) as queries:
+            get_quote_service.return_value.get_quotes.side_effect = lambda symbols: {
+                symbol: Quote(symbol, 'USD', 1.0, 2.0) for symbol in symbols
+            }
+            result = self.send_message('?sg portfolio', user='player')
+        stonk_queries = [query for query in queries.captured_queries if 'stonkgame_' in query['sql']]
+        self.assertEqual(3, len(stonk_queries))
+        self.assertTrue(result.endswith('Total portfolio value: 6.00. Cash on hand: 1000.00'))
+
+    def test_trading_invalidates_the_leaderboard(self):
+        game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
+        game.players.create(username='player', balance='1000.00')
+        gme = 'https://query1.finance.yahoo.com/v8/finance/chart/GME'
+        self.assertEqual('Leaderboard for the #testing game:\nplayer, with $1000.00',
+                         self.send_message('?sg leaderboard'))
+        with responses.RequestsMock() as rm:
+            rm.add('GET', gme, body=stock_response)
+            self.send_message('?sg buy GME 1', user='player')
+            self.assertEqual('Leaderboard for the #testing game:\nplayer, with $1000.00',
+                             self.send_message('?sg leaderboard'))
+        self.send_message('?sg join', user='player2')
+        self.assertEqual('Leaderboard for the #testing game:\nplayer, with $1000.00\nplayer2, with $1000.00',
+                         self.send_message('?sg leaderboard'))
+
     def test_saying_bankruptcy(self):
         game = StonkGame.objects.create(channel_name='testing', starting_balance='1000.00')
         game.players.create(username='player', balance='69.00')
@@ -2,7 +2,7 @@ from datetime import date
 from unittest.mock import patch
 
 from frisky.test import FriskyTestCase
-from votes.models import Vote
+from votes.models import Vote, PeriodVote
 
 
 class VoteTestCase(FriskyTestCase):
@@ -102,6 +102,33 @@ class VoteTestCase(FriskyTestCase):
                          'foo: 3\n'
                          'bar: 1', response)
 
+    def test_leaderboard_for_this_month(self):
+        self.send_message('?++ foo')
+        self.send_message('?++ foo')
+        self.send_message('?++ bar')
+        Vote.objects.create(label='old', votes=10)
+        with patch('plugins.votes.date') as mock_date:
+            mock_date.today.return_value = date.today()
+            mock_date.side_effect = lambda *args, **kw: date(*args, **kw)
+            response = self.send_message('?leaderboard month')
+        self.assertEqual(f'*Upvote Leaderboard for {date.today():%B %Y}*\n'
+                         'foo: 2\n'
+                         'bar: 1', response)
+
+    def test_leaderboard_for_the_latest_festive_season(self):
+        PeriodVote.objects.create(period='2020-10', label='spooky', votes=3)
+        PeriodVote.objects.create(period='2021-10', label='spookier', votes=4)
+        with patch('plugins.votes.date') as mock_date:
+            mock_date.today.return_value = date(2021, 3, 7)
+            mock_date.side_effect = lambda *args, **kw: date(*args, **kw)
+            response = self.send_message('?leaderboard halloween')
+        self.assertEqual('*Upvote Leaderboard for October 2020*\nspooky: 3', response)
+
+    def test_leaderboard_for_an_unknown_period(self):
+        Vote.objects.create(label='foo', votes=3)
+        response = self.send_message('?leaderboard someday')
+        self.assertEqual('*Upvote Leaderboard*\nfoo: 3', response)
+
     def test_voting_across_channels_in_a_workspace(self):
         self.send_reaction('upvote', 'user_a', 'user_b', channel='channel1')
         self.send_reaction('upvote', 'user_a', 'user_b', channel='channel2')
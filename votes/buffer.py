@@ -0,0 +1,154 @@
+import atexit
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from frisky.cache import IdentityCache
+from frisky.db import closing_db_connections
+from votes.models import Vote
+
+logger = logging.getLogger(__name__)
+
+
+# How many labels the buffer remembers the stored votes of, and for how long (in seconds), so votes for them can be
+# counted without reading them back. Votes written by other processes show up once a label's stored votes expire.
+KNOWN_VOTES_SIZE = 1024
+KNOWN_VOTES_TTL = 60
+
+
+class VoteBuffer(object):
+    """
+    Coalesces votes per label in memory and writes them in batches, so a burst of votes for one label becomes a single
+    UPDATE instead of one per vote. Votes are written every flush_interval seconds, or sooner once max_pending labels
+    are waiting. Votes still buffered when the process dies without exiting cleanly are lost.
+
+    The stored votes of recently voted labels are remembered too, so a burst of votes doesn't read the label back from
+    the database for every vote either.
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.__pending: Dict[str, int] = {}
+        # Votes taken out of pending by the flush in progress, which aren't in the database yet
+        self.__flushing: Dict[str, int] = {}
+        self.__stored = IdentityCache(KNOWN_VOTES_SIZE, KNOWN_VOTES_TTL)
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        # Counts flushes starting and finishing, so it is odd while a flush is writing
+        self.__flushes = 0
+        self.__wakeup = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def pending(self, label: str) -> int:
+        with self.__lock:
+            return self.__pending.get(label, 0)
+
+    def __load_stored(self, label: str) -> None:
+        """
+        Read the stored votes for label, unless they are already known
+        """
+        while True:
+            with self.__lock:
+                if self.__stored.get(label) is not None:
+                    return
+                flushes = self.__flushes
+            if flushes % 2 == 1:
+                # A flush is writing votes for labels that may be read back with or without them, so wait for it
+                with self.__flush_lock:
+                    continue
+            votes = Vote.objects.filter(label=label).values_list('votes', flat=True).first() or 0
+            with self.__lock:
+                # Only trust the read if no flush started while it was being made
+                if self.__flushes == flushes:
+                    if self.__stored.get(label) is None:
+                        self.__stored.set(label, votes)
+                    return
+
+    def __count(self, label: str, delta: int) -> Vote:
+        while True:
+            self.__load_stored(label)
+            with self.__lock:
+                stored = self.__stored.get(label)
+                if stored is None:
+                    # Expired or evicted since it was loaded
+                    continue
+                pending = self.__pending.get(label, 0) + delta
+                if delta != 0:
+                    self.__pending[label] = pending
+                waiting = len(self.__pending)
+                votes = stored + self.__flushing.get(label, 0) + pending
+                break
+        if waiting >= self.max_pending:
+            self.__wakeup.set()
+        return Vote(label=label, votes=votes)
+
+    def add(self, label: str, delta: int) -> Vote:
+        """
+        :return: the record for label, with its votes including everything still buffered
+        """
+        self.__start()
+        return self.__count(label, delta)
+
+    def record(self, label: str) -> Vote:
+        """
+        :return: the record for label, with its votes including everything still buffered
+        """
+        return self.__count(label, 0)
+
+    def flush(self) -> int:
+        """
+        Write every buffered vote to the database
+        :return: the number of labels written
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                pending, self.__pending = self.__pending, {}
+                self.__flushing = dict(pending)
+                self.__flushes += 1
+            written = 0
+            try:
+                for label, delta in pending.items():
+                    if delta == 0:
+                        continue
+                    try:
+                        record = Vote.objects.apply_votes(label, delta)
+                        with self.__lock:
+                            self.__stored.set(label, record.votes)
+                            del self.__flushing[label]
+                        written += 1
+                    except Exception as err:
+                        logger.error(f'Unable to write {delta} votes for {label}, will retry', exc_info=err)
+                        with self.__lock:
+                            self.__pending[label] = self.__pending.get(label, 0) + delta
+                            del self.__flushing[label]
+            finally:
+                with self.__lock:
+                    self.__flushing = {}
+                    self.__flushes += 1
+            return written
+
+    def __start(self) -> None:
+        if self.__thread is not None:
+            return
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='frisky-vote-buffer', daemon=True)
+                self.__thread.start()
+
+    def __run(self) -> None:
+        while True:
+            self.__wakeup.wait(self.flush_interval)
+            self.__wakeup.clear()
+            closing_db_connections(self.flush)()
+
+
+@lru_cache(maxsize=None)
+def get_vote_buffer() -> VoteBuffer:
+    buffer = VoteBuffer(settings.VOTE_BUFFER_FLUSH_INTERVAL, settings.VOTE_BUFFER_MAX_PENDING)
+    # Write out whatever is still buffered when the process exits gracefully
+    atexit.register(buffer.flush)
+    return buffer
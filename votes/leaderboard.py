@@ -0,0 +1,40 @@
+from datetime import date
+from typing import Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+LEADERBOARD_SIZE = 10
+
+# The period the all time leaderboard is kept under, the others are calendar months
+ALL_TIME = 'all-time'
+
+Leaderboard = List[Tuple[str, int]]
+
+
+def period_for(day: Optional[date] = None) -> str:
+    day = day or date.today()
+    return f'{day.year:04}-{day.month:02}'
+
+
+def _snapshot_key(period: str) -> str:
+    return f'votes-leaderboard:{period}'
+
+
+def get_snapshot(period: str, loader: Callable[[], Leaderboard]) -> Leaderboard:
+    """
+    :return: the cached top LEADERBOARD_SIZE labels and their votes for period, loading them if they aren't cached
+    """
+    snapshot = cache.get(_snapshot_key(period))
+    if snapshot is None:
+        snapshot = loader()
+        cache.set(_snapshot_key(period), snapshot, timeout=settings.VOTE_LEADERBOARD_TTL)
+    return snapshot
+
+
+def invalidate_snapshots(*periods: str) -> None:
+    """
+    Drop the cached snapshots for periods, in a single round trip, so they are reloaded the next time they are read.
+    A snapshot loaded concurrently with a vote can still be cached without it, until it expires.
+    """
+    cache.delete_many([_snapshot_key(period) for period in periods])
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.4 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7)),
+                ('label', models.CharField(max_length=200)),
+                ('votes', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='votes',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='periodvote',
+            index=models.Index(fields=['period', '-votes'], name='votes_period_leaderboard'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodvote',
+            constraint=models.UniqueConstraint(fields=('period', 'label'), name='votes_periodvote_unique_period_label'),
+        ),
+    ]
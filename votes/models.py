@@ -1,31 +1,157 @@
-from django.db import models
+import sqlite3
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from votes.leaderboard import ALL_TIME, LEADERBOARD_SIZE, Leaderboard, get_snapshot, invalidate_snapshots, period_for
+
+
+def _can_return_from_update(connection) -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _increment(manager: models.Manager, delta: int, **lookup) -> Optional[models.Model]:
+    """
+    Atomically add delta to the votes of the row matching lookup
+    :return: the updated row, or None if there was no row to update
+    """
+    connection = connections[manager.db]
+    if _can_return_from_update(connection):
+        table = connection.ops.quote_name(manager.model._meta.db_table)
+        where = ' AND '.join(f'{connection.ops.quote_name(column)} = %s' for column in lookup.keys())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET votes = votes + %s WHERE {where} RETURNING id, votes',
+                [delta, *lookup.values()]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return manager.model(id=row[0], votes=row[1], **lookup)
+    with transaction.atomic(using=manager.db):
+        if manager.filter(**lookup).update(votes=F('votes') + delta) == 0:
+            return None
+        return manager.get(**lookup)
+
+
+def _add_votes(manager: models.Manager, delta: int, **lookup) -> models.Model:
+    """
+    Atomically add delta to the votes of the row matching lookup, creating it if needed
+    """
+    record = _increment(manager, delta, **lookup)
+    if record is not None:
+        return record
+    try:
+        with transaction.atomic(using=manager.db):
+            return manager.create(votes=delta, **lookup)
+    except IntegrityError:
+        # Someone else created the row first, so there is now a row to update
+        return _increment(manager, delta, **lookup)
 
 
 class VoteManager(models.Manager):
 
     def get_record(self, label):
         label = label.lstrip('@')
+        if settings.ENABLE_VOTE_BUFFER:
+            from votes.buffer import get_vote_buffer
+            return get_vote_buffer().record(label)
         obj, created = self.get_queryset().get_or_create(label=label)
         return obj
 
     def upvote(self, label):
-        record = self.get_record(label)
-        record.votes += 1
-        record.save()
-        return record
+        return self.add_votes(label, 1)
 
     def downvote(self, label):
-        record = self.get_record(label)
-        record.votes -= 1
-        record.save()
+        return self.add_votes(label, -1)
+
+    def add_votes(self, label: str, delta: int) -> 'Vote':
+        """
+        Add delta to the votes for label, either straight away or, when the vote buffer is enabled, at its next flush
+        :return: the record for label, with its votes as of this change
+        """
+        label = label.lstrip('@')
+        if settings.ENABLE_VOTE_BUFFER:
+            from votes.buffer import get_vote_buffer
+            return get_vote_buffer().add(label, delta)
+        return self.apply_votes(label, delta)
+
+    def apply_votes(self, label: str, delta: int) -> 'Vote':
+        """
+        Atomically add delta to the votes for label in the database, both all time and for the current month, and
+        drop the cached leaderboards they change
+        """
+        record = _add_votes(self, delta, label=label)
+        period = period_for()
+        _add_votes(PeriodVote.objects, delta, period=period, label=label)
+        invalidate_snapshots(ALL_TIME, period)
         return record
 
+    def leaderboard(self) -> Leaderboard:
+        return get_snapshot(
+            ALL_TIME,
+            lambda: list(self.get_queryset().order_by('-votes', 'label').values_list('label', 'votes')[:LEADERBOARD_SIZE])
+        )
+
 
 class Vote(models.Model):
     label = models.CharField(max_length=200, db_index=True, unique=True)
-    votes = models.IntegerField(default=0)
+    votes = models.IntegerField(default=0, db_index=True)
 
     objects = VoteManager()
 
     def __str__(self):
         return f'Votes for {self.label}'
+
+
+class PeriodVoteManager(models.Manager):
+
+    def leaderboard(self, period: str) -> Leaderboard:
+        return get_snapshot(
+            period,
+            lambda: list(
+                self.get_queryset().filter(period=period).order_by('-votes', 'label')
+                    .values_list('label', 'votes')[:LEADERBOARD_SIZE]
+            )
+        )
+
+
+class PeriodVote(models.Model):
+    """
+    The votes a label received during one calendar month, so leaderboards for a month don't scan every vote
+    """
+    period = models.CharField(max_length=7)
+    label = models.CharField(max_length=200)
+    votes = models.IntegerField(default=0)
+
+    objects = PeriodVoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'label'], name='votes_periodvote_unique_period_label'),
+        ]
+        indexes = [
+            models.Index(fields=['period', '-votes'], name='votes_period_leaderboard'),
+        ]
+
+    def __str__(self):
+        return f'Votes for {self.label} in {self.period}'
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def invalidate_vote_leaderboard(sender, instance: Vote, **kwargs):
+    # Votes are normally counted with plain updates, which invalidate the leaderboard themselves
+    invalidate_snapshots(ALL_TIME)
+
+
+@receiver(post_save, sender=PeriodVote)
+@receiver(post_delete, sender=PeriodVote)
+def invalidate_period_vote_leaderboard(sender, instance: PeriodVote, **kwargs):
+    invalidate_snapshots(instance.period)
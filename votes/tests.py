@@ -1 +1,168 @@
-# Create your tests here.
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from votes.buffer import VoteBuffer
+from votes.leaderboard import ALL_TIME, LEADERBOARD_SIZE, period_for
+from votes.models import Vote, PeriodVote, _can_return_from_update
+
+
+class VoteManagerTestCase(TestCase):
+
+    def test_first_vote_creates_the_record(self):
+        record = Vote.objects.upvote('@foo')
+        self.assertEqual('foo', record.label)
+        self.assertEqual(1, Vote.objects.get(label='foo').votes)
+
+    @skipUnless(_can_return_from_update(connection), 'needs UPDATE ... RETURNING')
+    def test_votes_are_a_single_atomic_update(self):
+        Vote.objects.upvote('foo')
+        with CaptureQueriesContext(connection) as queries:
+            record = Vote.objects.downvote('foo')
+        statements = [query['sql'] for query in queries.captured_queries]
+        # One update each for the all time and monthly totals, and one delete of both cached leaderboards
+        self.assertEqual(3, len(statements))
+        self.assertTrue(statements[0].startswith('UPDATE "votes_vote"'))
+        self.assertTrue(statements[1].startswith('UPDATE "votes_periodvote"'))
+        self.assertTrue(statements[2].startswith('DELETE'))
+        self.assertEqual(0, record.votes)
+        self.assertEqual(0, Vote.objects.get(label='foo').votes)
+
+
+class VoteBufferTestCase(TestCase):
+
+    def setUp(self) -> None:
+        # Long enough that the background thread never flushes during a test
+        self.buffer = VoteBuffer(flush_interval=3600, max_pending=1000)
+
+    def test_votes_are_coalesced_until_flushed(self):
+        for _ in range(3):
+            record = self.buffer.add('foo', 1)
+        self.buffer.add('bar', -1)
+
+        self.assertEqual(3, record.votes)
+        self.assertFalse(Vote.objects.exists())
+
+        self.assertEqual(2, self.buffer.flush())
+        self.assertEqual(3, Vote.objects.get(label='foo').votes)
+        self.assertEqual(-1, Vote.objects.get(label='bar').votes)
+        self.assertEqual(0, self.buffer.pending('foo'))
+
+    def test_buffered_votes_are_included_in_records(self):
+        Vote.objects.upvote('foo')
+        with self.settings(ENABLE_VOTE_BUFFER=True), \
+                mock.patch('votes.buffer.get_vote_buffer', return_value=self.buffer):
+            self.assertEqual(2, Vote.objects.upvote('foo').votes)
+            self.assertEqual(2, Vote.objects.get_record('foo').votes)
+        self.assertEqual(1, Vote.objects.get(label='foo').votes)
+
+    def test_a_burst_of_votes_reads_the_label_once(self):
+        Vote.objects.upvote('foo')
+        with self.assertNumQueries(1):
+            for _ in range(5):
+                record = self.buffer.add('foo', 1)
+        self.assertEqual(6, record.votes)
+
+    def test_votes_are_counted_once_while_they_are_being_flushed(self):
+        self.buffer.add('foo', 1)
+        apply_votes = Vote.objects.apply_votes
+        during_flush = []
+
+        def apply_and_count(label, delta):
+            during_flush.append(self.buffer.record(label).votes)
+            record = apply_votes(label, delta)
+            during_flush.append(self.buffer.record(label).votes)
+            return record
+
+        with mock.patch.object(Vote.objects, 'apply_votes', side_effect=apply_and_count):
+            self.buffer.flush()
+
+        self.assertEqual([1, 1], during_flush)
+        with self.assertNumQueries(0):
+            self.assertEqual(1, self.buffer.record('foo').votes)
+
+    @mock.patch('votes.buffer.KNOWN_VOTES_SIZE', 1)
+    def test_a_flush_during_the_lookup_is_not_counted_twice(self):
+        buffer = VoteBuffer(flush_interval=3600, max_pending=1000)
+        buffer.add('foo', 1)
+        # Forget the stored votes for foo, so the next vote has to read them
+        buffer.add('bar', 0)
+        lookup = Vote.objects.filter
+        flushed = []
+
+        def flush_then_lookup(**kwargs):
+            # The lookup happens outside the flush lock, so a flush can get in first
+            if not flushed:
+                flushed.append(buffer.flush())
+            return lookup(**kwargs)
+
+        with mock.patch.object(Vote.objects, 'filter', side_effect=flush_then_lookup):
+            record = buffer.add('foo', 1)
+
+        self.assertEqual([1], flushed)
+        self.assertEqual(2, record.votes)
+        self.assertEqual(1, buffer.pending('foo'))
+        self.assertEqual(1, Vote.objects.get(label='foo').votes)
+
+    def test_failed_writes_stay_buffered(self):
+        self.buffer.add('foo', 2)
+        with mock.patch.object(Vote.objects, 'apply_votes', side_effect=RuntimeError('whoopsie')):
+            self.assertEqual(0, self.buffer.flush())
+        self.assertEqual(2, self.buffer.pending('foo'))
+
+
+class LeaderboardTestCase(TestCase):
+
+    def setUp(self) -> None:
+        for i in range(LEADERBOARD_SIZE + 2):
+            Vote.objects.add_votes(f'label{i:02}', i)
+
+    def test_leaderboard_is_ranked_and_capped(self):
+        leaderboard = Vote.objects.leaderboard()
+        self.assertEqual(LEADERBOARD_SIZE, len(leaderboard))
+        self.assertEqual(('label11', 11), leaderboard[0])
+        self.assertEqual(('label02', 2), leaderboard[-1])
+
+    def test_cached_leaderboard_is_read_in_one_query(self):
+        Vote.objects.leaderboard()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(('label11', 11), Vote.objects.leaderboard()[0])
+
+    def test_votes_invalidate_the_cached_leaderboard(self):
+        Vote.objects.leaderboard()
+        PeriodVote.objects.leaderboard(period_for())
+        Vote.objects.add_votes('label00', 20)
+        Vote.objects.add_votes('label05', 1)
+
+        leaderboard = Vote.objects.leaderboard()
+        self.assertEqual(('label00', 20), leaderboard[0])
+        self.assertIn(('label05', 6), leaderboard)
+        self.assertEqual(leaderboard, list(Vote.objects.order_by('-votes', 'label')
+                                           .values_list('label', 'votes')[:LEADERBOARD_SIZE]))
+        self.assertEqual(('label00', 20), PeriodVote.objects.leaderboard(period_for())[0])
+
+    def test_label_falling_off_the_bottom_reloads_the_leaderboard(self):
+        Vote.objects.leaderboard()
+        Vote.objects.add_votes('label02', -2)
+
+        leaderboard = Vote.objects.leaderboard()
+        self.assertEqual(('label01', 1), leaderboard[-1])
+
+    def test_votes_are_also_counted_for_the_current_month(self):
+        Vote.objects.add_votes('label00', 5)
+        period = period_for()
+
+        self.assertEqual(5, PeriodVote.objects.get(period=period, label='label00').votes)
+        self.assertEqual(('label11', 11), PeriodVote.objects.leaderboard(period)[0])
+        self.assertEqual([], PeriodVote.objects.leaderboard('1999-01'))
+
+    def test_admin_edits_invalidate_the_leaderboard(self):
+        Vote.objects.leaderboard()
+        Vote.objects.filter(label='label03').update(votes=100)
+        Vote.objects.get(label='label03').save()
+
+        self.assertEqual(('label03', 100), Vote.objects.leaderboard()[0])
+        self.assertNotEqual(ALL_TIME, period_for())